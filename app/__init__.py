@@ -4,18 +4,11 @@ A modern tool for embedding files into images securely
 """
 
 import logging
-import sys
 
-# Configure root logger for the entire application
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('empy.log')
-    ]
-)
+from .log_config import configure_logging
+
+# Route every log record of the application through the logging queue
+configure_logging()
 
 # Reduce noise from other libraries
 logging.getLogger('PIL').setLevel(logging.WARNING)
@@ -24,4 +17,4 @@ logging.getLogger('fastapi').setLevel(logging.WARNING)
 
 # Get application logger
 logger = logging.getLogger(__name__)
-logger.info("EmPy application initialized") 
\ No newline at end of file
+logger.debug("EmPy application initialized")
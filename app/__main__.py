@@ -0,0 +1,9 @@
+"""Entry point of the command line interface: python -m app --help"""
+
+import sys
+
+from .cli import main
+
+# Pool workers are spawned and import this module again; only the parent runs the CLI
+if __name__ == '__main__':
+    sys.exit(main())
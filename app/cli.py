@@ -0,0 +1,325 @@
+"""
+Command line interface for EmPy
+Runs the embed service over whole directories without going through HTTP:
+
+    python -m app embed CARRIERS PAYLOADS -o OUT   carriers/<stem>.* + payloads/<stem>.* -> OUT/<stem>.png
+    python -m app embed MANIFEST -o OUT            one "carrier,payload[,output]" line per image
+    python -m app extract IMAGES -o OUT            every image's payload -> OUT/<stem>_<filename>
+    python -m app probe IMAGES [-o results.jsonl]  one JSON line per image
+    python -m app bench [suite options]            python -m benchmarks.suite
+
+IMAGES is a directory or a manifest with one "image[,output]" line per image;
+relative paths in a manifest are relative to the manifest. Images are processed
+by a pool of --workers processes (all cores by default) that read their inputs
+and write their outputs themselves, so only paths and small results cross
+process boundaries.
+
+Every finished image is appended to a journal (OUT/.empy-journal.jsonl, or
+RESULTS.journal for probe, unless --journal says otherwise); running the same
+command again skips the images the journal records as done, so an interrupted
+run resumes where it stopped. Probes written to stdout are not journaled.
+Failed images are retried. At the end the command prints how many images were
+done, skipped and failed, with images/s and MB/s of input read.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .config import COMPRESSION
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = '.empy-journal.jsonl'
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+
+class Task(NamedTuple):
+    operation: str
+    inputs: Tuple[str, ...]
+    output: str = ''
+
+    @property
+    def key(self) -> str:
+        """Identifies the task in the journal"""
+        return f"{self.operation}:{':'.join(os.path.abspath(path) for path in self.inputs)}"
+
+
+def _files(directory: str) -> Dict[str, str]:
+    """Files directly inside a directory, by stem"""
+    files = {}
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if entry.is_file() and not entry.name.startswith('.'):
+            files.setdefault(os.path.splitext(entry.name)[0], entry.path)
+    return files
+
+
+def _manifest(path: str, columns: int) -> Iterator[List[str]]:
+    """Rows of a manifest: `columns` input paths, then an optional output path"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='') as f:
+        for number, row in enumerate(csv.reader(f), 1):
+            row = [field.strip() for field in row]
+            if not row or not row[0] or row[0].startswith('#'):
+                continue
+            if len(row) < columns:
+                raise ValueError(f"{path}:{number}: expected {columns} path(s), got {len(row)}")
+            yield [os.path.join(base, field) if field else '' for field in row[:columns + 1]]
+
+
+def embed_tasks(carriers: str, payloads: Optional[str], output_dir: str, extension: str) -> List[Task]:
+    """Carrier/payload pairs from two directories (paired by stem) or a manifest"""
+    if os.path.isdir(carriers):
+        if not payloads or not os.path.isdir(payloads):
+            raise ValueError("A carrier directory needs a payload directory")
+        carrier_files, payload_files = _files(carriers), _files(payloads)
+        missing = sorted(set(carrier_files) - set(payload_files))
+        if missing:
+            logger.warning("%s carrier(s) have no payload of the same name, e.g. %s", len(missing), missing[0])
+        return [Task('embed', (carrier_files[stem], payload_files[stem]), os.path.join(output_dir, stem + extension))
+                for stem in carrier_files if stem in payload_files]
+    tasks = []
+    for row in _manifest(carriers, 2):
+        output = row[2] if len(row) > 2 and row[2] else \
+            os.path.join(output_dir, os.path.splitext(os.path.basename(row[0]))[0] + extension)
+        tasks.append(Task('embed', (row[0], row[1]), output))
+    return tasks
+
+
+def image_tasks(operation: str, images: str, output_dir: str) -> List[Task]:
+    """One task per image of a directory or manifest; extract outputs are named once the payload is known"""
+    if os.path.isdir(images):
+        paths = [[path] for path in _files(images).values()]
+    else:
+        paths = list(_manifest(images, 1))
+    return [Task(operation, (row[0],), row[1] if len(row) > 1 and row[1] else output_dir) for row in paths]
+
+
+def _write(path: str, data: bytes) -> None:
+    """Write a file atomically, so an interrupted run never leaves a partial output behind"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    partial = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.partial")
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def run_task(task: Task, options: dict) -> dict:
+    """Run one task in a worker; returns its journal entry"""
+    from .services.embed_service import embed_file_in_image, extract_file_from_image, probe_image
+
+    start = time.perf_counter()
+    entry = {"key": task.key, "operation": task.operation, "input": task.inputs[0]}
+    try:
+        entry["bytes"] = sum(os.path.getsize(path) for path in task.inputs)
+        if task.operation == 'embed':
+            _write(task.output, embed_file_in_image(task.inputs[0], task.inputs[1], **options))
+            entry["output"] = task.output
+        elif task.operation == 'extract':
+            extracted = extract_file_from_image(task.inputs[0])
+            stem = os.path.splitext(os.path.basename(task.inputs[0]))[0]
+            output = task.output
+            if os.path.isdir(output) or not os.path.splitext(output)[1]:
+                output = os.path.join(output, f"{stem}_{os.path.basename(extracted.filename)}")
+            _write(output, extracted.data)
+            entry.update(output=output, payload_bytes=len(extracted.data))
+        else:
+            entry["info"] = probe_image(task.inputs[0])
+        entry["status"] = 'ok'
+    except (ValueError, OSError) as e:
+        entry.update(status='error', error=str(e))
+    entry["seconds"] = round(time.perf_counter() - start, 4)
+    return entry
+
+
+def _run_task(args: Tuple[Task, dict]) -> dict:
+    return run_task(*args)
+
+
+class Journal:
+    """Append-only record of finished tasks, read back to resume a run"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short when the last run was killed
+                    if entry.get("status") == 'ok':
+                        self.done[entry["key"]] = entry
+                    else:
+                        self.done.pop(entry.get("key"), None)
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, 'a')
+
+    def is_done(self, task: Task) -> bool:
+        entry = self.done.get(task.key)
+        return entry is not None and (not entry.get("output") or os.path.exists(entry["output"]))
+
+    def record(self, entry: dict) -> None:
+        if self._file is not None:
+            self._file.write(json.dumps(entry, default=str) + '\n')
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def run(tasks: List[Task], options: dict, workers: int, journal: Journal, results=None) -> int:
+    """Run tasks on a process pool, journal them and print a summary; returns the number that failed"""
+    pending = [task for task in tasks if not journal.is_done(task)]
+    skipped = len(tasks) - len(pending)
+    if skipped:
+        print(f"Skipping {skipped} image(s) already done according to {journal.path}", file=sys.stderr)
+
+    done = failed = read = 0
+    start = last_report = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    pool = context.Pool(workers)
+    try:
+        for entry in pool.imap_unordered(_run_task, [(task, options) for task in pending]):
+            journal.record(entry)
+            if entry["status"] == 'ok':
+                done += 1
+                read += entry.get("bytes", 0)
+                if results is not None:
+                    results.write(json.dumps({"input": entry["input"], **entry["info"]}) + '\n')
+            else:
+                failed += 1
+                print(f"{entry['input']}: {entry['error']}", file=sys.stderr)
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"{done + failed}/{len(pending)} images, {(done + failed) / (now - start):.1f} images/s",
+                      file=sys.stderr)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        failed += 1
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        journal.close()
+
+    elapsed = time.perf_counter() - start
+    rate = (done + failed) / elapsed if elapsed else 0.0
+    print(f"{done} done, {skipped} skipped, {failed} failed in {elapsed:.2f}s: "
+          f"{rate:.1f} images/s, {read / elapsed / 1e6 if elapsed else 0.0:.2f} MB/s", file=sys.stderr)
+    return failed
+
+
+def _journal_path(args: argparse.Namespace) -> Optional[str]:
+    if args.journal:
+        return None if args.journal == '-' else args.journal
+    if args.command == 'probe':
+        # Results already written to a file are kept there; those printed to stdout would be lost on resume
+        return f"{args.results}.journal" if args.results else None
+    return os.path.join(args.output, JOURNAL_NAME)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='empy', description=__doc__.splitlines()[1])
+    parser.add_argument('--log-level', default='CRITICAL',
+                        help="lowest level of service log records written (default: none; failures are "
+                             "reported by the command itself)")
+    parser.add_argument('--log-file', default='', help="also write service log records to this file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def pool_options(command: argparse.ArgumentParser) -> None:
+        command.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+        command.add_argument('--journal', help=f"progress journal (default OUT/{JOURNAL_NAME}, or RESULTS.journal "
+                                               f"for probe; '-' for none)")
+
+    embed = commands.add_parser('embed', help="embed payloads into carriers")
+    embed.add_argument('carriers', help="carrier directory, or a manifest of carrier,payload[,output] lines")
+    embed.add_argument('payloads', nargs='?', help="payload directory, paired with the carriers by file stem")
+    embed.add_argument('-o', '--output', required=True, help="output directory")
+    embed.add_argument('--format', default='png', dest='output_format', help="output image format")
+    embed.add_argument('--bits', '--bits-per-channel', type=int, default=1, dest='bits_per_channel',
+                       help="bits per channel (1-4)")
+    embed.add_argument('--strategy', default='prime', help="pixel selection: prime, sequential or shuffle")
+    embed.add_argument('--seed', type=int, help="seed of the shuffle strategy (default: a random one per image)")
+    embed.add_argument('--compression', default=COMPRESSION, help="payload compression")
+    embed.add_argument('--compress-level', type=int, help="zlib level of PNG output")
+    pool_options(embed)
+
+    extract = commands.add_parser('extract', help="extract payloads from images")
+    extract.add_argument('images', help="image directory, or a manifest of image[,output] lines")
+    extract.add_argument('-o', '--output', required=True, help="output directory")
+    pool_options(extract)
+
+    probe = commands.add_parser('probe', help="report what images carry")
+    probe.add_argument('images', help="image directory, or a manifest of image lines")
+    probe.add_argument('-o', '--output', dest='results', help="JSON lines file to append to (default stdout)")
+    pool_options(probe)
+
+    commands.add_parser('bench', help="run the benchmark suite (options are passed on)", add_help=False)
+
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'bench':
+        # In a fresh interpreter: the suite sets the EMPY_* settings it needs before importing the app
+        return subprocess.run([sys.executable, '-m', 'benchmarks.suite', *extra]).returncode
+    if extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    level = logging.getLevelName(args.log_level.upper())
+    if not isinstance(level, int):
+        parser.error(f"unknown log level: {args.log_level}")
+    # Importing the app set up logging from the environment (with empy.log as the file); redo it for the CLI
+    from . import log_config
+    log_config.stop_logging()
+    log_config.configure_logging(logging.getLevelName(level), args.log_file)
+    # Workers read their log settings from the environment when they import the app
+    os.environ['EMPY_LOG_LEVEL'] = logging.getLevelName(level)
+    os.environ['EMPY_LOG_FILE'] = args.log_file
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    from .services.embed_service import validate_output, OUTPUT_FORMATS
+    from .services.compression import validate_compression
+    from .services.payload_format import validate_layout
+    try:
+        if args.command == 'embed':
+            validate_output(args.output_format, args.compress_level)
+            validate_layout(args.bits_per_channel, args.strategy)
+            validate_compression(args.compression)
+            tasks = embed_tasks(args.carriers, args.payloads, args.output,
+                                OUTPUT_FORMATS[args.output_format].extension)
+            options = {name: getattr(args, name) for name in ('output_format', 'bits_per_channel', 'strategy',
+                                                              'seed', 'compression', 'compress_level')}
+        else:
+            tasks = image_tasks(args.command, args.images, getattr(args, 'output', ''))
+            options = {}
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+
+    journal = Journal(_journal_path(args))
+    if args.command == 'probe':
+        results = open(args.results, 'a') if args.results else sys.stdout
+        try:
+            failed = run(tasks, options, args.workers, journal, results)
+        finally:
+            if results is not sys.stdout:
+                results.close()
+    else:
+        failed = run(tasks, options, args.workers, journal)
+    return 1 if failed else 0
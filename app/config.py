@@ -0,0 +1,124 @@
+"""
+Runtime settings for EmPy
+Every setting can be overridden with an EMPY_* environment variable
+"""
+
+import os
+
+# Memory budget of the cached pixel index sequences (a 24 megapixel carrier's primes take about 12 MiB)
+INDEX_CACHE_BYTES = int(os.environ.get('EMPY_INDEX_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Largest accepted upload per file; enforced while the upload is streamed
+MAX_UPLOAD_BYTES = int(os.environ.get('EMPY_MAX_UPLOAD_BYTES', 64 * 1024 * 1024))
+
+# Chunk size used when streaming uploads into memory
+UPLOAD_CHUNK_SIZE = int(os.environ.get('EMPY_UPLOAD_CHUNK_SIZE', 1024 * 1024))
+
+# Default zlib level (0-9) for PNG output when a request does not set compress_level
+PNG_COMPRESS_LEVEL = int(os.environ.get('EMPY_PNG_COMPRESS_LEVEL', 6))
+
+# Results up to this size are sent straight from memory; larger ones are spooled to a temp file
+RESPONSE_SPOOL_BYTES = int(os.environ.get('EMPY_RESPONSE_SPOOL_BYTES', 32 * 1024 * 1024))
+
+# Largest number of items in one batch request
+MAX_BATCH_ITEMS = int(os.environ.get('EMPY_MAX_BATCH_ITEMS', 256))
+
+# Largest total size of one batch request (all uploads, or the unpacked archive)
+MAX_BATCH_BYTES = int(os.environ.get('EMPY_MAX_BATCH_BYTES', 256 * 1024 * 1024))
+
+# Memory budget of the embed/extract result cache (0 disables the memory tier)
+RESULT_CACHE_BYTES = int(os.environ.get('EMPY_RESULT_CACHE_BYTES', 128 * 1024 * 1024))
+
+# Directory for the disk tier of the result cache (empty disables it) and its budget
+RESULT_CACHE_DIR = os.environ.get('EMPY_RESULT_CACHE_DIR', '')
+RESULT_CACHE_DISK_BYTES = int(os.environ.get('EMPY_RESULT_CACHE_DISK_BYTES', 1024 * 1024 * 1024))
+
+# Payload compression applied when a request does not choose one: auto, none, zlib, lzma or zstd
+COMPRESSION = os.environ.get('EMPY_COMPRESSION', 'auto')
+
+# Largest payload extraction will decompress; protects against compression bombs
+MAX_DECOMPRESSED_BYTES = int(os.environ.get('EMPY_MAX_DECOMPRESSED_BYTES', 512 * 1024 * 1024))
+
+# Also write the payload to the alpha channel of RGBA carriers (1) or only to the colour channels (0)
+EMBED_ALPHA = bool(int(os.environ.get('EMPY_EMBED_ALPHA', 1)))
+
+# Carriers with more pixels are scaled down before embedding (0 keeps every carrier's size)
+MAX_CARRIER_PIXELS = int(os.environ.get('EMPY_MAX_CARRIER_PIXELS', 0))
+
+# Carriers with at least this many pixels are decoded into a memory-mapped buffer
+MMAP_MIN_PIXELS = int(os.environ.get('EMPY_MMAP_MIN_PIXELS', 16_000_000))
+
+# Directory for memory-mapped pixel buffers (empty: the scratch directory); should be disk-backed
+MMAP_DIR = os.environ.get('EMPY_MMAP_DIR', '')
+
+# Directory for scratch files such as response spools (empty: the system temp dir); may be a tmpfs
+SCRATCH_DIR = os.environ.get('EMPY_SCRATCH_DIR', '')
+
+# Bytes of scratch files each process may have in flight (0: no limit); past it results stay in memory
+SCRATCH_QUOTA_BYTES = int(os.environ.get('EMPY_SCRATCH_QUOTA_BYTES', 4 * 1024 * 1024 * 1024))
+
+# Free space a scratch file may not take the file system below
+SCRATCH_MIN_FREE_BYTES = int(os.environ.get('EMPY_SCRATCH_MIN_FREE_BYTES', 256 * 1024 * 1024))
+
+# Seconds between sweeps of the scratch directories
+SCRATCH_SWEEP_INTERVAL = float(os.environ.get('EMPY_SCRATCH_SWEEP_INTERVAL', 300))
+
+# How embed/extract jobs run: 'process' (worker pool), 'thread' or 'inline'
+EXECUTOR = os.environ.get('EMPY_EXECUTOR', 'process')
+
+# Worker processes in the pool
+WORKERS = int(os.environ.get('EMPY_WORKERS', os.cpu_count() or 1))
+
+# Jobs allowed to wait for a worker before requests are rejected with 503
+MAX_PENDING_JOBS = int(os.environ.get('EMPY_MAX_PENDING_JOBS', 2 * WORKERS))
+
+# Seconds a single embed/extract job may take before the request gets a 504
+JOB_TIMEOUT = float(os.environ.get('EMPY_JOB_TIMEOUT', 120))
+
+# Add a Server-Timing header with per-stage durations to every response (1) or not (0)
+SERVER_TIMING = bool(int(os.environ.get('EMPY_SERVER_TIMING', 0)))
+
+# Where asynchronous job state and results live: 'memory' or 'sqlite'
+JOB_STORE = os.environ.get('EMPY_JOB_STORE', 'memory')
+
+# SQLite database file used by the 'sqlite' job store
+JOB_STORE_PATH = os.environ.get('EMPY_JOB_STORE_PATH', 'empy-jobs.sqlite3')
+
+# Seconds a finished job and its result are kept before cleanup removes them
+JOB_RESULT_TTL = float(os.environ.get('EMPY_JOB_RESULT_TTL', 3600))
+
+# Seconds between cleanup passes over the job store
+JOB_CLEANUP_INTERVAL = float(os.environ.get('EMPY_JOB_CLEANUP_INTERVAL', 60))
+
+# Asynchronous jobs allowed to be queued or running before new ones are rejected with 503
+MAX_QUEUED_JOBS = int(os.environ.get('EMPY_MAX_QUEUED_JOBS', 64))
+
+# Seconds a single asynchronous job may run before it is marked failed
+BACKGROUND_JOB_TIMEOUT = float(os.environ.get('EMPY_BACKGROUND_JOB_TIMEOUT', 1800))
+
+# Leading bytes of a payload examined when its MIME type has to be detected
+DETECT_BYTES = int(os.environ.get('EMPY_DETECT_BYTES', 8192))
+
+# Extra or overriding MIME type to file extension mappings, e.g. "application/x-foo=.foo,text/x-bar=.bar"
+MIME_EXTENSIONS = dict(
+    item.split('=', 1)
+    for item in os.environ.get('EMPY_MIME_EXTENSIONS', '').split(',') if '=' in item
+)
+
+# Lowest level of log records written: DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.environ.get('EMPY_LOG_LEVEL', 'INFO')
+
+# Log line format: 'text' or 'json' (one object per line)
+LOG_FORMAT = os.environ.get('EMPY_LOG_FORMAT', 'text')
+
+# Log file written next to stdout (empty: stdout only)
+LOG_FILE = os.environ.get('EMPY_LOG_FILE', 'empy.log')
+
+# Share of requests (0-1) whose DEBUG records are written even above the DEBUG level
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('EMPY_LOG_DEBUG_SAMPLE_RATE', 0))
+
+# Carrier sizes whose index sequences are built when a worker starts, e.g. "1920x1080,4000x3000"
+WARM_CARRIER_SIZES = [
+    tuple(int(side) for side in size.split('x'))
+    for size in os.environ.get('EMPY_WARM_CARRIER_SIZES', '').split(',') if size
+]
@@ -0,0 +1,156 @@
+"""
+Logging for EmPy
+Log calls only put the record on a queue; a QueueListener thread formats it and
+writes it to stdout and the log file, so request handlers never wait on either.
+
+Per-request details are logged at DEBUG. With EMPY_LOG_DEBUG_SAMPLE_RATE above
+0 a random share of requests is picked for debugging and their DEBUG records are
+written even when EMPY_LOG_LEVEL is INFO; records of other requests are dropped.
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import multiprocessing.util
+import queue
+import random
+import sys
+from typing import Callable, List, Optional
+
+from .config import LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_DEBUG_SAMPLE_RATE
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Whether DEBUG records of the current request are written
+_debug_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar('empy_debug_sampled', default=False)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the traceback if any"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records without formatting them; the listener's handlers format them
+
+    The stock QueueHandler formats each record in the logging thread and folds
+    the traceback into the message, which would leave JSONFormatter no exc_info.
+    Only the message arguments are merged here, so later changes to them do not
+    show up in the output.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class DebugSampleFilter(logging.Filter):
+    """Passes DEBUG records only while handling a request picked for debug sampling"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or _debug_sampled.get()
+
+
+def sampling_enabled() -> bool:
+    return LOG_DEBUG_SAMPLE_RATE > 0 and logging.getLevelName(LOG_LEVEL.upper()) != logging.DEBUG
+
+
+def debug_sampled() -> bool:
+    """Whether the current request was picked for debug sampling"""
+    return _debug_sampled.get()
+
+
+def call_sampled(sampled: bool, func: Callable, *args, **kwargs):
+    """Call `func` with the debug sampling decision of the request that submitted it
+
+    Context variables do not follow jobs into pool workers, so run_job passes
+    the decision along explicitly.
+    """
+    token = _debug_sampled.set(sampled)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _debug_sampled.reset(token)
+
+
+class DebugSampleMiddleware:
+    """Picks EMPY_LOG_DEBUG_SAMPLE_RATE of the HTTP requests for debug logging"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _debug_sampled.set(random.random() < LOG_DEBUG_SAMPLE_RATE)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _debug_sampled.reset(token)
+
+
+def configure_logging(level_name: str = LOG_LEVEL, log_file: str = LOG_FILE) -> None:
+    """Send the root logger's records through a queue to the configured outputs (once per process)
+
+    The log file is only created once a record is written to it. To change the
+    level or file later, call stop_logging first.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    if LOG_FORMAT not in ('text', 'json'):
+        raise ValueError(f"Unknown log format: {LOG_FORMAT} (expected 'text' or 'json')")
+
+    formatter = JSONFormatter(datefmt=DATE_FORMAT) if LOG_FORMAT == 'json' else \
+        logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, delay=True))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    root = logging.getLogger()
+    level = logging.getLevelName(level_name.upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {level_name}")
+    if sampling_enabled():
+        # Let DEBUG records through to the filter, which keeps those of sampled requests
+        queue_handler.addFilter(DebugSampleFilter())
+        level = logging.DEBUG
+    root.setLevel(level)
+    root.handlers = [queue_handler]
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+    # Flush what is queued on exit; pool workers skip atexit, but run multiprocessing finalizers
+    atexit.register(stop_logging)
+    multiprocessing.util.Finalize(None, stop_logging, exitpriority=0)
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,15 +1,42 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
-from .routers import embed
+from .routers import embed, batch, shards, jobs, metrics
+from .log_config import DebugSampleMiddleware, sampling_enabled
+from .services.executor import start_pool, shutdown_pool
+from .services.jobs import start_jobs, stop_jobs
+from .services.scratch import start_janitor, stop_janitor
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Spawn and warm up the worker pool before accepting requests
+    start_pool()
+    start_jobs()
+    start_janitor()
+    yield
+    await stop_janitor()
+    await stop_jobs()
+    shutdown_pool()
 
 app = FastAPI(
     title="EmPy - Image File Embedder",
     description="A modern tool for embedding files into images securely",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# 413 for oversized request bodies, before Starlette spools the form
+app.add_middleware(embed.UploadLimitMiddleware)
+
+# Request metrics and Server-Timing headers
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Debug logging for a sample of requests
+if sampling_enabled():
+    app.add_middleware(DebugSampleMiddleware)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -18,6 +45,10 @@ templates = Jinja2Templates(directory="app/templates")
 
 # Include routers
 app.include_router(embed.router)
+app.include_router(batch.router)
+app.include_router(shards.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 async def home(request: Request):
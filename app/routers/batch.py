@@ -0,0 +1,218 @@
+from fastapi import APIRouter, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
+from ..services.embed_service import (embed_file_in_image, extract_file_from_image,
+                                      validate_output, OUTPUT_FORMATS)
+from ..services.batch_service import (BatchItem, ItemResult, ZipStream, MultipartStream,
+                                      read_embed_archive, read_extract_archive)
+from ..services.compression import validate_compression
+from ..services.executor import run_job, PoolSaturatedError, JobTimeoutError
+from ..services import metrics, payload_format
+from ..config import MAX_UPLOAD_BYTES, MAX_BATCH_ITEMS, MAX_BATCH_BYTES, WORKERS, COMPRESSION
+from .embed import read_upload, UploadTooLarge, upload_too_large_response, content_disposition
+from typing import AsyncIterator, Callable, List, Optional
+import asyncio
+import logging
+import os
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/embed/batch", tags=["batch"])
+
+FORMATS = ('zip', 'multipart')
+
+async def read_batch_uploads(uploads: List[UploadFile]) -> List[bytes]:
+    """Read every upload of a batch, enforcing the per-file and per-batch limits"""
+    contents = []
+    total = 0
+    for upload in uploads:
+        buffer = await read_upload(upload, min(MAX_UPLOAD_BYTES, MAX_BATCH_BYTES - total))
+        contents.append(buffer.getvalue())
+        total += len(contents[-1])
+    return contents
+
+async def read_batch_archive(archive: UploadFile, reader: Callable) -> List[BatchItem]:
+    buffer = await read_upload(archive, MAX_BATCH_BYTES)
+    # Inflating and checking the members is CPU work; keep it off the event loop
+    return await asyncio.to_thread(reader, buffer.getvalue(), MAX_BATCH_ITEMS, MAX_UPLOAD_BYTES, MAX_BATCH_BYTES)
+
+def check_batch(count: int, output_format: str) -> None:
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown batch output format: {output_format} (expected one of: {', '.join(FORMATS)})")
+    if not count:
+        raise ValueError("Batch request has no items")
+    if count > MAX_BATCH_ITEMS:
+        raise ValueError(f"Batch request has {count} items (limit {MAX_BATCH_ITEMS})")
+
+async def run_items(items: List[BatchItem], process: Callable) -> AsyncIterator[ItemResult]:
+    """Run `process(index, item)` for every item, yielding results as they finish
+
+    At most WORKERS items are submitted at a time, so one batch never fills the
+    pool's pending queue on its own. Results travel through a queue instead of
+    task results, so each output can be freed as soon as it has been sent.
+    """
+    semaphore = asyncio.Semaphore(WORKERS)
+    finished: asyncio.Queue = asyncio.Queue()
+
+    async def run(index: int, item: BatchItem) -> None:
+        async with semaphore:
+            start = time.time()
+            try:
+                data, filename, mime_type = await process(index, item)
+                result = ItemResult(index, item.name, 'ok', time.time() - start, data, filename, mime_type)
+            except (ValueError, PoolSaturatedError, JobTimeoutError) as e:
+                metrics.count_error("validation_error" if isinstance(e, ValueError) else
+                                    "pool_saturated" if isinstance(e, PoolSaturatedError) else "job_timeout")
+                result = ItemResult(index, item.name, 'error', time.time() - start, error=str(e))
+            except Exception as e:
+                metrics.count_error("server_error")
+                trace = traceback.format_exc()
+                logger.error("Unexpected error in batch item %s (%s): %s\n%s", index, item.name, e, trace)
+                result = ItemResult(index, item.name, 'error', time.time() - start,
+                                    error="Internal server error while processing item")
+        await finished.put(result)
+
+    tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for _ in range(len(tasks)):
+            yield await finished.get()
+    finally:
+        # Client went away or the stream was closed: drop items not yet submitted
+        for task in tasks:
+            task.cancel()
+
+async def stream_batch(items: List[BatchItem], process: Callable, writer, process_start: float):
+    """Stream results through a ZipStream/MultipartStream writer, then the summary"""
+    summaries = []
+    async for result in run_items(items, process):
+        chunk, entry = writer.add(result)
+        summaries.append(result.summary(entry))
+        logger.debug("Batch item %s (%s): %s in %.2fs", result.index, result.name, result.status, result.seconds)
+        if chunk:
+            yield chunk
+
+    summaries.sort(key=lambda summary: summary["index"])
+    succeeded = sum(summary["status"] == 'ok' for summary in summaries)
+    total_time = time.time() - process_start
+    logger.info("Batch completed in %.2fs: %s/%s items succeeded", total_time, succeeded, len(summaries))
+    yield writer.close({
+        "items": summaries,
+        "succeeded": succeeded,
+        "failed": len(summaries) - succeeded,
+        "total_time": round(total_time, 4)
+    })
+
+def batch_response(items: List[BatchItem], process: Callable, output_format: str,
+                   process_start: float) -> StreamingResponse:
+    writer = ZipStream() if output_format == 'zip' else MultipartStream(content_disposition)
+    headers = {"X-Batch-Items": str(len(items))}
+    if output_format == 'zip':
+        headers["Content-Disposition"] = content_disposition("batch.zip")
+    return StreamingResponse(stream_batch(items, process, writer, process_start),
+                             media_type=writer.media_type, headers=headers)
+
+def batch_error_response(e: Exception, process_start: float) -> JSONResponse:
+    if isinstance(e, UploadTooLarge):
+        return upload_too_large_response(e, process_start)
+    logger.error("Validation error in batch request: %s", e)
+    total_time = time.time() - process_start
+    metrics.count_error("validation_error")
+    return JSONResponse(
+        status_code=400,
+        content={
+            "detail": str(e),
+            "debug_info": {
+                "process_time": f"{total_time:.2f}s",
+                "error_type": "validation_error"
+            }
+        }
+    )
+
+@router.post("/embed")
+async def batch_embed(
+    carriers: Optional[List[UploadFile]] = File(None),
+    payloads: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    bits_per_channel: int = Form(1),
+    strategy: str = Form('prime'),
+    seed: Optional[int] = Form(None),
+    image_format: str = Form('png'),
+    compress_level: Optional[int] = Form(None),
+    optimize: bool = Form(False),
+    compression: str = Form(COMPRESSION),
+    output_format: str = Form('zip', alias='format')
+):
+    process_start = time.time()
+
+    try:
+        payload_format.validate_layout(bits_per_channel, strategy)
+        validate_output(image_format, compress_level)
+        validate_compression(compression)
+        if archive is not None:
+            items = await read_batch_archive(archive, read_embed_archive)
+        else:
+            carriers, payloads = carriers or [], payloads or []
+            if len(carriers) != len(payloads):
+                raise ValueError(f"Got {len(carriers)} carriers but {len(payloads)} payloads")
+            check_batch(len(carriers), output_format)
+            contents = await read_batch_uploads(carriers + payloads)
+            items = [
+                BatchItem(carrier.filename or f"carrier{index}", contents[index],
+                          contents[len(carriers) + index], payload.filename or '',
+                          payload.content_type or '')
+                for index, (carrier, payload) in enumerate(zip(carriers, payloads))
+            ]
+        check_batch(len(items), output_format)
+    except ValueError as e:
+        return batch_error_response(e, process_start)
+
+    logger.info("Processing batch embedding request: %s items", len(items))
+
+    async def process(index: int, item: BatchItem):
+        output = await run_job(
+            embed_file_in_image,
+            item.image,
+            item.payload,
+            filename=item.payload_name,
+            mime_type=item.payload_mime,
+            bits_per_channel=bits_per_channel,
+            strategy=strategy,
+            seed=seed,
+            output_format=image_format,
+            compress_level=compress_level,
+            optimize=optimize,
+            compression=compression
+        )
+        output_type = OUTPUT_FORMATS[image_format]
+        return output, f"embedded_{os.path.splitext(item.name)[0]}{output_type.extension}", output_type.mime_type
+
+    return batch_response(items, process, output_format, process_start)
+
+@router.post("/extract")
+async def batch_extract(
+    images: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    output_format: str = Form('zip', alias='format')
+):
+    process_start = time.time()
+
+    try:
+        if archive is not None:
+            items = await read_batch_archive(archive, read_extract_archive)
+        else:
+            images = images or []
+            check_batch(len(images), output_format)
+            contents = await read_batch_uploads(images)
+            items = [BatchItem(image.filename or f"image{index}", content)
+                     for index, (image, content) in enumerate(zip(images, contents))]
+        check_batch(len(items), output_format)
+    except ValueError as e:
+        return batch_error_response(e, process_start)
+
+    logger.info("Processing batch extraction request: %s items", len(items))
+
+    async def process(index: int, item: BatchItem):
+        extracted = await run_job(extract_file_from_image, item.image)
+        return extracted.data, extracted.filename, extracted.mime_type
+
+    return batch_response(items, process, output_format, process_start)
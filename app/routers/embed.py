@@ -1,32 +1,214 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Response
-from fastapi.responses import FileResponse, JSONResponse
-from ..services.embed_service import embed_file_in_image, extract_file_from_image
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from ..services.embed_service import (embed_file_in_image, extract_file_from_image, payload_capacity,
+                                      probe_image, validate_output, OUTPUT_FORMATS)
+from ..services.executor import run_job, queue_depth, PoolSaturatedError, JobTimeoutError
+from ..services.result_cache import result_cache, cache_key, CachedResult
+from ..services.compression import validate_compression
+from ..services.scratch import scratch, ScratchQuotaError
+from ..services import lsb_engine, metrics
+from ..config import (MAX_UPLOAD_BYTES, MAX_BATCH_BYTES, UPLOAD_CHUNK_SIZE, RESPONSE_SPOOL_BYTES, COMPRESSION,
+                      EMBED_ALPHA, MAX_CARRIER_PIXELS)
 from pathlib import Path
-import tempfile
-import shutil
+from typing import Iterator, Optional
+from urllib.parse import quote
+import asyncio
+import contextlib
+import io
 import logging
 import time
-import os
 import traceback
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/embed", tags=["embed"])
 
-def cleanup_temp_file(filepath: str):
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES"""
+
+async def read_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> io.BytesIO:
+    """Stream an upload into memory chunk by chunk, enforcing a size limit"""
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(f"{upload.filename} exceeds the {max_bytes} byte upload limit")
+    
+    buffer = io.BytesIO()
+    with metrics.stage('upload_read'):
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if buffer.tell() + len(chunk) > max_bytes:
+                raise UploadTooLarge(f"{upload.filename} exceeds the {max_bytes} byte upload limit")
+            buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+# Room for multipart boundaries, part headers and form fields on top of the uploads themselves
+FORM_OVERHEAD_BYTES = 1024 * 1024
+# Endpoints taking a whole batch of files, limited by MAX_BATCH_BYTES rather than per file
+BATCH_PREFIXES = ('/api/embed/batch', '/api/embed/shards')
+
+def request_body_limit(path: str) -> int:
+    """Largest request body accepted on `path`: a batch, or a carrier and a payload"""
+    uploads = MAX_BATCH_BYTES if path.startswith(BATCH_PREFIXES) else 2 * MAX_UPLOAD_BYTES
+    return uploads + FORM_OVERHEAD_BYTES
+
+class UploadLimitMiddleware:
+    """Answers 413 to request bodies over the upload limits before the form is parsed
+
+    Starlette spools every part of a multipart form before the endpoint runs, so
+    read_upload alone would only refuse an oversized upload once it is on disk.
+    A declared Content-Length over the limit is refused without reading the
+    body; bodies sent without one are counted as they arrive and cut off at the
+    limit, replacing whatever the endpoint made of the truncated form.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        process_start = time.time()
+        limit = request_body_limit(scope["path"])
+        too_large = UploadTooLarge(f"Request body exceeds the {limit} byte limit")
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await upload_too_large_response(too_large, process_start)(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = started = False
+
+        async def receive_limited():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise too_large
+            return message
+
+        async def send_unless_exceeded(message):
+            nonlocal started
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_limited, send_unless_exceeded)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await upload_too_large_response(too_large, process_start)(scope, receive, send)
+
+def content_disposition(filename: str) -> str:
+    """Content-Disposition value for an attachment, RFC 5987-encoded when not plain ASCII"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+def read_spool(spool, close) -> Iterator[bytes]:
+    """Stream a spool file in chunks, calling `close` (which deletes it) when done"""
     try:
-        Path(filepath).unlink(missing_ok=True)
-    except Exception as e:
-        logger.error(f"Failed to cleanup temporary file {filepath}: {str(e)}")
+        while True:
+            chunk = spool.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        close()
+
+def file_response(data: bytes, filename: str, media_type: Optional[str]) -> Response:
+    """Send a result from memory, spooling it to a scratch file only above RESPONSE_SPOOL_BYTES
+
+    The spool file is unlinked as soon as it is created, so nothing is left on
+    disk once the response is sent or the client goes away. When the scratch
+    space is full the result is sent from memory.
+    """
+    headers = {"Content-Disposition": content_disposition(filename)}
+    if len(data) > RESPONSE_SPOOL_BYTES:
+        spool_files = contextlib.ExitStack()
+        try:
+            spool = spool_files.enter_context(scratch.temporary_file(len(data), prefix='empy-response-'))
+            spool.write(data)
+            spool.seek(0)
+        except (ScratchQuotaError, OSError) as e:
+            spool_files.close()
+            logger.warning("Sending %s byte result from memory: %s", len(data), e)
+        else:
+            logger.debug("Spooled %s byte result to a scratch file", len(data))
+            headers["Content-Length"] = str(len(data))
+            return StreamingResponse(read_spool(spool, spool_files.close), media_type=media_type, headers=headers)
+    
+    return Response(content=data, media_type=media_type, headers=headers)
+
+async def cache_lookup(operation: str, *parts):
+    """Hash the inputs off the event loop and look them up; returns (key, cached result or None)"""
+    if not result_cache.enabled:
+        return None, None
+    key = await asyncio.to_thread(cache_key, operation, *parts)
+    return key, await asyncio.to_thread(result_cache.get, key)
+
+async def cache_store(key: Optional[str], result: CachedResult) -> None:
+    if key is not None:
+        await asyncio.to_thread(result_cache.put, key, result)
+
+def upload_too_large_response(e: UploadTooLarge, process_start: float) -> JSONResponse:
+    logger.error("Upload rejected: %s", e)
+    total_time = time.time() - process_start
+    metrics.count_error("upload_too_large")
+    return JSONResponse(
+        status_code=413,
+        content={
+            "detail": str(e),
+            "debug_info": {
+                "process_time": f"{total_time:.2f}s",
+                "max_upload_bytes": MAX_UPLOAD_BYTES,
+                "error_type": "upload_too_large"
+            }
+        }
+    )
+
+def busy_response(e: Exception, process_start: float) -> JSONResponse:
+    """503 when the worker pool is saturated, 504 when a job timed out"""
+    saturated = isinstance(e, PoolSaturatedError)
+    metrics.count_error("pool_saturated" if saturated else "job_timeout")
+    logger.error("%s: %s", 'Pool saturated' if saturated else 'Job timed out', e)
+    total_time = time.time() - process_start
+    response = JSONResponse(
+        status_code=503 if saturated else 504,
+        content={
+            "detail": str(e),
+            "debug_info": {
+                "process_time": f"{total_time:.2f}s",
+                "queue_depth": queue_depth(),
+                "error_type": "pool_saturated" if saturated else "job_timeout"
+            }
+        }
+    )
+    if saturated:
+        response.headers["Retry-After"] = "1"
+    return response
 
 @router.post("/embed")
 async def embed_file(
-    background_tasks: BackgroundTasks,
     carrier_image: UploadFile = File(...),
-    file_to_embed: UploadFile = File(...)
+    file_to_embed: UploadFile = File(...),
+    bits_per_channel: int = Form(1),
+    strategy: str = Form('prime'),
+    seed: Optional[int] = Form(None),
+    output_format: str = Form('png'),
+    compress_level: Optional[int] = Form(None),
+    optimize: bool = Form(False),
+    compression: str = Form(COMPRESSION)
 ):
-    temp_image = None
-    temp_file = None
-    output_path = None
     process_start = time.time()
     
     try:
@@ -50,49 +232,64 @@ async def embed_file(
         # Validate file types
         if not carrier_image.content_type.startswith('image/'):
             raise ValueError("Carrier file must be an image")
+        validate_output(output_format, compress_level)
+        validate_compression(compression)
         
-        logger.info(f"Processing embedding request: {carrier_image.filename} + {file_to_embed.filename}")
-        
-        # Create temporary files
-        temp_image = tempfile.NamedTemporaryFile(delete=False)
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
+        logger.debug("Processing embedding request: %s + %s", carrier_image.filename, file_to_embed.filename)
         
-        # Copy uploaded files to temporary files
+        # Stream uploaded files into memory
         try:
             debug_info["timestamps"]["copy_start"] = time.time()
             
-            # Copy carrier image
-            carrier_content = await carrier_image.read()
-            debug_info["carrier_image"]["size"] = len(carrier_content)
-            temp_image.write(carrier_content)
+            carrier_buffer = await read_upload(carrier_image)
+            debug_info["carrier_image"]["size"] = carrier_buffer.getbuffer().nbytes
             
-            # Copy file to embed
-            embed_content = await file_to_embed.read()
-            debug_info["file_to_embed"]["size"] = len(embed_content)
-            temp_file.write(embed_content)
+            embed_buffer = await read_upload(file_to_embed)
+            debug_info["file_to_embed"]["size"] = embed_buffer.getbuffer().nbytes
             
             debug_info["timestamps"]["copy_end"] = time.time()
-            logger.info(f"Files copied: Carrier ({debug_info['carrier_image']['size']} bytes), "
-                       f"To embed ({debug_info['file_to_embed']['size']} bytes)")
+            logger.debug("Files received: Carrier (%s bytes), To embed (%s bytes)",
+                         debug_info['carrier_image']['size'], debug_info['file_to_embed']['size'])
             
+        except UploadTooLarge:
+            raise
         except Exception as e:
             trace = traceback.format_exc()
-            logger.error(f"Failed to process uploaded files: {str(e)}\n{trace}")
+            logger.error("Failed to process uploaded files: %s\n%s", e, trace)
             raise ValueError(f"Failed to process uploaded files: {str(e)}")
         
-        # Close the files to ensure all data is written
-        temp_image.close()
-        temp_file.close()
-        
-        # Perform the embedding
+        # Perform the embedding, unless the same inputs were embedded before
         debug_info["timestamps"]["embed_start"] = time.time()
-        output_path = embed_file_in_image(temp_image.name, temp_file.name)
+        payload = embed_buffer.getvalue()
+        options = dict(
+            filename=file_to_embed.filename or '',
+            mime_type=file_to_embed.content_type or '',
+            bits_per_channel=bits_per_channel,
+            strategy=strategy,
+            seed=seed,
+            output_format=output_format,
+            compress_level=compress_level,
+            optimize=optimize,
+            compression=compression,
+            # Settings that change the output belong in the cache key
+            use_alpha=EMBED_ALPHA,
+            max_pixels=MAX_CARRIER_PIXELS
+        )
+        if strategy == 'shuffle' and seed is None:
+            # Each unseeded shuffle draws a fresh random seed; a cached output would hand out the same one again
+            key, cached = None, None
+        else:
+            key, cached = await cache_lookup('embed', carrier_buffer.getbuffer(), payload, sorted(options.items()))
+        if cached is not None:
+            output = cached.data
+            logger.info("Returning cached embedding result")
+        else:
+            output = await run_job(embed_file_in_image, carrier_buffer, payload, **options)
+            await cache_store(key, CachedResult(output))
         debug_info["timestamps"]["embed_end"] = time.time()
         
-        # Get output file size
-        output_size = os.path.getsize(output_path)
+        output_size = len(output)
         debug_info["output_file"] = {
-            "path": output_path,
             "size": output_size
         }
         
@@ -100,38 +297,32 @@ async def embed_file(
         debug_info["timestamps"]["end"] = time.time()
         debug_info["total_time"] = total_time
         
-        logger.info(f"Embedding completed in {total_time:.2f}s. Output size: {output_size} bytes")
-        
-        # Schedule cleanup after response is sent
-        background_tasks.add_task(cleanup_temp_file, temp_image.name)
-        background_tasks.add_task(cleanup_temp_file, temp_file.name)
-        background_tasks.add_task(cleanup_temp_file, output_path)
+        logger.info("Embedding completed in %.2fs. Output size: %s bytes", total_time, output_size)
         
         # Add debug headers
-        response = FileResponse(
-            output_path,
-            media_type="image/png",
-            filename=f"embedded_{carrier_image.filename}"
+        output_type = OUTPUT_FORMATS[output_format]
+        response = file_response(
+            output,
+            f"embedded_{Path(carrier_image.filename or 'carrier').stem}{output_type.extension}",
+            output_type.mime_type
         )
         
         # Add custom headers with debug info
         response.headers["X-Processing-Time"] = f"{total_time:.2f}s"
+        response.headers["X-Cache"] = "HIT" if cached is not None else "MISS"
         response.headers["X-Embedding-Info"] = f"Carrier: {debug_info['carrier_image']['size']} bytes, Embedded: {debug_info['file_to_embed']['size']} bytes"
         
         return response
         
+    except UploadTooLarge as e:
+        return upload_too_large_response(e, process_start)
+    except (PoolSaturatedError, JobTimeoutError) as e:
+        return busy_response(e, process_start)
     except ValueError as e:
-        logger.error(f"Validation error during embedding: {str(e)}")
-        # Clean up files immediately on error
-        if temp_image:
-            cleanup_temp_file(temp_image.name)
-        if temp_file:
-            cleanup_temp_file(temp_file.name)
-        if output_path:
-            cleanup_temp_file(output_path)
-            
+        logger.error("Validation error during embedding: %s", e)
         # Return detailed error
         total_time = time.time() - process_start
+        metrics.count_error("validation_error")
         return JSONResponse(
             status_code=400,
             content={
@@ -146,17 +337,10 @@ async def embed_file(
         )
     except Exception as e:
         trace = traceback.format_exc()
-        logger.error(f"Unexpected error during embedding: {str(e)}\n{trace}")
-        # Clean up files immediately on error
-        if temp_image:
-            cleanup_temp_file(temp_image.name)
-        if temp_file:
-            cleanup_temp_file(temp_file.name)
-        if output_path:
-            cleanup_temp_file(output_path)
-            
+        logger.error("Unexpected error during embedding: %s\n%s", e, trace)
         # Return error info
         total_time = time.time() - process_start
+        metrics.count_error("server_error")
         return JSONResponse(
             status_code=500,
             content={
@@ -169,13 +353,91 @@ async def embed_file(
             }
         )
 
+@router.get("/capacity")
+async def carrier_capacity(
+    width: int,
+    height: int,
+    bits_per_channel: int = 1,
+    strategy: str = 'prime',
+    mode: str = 'RGB'
+):
+    try:
+        if mode not in lsb_engine.NATIVE_MODES:
+            raise ValueError(f"Unknown carrier mode: {mode} (expected one of: {', '.join(lsb_engine.NATIVE_MODES)})")
+        channels = lsb_engine.body_channels(mode, EMBED_ALPHA)
+        capacity = payload_capacity(width, height, bits_per_channel, strategy, channels=channels)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "width": width,
+        "height": height,
+        "mode": mode,
+        "channels": channels,
+        "bits_per_channel": bits_per_channel,
+        "strategy": strategy,
+        "capacity_bytes": capacity
+    }
+
+@router.post("/probe")
+async def probe(image: UploadFile = File(...)):
+    process_start = time.time()
+    
+    try:
+        if not image.content_type.startswith('image/'):
+            raise ValueError("Uploaded file must be an image")
+        
+        image_buffer = await read_upload(image)
+        info = await run_job(probe_image, image_buffer)
+        
+        total_time = time.time() - process_start
+        response = JSONResponse(content=info)
+        response.headers["X-Processing-Time"] = f"{total_time:.2f}s"
+        return response
+        
+    except UploadTooLarge as e:
+        return upload_too_large_response(e, process_start)
+    except (PoolSaturatedError, JobTimeoutError) as e:
+        return busy_response(e, process_start)
+    except ValueError as e:
+        logger.error("Validation error during probe: %s", e)
+        total_time = time.time() - process_start
+        metrics.count_error("validation_error")
+        return JSONResponse(
+            status_code=400,
+            content={
+                "detail": str(e),
+                "debug_info": {
+                    "process_time": f"{total_time:.2f}s",
+                    "image": image.filename,
+                    "error_type": "validation_error"
+                }
+            }
+        )
+    except Exception as e:
+        trace = traceback.format_exc()
+        logger.error("Unexpected error during probe: %s\n%s", e, trace)
+        total_time = time.time() - process_start
+        metrics.count_error("server_error")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "detail": "Internal server error during probe",
+                "debug_info": {
+                    "process_time": f"{total_time:.2f}s",
+                    "error": str(e),
+                    "error_type": "server_error"
+                }
+            }
+        )
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
+
 @router.post("/extract")
 async def extract_file(
-    background_tasks: BackgroundTasks,
     image: UploadFile = File(...)
 ):
-    temp_image = None
-    extracted_path = None
     process_start = time.time()
     
     try:
@@ -195,42 +457,40 @@ async def extract_file(
         if not image.content_type.startswith('image/'):
             raise ValueError("Uploaded file must be an image")
         
-        logger.info(f"Processing extraction request: {image.filename}")
-        
-        # Create temporary file
-        temp_image = tempfile.NamedTemporaryFile(delete=False)
+        logger.debug("Processing extraction request: %s", image.filename)
         
-        # Copy uploaded file to temporary file
+        # Stream uploaded file into memory
         try:
             debug_info["timestamps"]["copy_start"] = time.time()
-            image_content = await image.read()
-            debug_info["image"]["size"] = len(image_content)
-            temp_image.write(image_content)
+            image_buffer = await read_upload(image)
+            debug_info["image"]["size"] = image_buffer.getbuffer().nbytes
             debug_info["timestamps"]["copy_end"] = time.time()
             
-            logger.info(f"Image copied: {debug_info['image']['filename']} ({debug_info['image']['size']} bytes)")
+            logger.debug("Image received: %s (%s bytes)",
+                         debug_info['image']['filename'], debug_info['image']['size'])
             
+        except UploadTooLarge:
+            raise
         except Exception as e:
             trace = traceback.format_exc()
-            logger.error(f"Failed to process uploaded file: {str(e)}\n{trace}")
+            logger.error("Failed to process uploaded file: %s\n%s", e, trace)
             raise ValueError(f"Failed to process uploaded file: {str(e)}")
         
-        # Close the file to ensure all data is written
-        temp_image.close()
-        
-        # Perform the extraction
+        # Perform the extraction, unless this image was extracted before
         debug_info["timestamps"]["extract_start"] = time.time()
-        extracted_path = extract_file_from_image(temp_image.name)
+        key, cached = await cache_lookup('extract', image_buffer.getbuffer())
+        if cached is not None:
+            extracted = cached
+            logger.info("Returning cached extraction result")
+        else:
+            extracted = await run_job(extract_file_from_image, image_buffer)
+            await cache_store(key, CachedResult(*extracted))
+        base_filename = extracted.filename
         debug_info["timestamps"]["extract_end"] = time.time()
         
-        # Get the extracted filename
-        extracted_filename = os.path.basename(extracted_path)
-        base_filename = extracted_filename.split('_', 1)[1] if '_' in extracted_filename else extracted_filename
-        
         # Get extracted file size
-        extracted_size = os.path.getsize(extracted_path)
+        extracted_size = len(extracted.data)
         debug_info["extracted_file"] = {
-            "path": extracted_path,
             "size": extracted_size,
             "filename": base_filename
         }
@@ -239,34 +499,32 @@ async def extract_file(
         debug_info["timestamps"]["end"] = time.time()
         debug_info["total_time"] = total_time
         
-        logger.info(f"Extraction completed in {total_time:.2f}s. Extracted file: {base_filename} ({extracted_size} bytes)")
-        
-        # Schedule cleanup after response is sent
-        background_tasks.add_task(cleanup_temp_file, temp_image.name)
-        background_tasks.add_task(cleanup_temp_file, extracted_path)
+        logger.info("Extraction completed in %.2fs. Extracted file: %s (%s bytes)",
+                    total_time, base_filename, extracted_size)
         
         # Add debugging headers
-        response = FileResponse(
-            extracted_path,
-            filename=base_filename
+        response = file_response(
+            extracted.data,
+            base_filename,
+            extracted.mime_type or None
         )
         
         # Add custom headers with debug info
         response.headers["X-Processing-Time"] = f"{total_time:.2f}s"
+        response.headers["X-Cache"] = "HIT" if cached is not None else "MISS"
         response.headers["X-Extraction-Info"] = f"Source: {debug_info['image']['size']} bytes, Extracted: {extracted_size} bytes"
         
         return response
         
+    except UploadTooLarge as e:
+        return upload_too_large_response(e, process_start)
+    except (PoolSaturatedError, JobTimeoutError) as e:
+        return busy_response(e, process_start)
     except ValueError as e:
-        logger.error(f"Validation error during extraction: {str(e)}")
-        # Clean up files immediately on error
-        if temp_image:
-            cleanup_temp_file(temp_image.name)
-        if extracted_path:
-            cleanup_temp_file(extracted_path)
-            
+        logger.error("Validation error during extraction: %s", e)
         # Return detailed error
         total_time = time.time() - process_start
+        metrics.count_error("validation_error")
         return JSONResponse(
             status_code=400,
             content={
@@ -280,15 +538,10 @@ async def extract_file(
         )
     except Exception as e:
         trace = traceback.format_exc()
-        logger.error(f"Unexpected error during extraction: {str(e)}\n{trace}")
-        # Clean up files immediately on error
-        if temp_image:
-            cleanup_temp_file(temp_image.name)
-        if extracted_path:
-            cleanup_temp_file(extracted_path)
-            
+        logger.error("Unexpected error during extraction: %s\n%s", e, trace)
         # Return error info
         total_time = time.time() - process_start
+        metrics.count_error("server_error")
         return JSONResponse(
             status_code=500,
             content={
@@ -0,0 +1,156 @@
+from fastapi import APIRouter, UploadFile, File, Form
+from fastapi.responses import JSONResponse
+from ..services.embed_service import embed_file_in_image, validate_output, OUTPUT_FORMATS
+from ..services.compression import validate_compression
+from ..services.job_store import Job, job_store
+from ..services.jobs import submit, JobQueueFullError
+from ..services import metrics, payload_format
+from ..config import COMPRESSION, MAX_QUEUED_JOBS
+from .embed import read_upload, UploadTooLarge, upload_too_large_response, file_response
+from pathlib import Path
+from typing import Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/embed/jobs", tags=["jobs"])
+
+def job_status(job: Job) -> dict:
+    """Public view of a job: state, progress of the current stage and, when done, the result"""
+    status = {
+        "job_id": job.id,
+        "status": job.status,
+        "stage": job.stage or None,
+        "progress": {
+            "bytes_done": job.done,
+            "bytes_total": job.total,
+            "percent": 100.0 if job.status == 'done' else
+                       round(100 * job.done / job.total, 1) if job.total else 0.0
+        },
+        "created_at": job.created,
+        "updated_at": job.updated,
+        "expires_at": job.expires or None,
+        "error": job.error or None,
+        "error_type": job.error_type or None,
+        "retryable": job.retryable,
+        "status_url": router.url_path_for("get_job", job_id=job.id),
+        "result_url": None
+    }
+    if job.status == 'done':
+        status["result_url"] = router.url_path_for("get_job_result", job_id=job.id)
+        status["result"] = {"filename": job.filename, "mime_type": job.mime_type, "size": job.result_size}
+    return status
+
+def job_not_found(job_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=404,
+        content={"detail": f"Job {job_id} not found (it may have expired)"}
+    )
+
+@router.post("")
+async def create_embed_job(
+    carrier_image: UploadFile = File(...),
+    file_to_embed: UploadFile = File(...),
+    bits_per_channel: int = Form(1),
+    strategy: str = Form('prime'),
+    seed: Optional[int] = Form(None),
+    output_format: str = Form('png'),
+    compress_level: Optional[int] = Form(None),
+    optimize: bool = Form(False),
+    compression: str = Form(COMPRESSION)
+):
+    process_start = time.time()
+
+    try:
+        if not carrier_image.content_type.startswith('image/'):
+            raise ValueError("Carrier file must be an image")
+        payload_format.validate_layout(bits_per_channel, strategy)
+        validate_output(output_format, compress_level)
+        validate_compression(compression)
+
+        carrier_buffer = await read_upload(carrier_image)
+        embed_buffer = await read_upload(file_to_embed)
+
+        output_type = OUTPUT_FORMATS[output_format]
+        job = submit(
+            embed_file_in_image,
+            carrier_buffer,
+            embed_buffer.getvalue(),
+            result_filename=f"embedded_{Path(carrier_image.filename or 'carrier').stem}{output_type.extension}",
+            result_mime_type=output_type.mime_type,
+            filename=file_to_embed.filename or '',
+            mime_type=file_to_embed.content_type or '',
+            bits_per_channel=bits_per_channel,
+            strategy=strategy,
+            seed=seed,
+            output_format=output_format,
+            compress_level=compress_level,
+            optimize=optimize,
+            compression=compression
+        )
+        logger.info("Accepted embedding job %s: %s + %s", job.id, carrier_image.filename, file_to_embed.filename)
+        return JSONResponse(status_code=202, content=job_status(job))
+
+    except UploadTooLarge as e:
+        return upload_too_large_response(e, process_start)
+    except JobQueueFullError as e:
+        logger.error("Job queue full: %s", e)
+        metrics.count_error("job_queue_full")
+        return JSONResponse(
+            status_code=503,
+            content={
+                "detail": str(e),
+                "debug_info": {
+                    "max_queued_jobs": MAX_QUEUED_JOBS,
+                    "error_type": "job_queue_full"
+                }
+            },
+            headers={"Retry-After": "5"}
+        )
+    except ValueError as e:
+        logger.error("Validation error in embedding job request: %s", e)
+        total_time = time.time() - process_start
+        metrics.count_error("validation_error")
+        return JSONResponse(
+            status_code=400,
+            content={
+                "detail": str(e),
+                "debug_info": {
+                    "process_time": f"{total_time:.2f}s",
+                    "carrier_image": carrier_image.filename,
+                    "file_to_embed": file_to_embed.filename,
+                    "error_type": "validation_error"
+                }
+            }
+        )
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    return job_status(job)
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    if job.status != 'done':
+        return JSONResponse(status_code=409, content={
+            "detail": f"Job {job_id} is {job.status}, no result to download",
+            "job": job_status(job)
+        })
+
+    data = await asyncio.to_thread(job_store.get_result, job_id)
+    if data is None:
+        return job_not_found(job_id)
+    return file_response(data, job.filename, job.mime_type)
+
+@router.delete("/{job_id}")
+async def delete_job(job_id: str):
+    """Forget a job and its result; a job still queued is never started"""
+    if not job_store.delete(job_id):
+        return job_not_found(job_id)
+    return {"job_id": job_id, "deleted": True}
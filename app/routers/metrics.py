@@ -0,0 +1,48 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..services import metrics
+from ..config import SERVER_TIMING
+import time
+
+router = APIRouter(tags=["metrics"])
+
+class MetricsMiddleware:
+    """Tracks in-flight requests, times sending the response and adds Server-Timing headers
+
+    The Server-Timing header goes out with the response start, so it covers every
+    stage except sending the response itself, which is recorded as 'response'.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings, token = metrics.start_request_timings()
+        response_start = None
+
+        async def send_with_metrics(message):
+            nonlocal response_start
+            if message["type"] == "http.response.start":
+                response_start = time.perf_counter()
+                if SERVER_TIMING and timings:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", metrics.server_timing(timings).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                metrics.observe_stage('response', time.perf_counter() - response_start)
+
+        metrics.IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            metrics.IN_FLIGHT.dec()
+            metrics.reset_request_timings(token)
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
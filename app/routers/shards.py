@@ -0,0 +1,142 @@
+from fastapi import APIRouter, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from ..services.embed_service import validate_output, OUTPUT_FORMATS
+from ..services.batch_service import BatchItem
+from ..services.shards import Reassembler, split_payload, embed_shard, extract_shard
+from ..services.compression import validate_compression
+from ..services.executor import run_job, PoolSaturatedError, JobTimeoutError
+from ..services import metrics, payload_format
+from ..config import WORKERS, COMPRESSION
+from .embed import busy_response, content_disposition
+from .batch import read_batch_uploads, check_batch, batch_response, batch_error_response
+from typing import List, Optional
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/embed/shards", tags=["shards"])
+
+@router.post("/embed")
+async def shard_embed(
+    carriers: List[UploadFile] = File(...),
+    file_to_embed: UploadFile = File(...),
+    bits_per_channel: int = Form(1),
+    strategy: str = Form('prime'),
+    seed: Optional[int] = Form(None),
+    image_format: str = Form('png'),
+    compress_level: Optional[int] = Form(None),
+    optimize: bool = Form(False),
+    compression: str = Form(COMPRESSION),
+    output_format: str = Form('zip', alias='format')
+):
+    """Split one payload over several carriers; the embedded images come back in carrier order"""
+    process_start = time.time()
+
+    try:
+        payload_format.validate_layout(bits_per_channel, strategy)
+        validate_output(image_format, compress_level)
+        validate_compression(compression)
+        check_batch(len(carriers), output_format)
+        contents = await read_batch_uploads(carriers + [file_to_embed])
+        payload = contents.pop()
+        # Compress and split in a worker; fails here, before any pixel work, if the carriers are too small
+        mime_type, shards = await run_job(split_payload, contents, payload, file_to_embed.filename or '',
+                                          file_to_embed.content_type or '', bits_per_channel, strategy,
+                                          image_format, compression)
+    except ValueError as e:
+        return batch_error_response(e, process_start)
+    except (PoolSaturatedError, JobTimeoutError) as e:
+        return busy_response(e, process_start)
+
+    logger.info("Processing sharded embedding request: %s bytes over %s carriers", len(payload), len(carriers))
+    items = [
+        BatchItem(carrier.filename or f"carrier{index}", contents[index], shard, file_to_embed.filename or '',
+                  mime_type)
+        for index, (carrier, shard) in enumerate(zip(carriers, shards))
+    ]
+    digits = len(str(len(items)))
+
+    async def process(index: int, item: BatchItem):
+        output = await run_job(
+            embed_shard,
+            item.image,
+            item.payload,
+            filename=item.payload_name,
+            mime_type=item.payload_mime,
+            bits_per_channel=bits_per_channel,
+            strategy=strategy,
+            seed=seed,
+            output_format=image_format,
+            compress_level=compress_level,
+            optimize=optimize
+        )
+        output_type = OUTPUT_FORMATS[image_format]
+        name = f"shard_{index + 1:0{digits}}_of_{len(items)}_{os.path.splitext(item.name)[0]}{output_type.extension}"
+        return output, name, output_type.mime_type
+
+    return batch_response(items, process, output_format, process_start)
+
+@router.post("/extract")
+async def shard_extract(images: List[UploadFile] = File(...)):
+    """Reassemble a payload from the images holding its shards, in any order
+
+    Shards are extracted in parallel; the payload is streamed as soon as the
+    shards before each chunk have arrived. Errors found after the first shard
+    (a missing, corrupt or foreign shard) end the stream early, which clients
+    see as a body shorter than Content-Length.
+    """
+    process_start = time.time()
+    semaphore = asyncio.Semaphore(WORKERS)
+
+    async def extract(data: bytes):
+        async with semaphore:
+            return await run_job(extract_shard, data)
+
+    tasks = []
+    try:
+        check_batch(len(images), 'zip')
+        contents = await read_batch_uploads(images)
+        tasks = [asyncio.create_task(extract(data)) for data in contents]
+        arrivals = asyncio.as_completed(tasks)
+        first = await next(arrivals)
+        reassembler = Reassembler(first)
+        if reassembler.count != len(images):
+            raise ValueError(f"Got {len(images)} images, the payload was split into {reassembler.count} shards")
+    except ValueError as e:
+        for task in tasks:
+            task.cancel()
+        return batch_error_response(e, process_start)
+    except (PoolSaturatedError, JobTimeoutError) as e:
+        for task in tasks:
+            task.cancel()
+        return busy_response(e, process_start)
+
+    logger.info("Processing sharded extraction request: %s shards", len(images))
+
+    async def stream():
+        try:
+            chunk = reassembler.add(first)
+            if chunk:
+                yield chunk
+            for arrival in arrivals:
+                chunk = reassembler.add(await arrival)
+                if chunk:
+                    yield chunk
+            reassembler.finish()
+            logger.info("Sharded extraction completed in %.2fs", time.time() - process_start)
+        except Exception as e:
+            metrics.count_error("validation_error" if isinstance(e, ValueError) else "server_error")
+            logger.error("Sharded extraction failed after the response started: %s", e)
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    headers = {
+        "Content-Disposition": content_disposition(first.filename),
+        "Content-Length": str(first.info.size),
+        "X-Shards": str(reassembler.count),
+    }
+    return StreamingResponse(stream(), media_type=first.mime_type or None, headers=headers)
@@ -0,0 +1,218 @@
+"""
+Batch helpers for EmPy
+Reads batch items from uploaded zip archives and writes batch results as a zip
+or multipart/mixed stream one entry at a time, so the response can be sent
+while later items are still being processed.
+"""
+
+import io
+import json
+import logging
+import os
+import posixpath
+import secrets
+import zipfile
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Folders of an embed archive; carriers and payloads are paired by file stem
+CARRIER_DIR = 'carriers'
+PAYLOAD_DIR = 'payloads'
+RESULTS_NAME = 'results.json'
+
+
+class BatchItem(NamedTuple):
+    name: str
+    image: bytes
+    payload: Optional[bytes] = None
+    payload_name: str = ''
+    payload_mime: str = ''
+
+
+class ItemResult(NamedTuple):
+    index: int
+    name: str
+    status: str
+    seconds: float
+    data: bytes = b''
+    filename: str = ''
+    mime_type: str = ''
+    error: str = ''
+
+    def summary(self, entry: str = '') -> dict:
+        """JSON-friendly description of the item without its data"""
+        info = {
+            "index": self.index,
+            "name": self.name,
+            "status": self.status,
+            "time": round(self.seconds, 4),
+        }
+        if self.status == 'ok':
+            info.update(output=entry or self.filename, size=len(self.data), mime_type=self.mime_type)
+        else:
+            info["error"] = self.error
+        return info
+
+
+def _archive_members(data: bytes, max_items: int, max_member_bytes: int,
+                     max_total_bytes: int) -> Dict[str, bytes]:
+    """Read the regular files of a zip archive, guarding against oversized members"""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError("Batch archive is not a valid zip file")
+
+    with archive:
+        infos = [info for info in archive.infolist()
+                 if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                 and not posixpath.basename(info.filename).startswith('.')]
+        if len(infos) > 2 * max_items:
+            raise ValueError(f"Batch archive has too many files (limit {max_items} items)")
+
+        total = 0
+        members = {}
+        for info in infos:
+            # Sizes come from the archive directory; check before inflating anything
+            if info.file_size > max_member_bytes:
+                raise ValueError(f"{info.filename} exceeds the {max_member_bytes} byte file limit")
+            total += info.file_size
+            if total > max_total_bytes:
+                raise ValueError(f"Batch archive expands beyond the {max_total_bytes} byte limit")
+            members[info.filename] = archive.read(info)
+    return members
+
+
+def read_embed_archive(data: bytes, max_items: int, max_member_bytes: int,
+                       max_total_bytes: int) -> List[BatchItem]:
+    """Pair carriers/<stem>.* with payloads/<stem>.* from an uploaded zip"""
+    members = _archive_members(data, max_items, max_member_bytes, max_total_bytes)
+    carriers, payloads = {}, {}
+    for path, content in members.items():
+        folder, _, name = path.partition('/')
+        stem = os.path.splitext(name)[0]
+        if folder == CARRIER_DIR and '/' not in name:
+            carriers[stem] = (name, content)
+        elif folder == PAYLOAD_DIR and '/' not in name:
+            payloads[stem] = (name, content)
+
+    missing = sorted(set(carriers) ^ set(payloads))
+    if missing:
+        raise ValueError(f"Unpaired files in batch archive: {', '.join(missing)} "
+                         f"(expected {CARRIER_DIR}/<name>.* and {PAYLOAD_DIR}/<name>.*)")
+    if not carriers:
+        raise ValueError(f"Batch archive has no {CARRIER_DIR}/ and {PAYLOAD_DIR}/ files")
+
+    items = []
+    for stem in sorted(carriers):
+        carrier_name, carrier = carriers[stem]
+        payload_name, payload = payloads[stem]
+        items.append(BatchItem(carrier_name, carrier, payload, payload_name))
+    return items
+
+
+def read_extract_archive(data: bytes, max_items: int, max_member_bytes: int,
+                         max_total_bytes: int) -> List[BatchItem]:
+    """Treat every file of an uploaded zip as an image to extract from"""
+    members = _archive_members(data, max_items, max_member_bytes, max_total_bytes)
+    if not members:
+        raise ValueError("Batch archive is empty")
+    return [BatchItem(posixpath.basename(path), content) for path, content in sorted(members.items())]
+
+
+def unique_name(name: str, used: set) -> str:
+    """Return `name`, or name-2, name-3 ... if it was already used in this batch"""
+    stem, ext = os.path.splitext(name)
+    candidate, counter = name, 1
+    while candidate in used:
+        counter += 1
+        candidate = f"{stem}-{counter}{ext}"
+    used.add(candidate)
+    return candidate
+
+
+class _Chunks:
+    """Write-only file object that hands out what has been written so far"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class ZipStream:
+    """Builds a zip archive incrementally; every call returns the bytes to send next
+
+    The output is not seekable, so zipfile writes data descriptors after each
+    entry instead of patching local headers.
+    """
+
+    media_type = 'application/zip'
+
+    def __init__(self):
+        self._out = _Chunks()
+        self._zip = zipfile.ZipFile(self._out, 'w', zipfile.ZIP_STORED)
+        # The summary is written last under RESULTS_NAME; items never take that name
+        self._used = {RESULTS_NAME}
+
+    def add(self, result: ItemResult) -> tuple:
+        """Write one item; returns (bytes to send, entry name)"""
+        if result.status != 'ok':
+            return b'', ''
+        entry = unique_name(result.filename, self._used)
+        self._zip.writestr(entry, result.data)
+        return self._out.take(), entry
+
+    def close(self, summary: dict) -> bytes:
+        self._zip.writestr(RESULTS_NAME, json.dumps(summary, indent=2))
+        self._zip.close()
+        return self._out.take()
+
+
+class MultipartStream:
+    """Builds a multipart/mixed body with one part per item and a final JSON summary
+
+    `disposition` turns a filename into a Content-Disposition header value.
+    """
+
+    def __init__(self, disposition: Callable[[str], str]):
+        self._disposition = disposition
+        self.boundary = secrets.token_hex(16)
+        self.media_type = f'multipart/mixed; boundary={self.boundary}'
+        # The summary is written last under RESULTS_NAME; items never take that name
+        self._used = {RESULTS_NAME}
+
+    def _part(self, data: bytes, headers: dict) -> bytes:
+        head = ''.join(f"{key}: {value}\r\n" for key, value in headers.items())
+        return f"--{self.boundary}\r\n{head}\r\n".encode('latin-1') + data + b"\r\n"
+
+    def add(self, result: ItemResult) -> tuple:
+        """Write one item; returns (bytes to send, part filename)"""
+        headers = {
+            "X-Item-Index": str(result.index),
+            "X-Item-Status": result.status,
+            "X-Item-Time": f"{result.seconds:.4f}s",
+        }
+        if result.status != 'ok':
+            headers["Content-Type"] = "application/json"
+            return self._part(json.dumps(result.summary()).encode('utf-8'), headers), ''
+
+        entry = unique_name(result.filename, self._used)
+        headers["Content-Type"] = result.mime_type or 'application/octet-stream'
+        headers["Content-Disposition"] = self._disposition(entry)
+        return self._part(result.data, headers), entry
+
+    def close(self, summary: dict) -> bytes:
+        headers = {"Content-Type": "application/json",
+                   "Content-Disposition": self._disposition(RESULTS_NAME)}
+        return self._part(json.dumps(summary).encode('utf-8'), headers) + f"--{self.boundary}--\r\n".encode('ascii')
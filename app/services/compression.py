@@ -0,0 +1,199 @@
+"""
+Payload compression for EmPy
+Compresses payloads before they are framed, so fewer bytes have to be spread
+over the carrier's pixels. The method used is recorded in the payload header
+flags (see payload_format.COMPRESSIONS) and undone on extraction.
+
+'auto' compresses a sample of the payload first and skips payloads that will
+not shrink (already compressed files, random data); the rest go through zstd
+when the zstandard package is installed, otherwise zlib. LZMA compresses
+tighter but far slower than the pixel work it saves, so it is only used when
+requested explicitly.
+"""
+
+import logging
+import lzma
+from typing import Tuple
+import zlib
+
+from .payload_format import COMPRESSIONS
+from ..config import MAX_DECOMPRESSED_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Oldest zstandard with ZstdDecompressionObj.eof, which decompress() needs to spot truncated frames
+ZSTANDARD_MIN_VERSION = (0, 15)
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+if zstandard is not None and tuple(map(int, zstandard.__version__.split('.')[:2])) < ZSTANDARD_MIN_VERSION:
+    logger.warning("zstandard %s is too old (need %s or later), zstd compression is disabled",
+                   zstandard.__version__, '.'.join(map(str, ZSTANDARD_MIN_VERSION)))
+    zstandard = None
+
+DECOMPRESS_ERRORS = (zlib.error, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard else ())
+
+# Values accepted for the compression option
+CHOICES = ('auto',) + COMPRESSIONS
+
+# Payloads smaller than this are never compressed by 'auto'; headers would eat the gain
+MIN_COMPRESS_BYTES = 256
+
+# 'auto' compresses this much of the payload to estimate the ratio
+SAMPLE_BYTES = 64 * 1024
+
+# 'auto' compresses only when the sample shrinks to at most this fraction of its size
+MAX_SAMPLE_RATIO = 0.9
+
+# Formats that are compressed already; 'auto' does not try them
+COMPRESSED_MIME_TYPES = (
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/avif', 'image/heic',
+    'application/zip', 'application/gzip', 'application/x-gzip', 'application/x-bzip2',
+    'application/x-xz', 'application/x-7z-compressed', 'application/x-rar', 'application/zstd',
+    'application/vnd.rar', 'application/x-rar-compressed', 'application/epub+zip',
+)
+COMPRESSED_MIME_PREFIXES = ('audio/', 'video/', 'application/vnd.openxmlformats-', 'application/vnd.oasis.')
+
+
+def available() -> Tuple[str, ...]:
+    """Compression methods usable in this installation"""
+    return tuple(method for method in COMPRESSIONS if method != 'zstd' or zstandard is not None)
+
+
+def validate_compression(compression: str) -> None:
+    """Reject unknown methods, and zstd when the zstandard package is missing"""
+    if compression not in CHOICES:
+        raise ValueError(f"Unknown compression: {compression} (expected one of: {', '.join(CHOICES)})")
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("zstd compression requires the zstandard package")
+
+
+def is_compressed_type(mime_type: str) -> bool:
+    return mime_type in COMPRESSED_MIME_TYPES or mime_type.startswith(COMPRESSED_MIME_PREFIXES)
+
+
+def choose(data: bytes, mime_type: str = '') -> str:
+    """Pick a method for 'auto': 'none' unless a sample of the payload compresses well"""
+    if len(data) < MIN_COMPRESS_BYTES or is_compressed_type(mime_type):
+        return 'none'
+    sample = memoryview(data)[:SAMPLE_BYTES]
+    if len(zlib.compress(sample, 1)) > len(sample) * MAX_SAMPLE_RATIO:
+        return 'none'
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def compress(data: bytes, compression: str = 'auto', mime_type: str = '') -> Tuple[str, bytes]:
+    """Compress a payload and return the method actually used with the result
+
+    The payload is kept as-is ('none') when compressing would not make it smaller.
+    """
+    validate_compression(compression)
+    method = choose(data, mime_type) if compression == 'auto' else compression
+    if method == 'none':
+        return method, data
+
+    if method == 'zlib':
+        packed = zlib.compress(data, 6)
+    elif method == 'lzma':
+        packed = lzma.compress(data, preset=6)
+    else:
+        packed = zstandard.ZstdCompressor(level=3).compress(data)
+
+    if len(packed) >= len(data):
+        logger.debug("%s did not shrink the payload, storing it uncompressed", method)
+        return 'none', data
+    return method, packed
+
+
+def decompress(data: bytes, compression: str, max_size: int = MAX_DECOMPRESSED_BYTES) -> bytes:
+    """Undo `compress`; refuses outputs larger than `max_size` bytes"""
+    if compression == 'none':
+        return data
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("Payload is zstd-compressed, which requires the zstandard package")
+
+    try:
+        if compression == 'zlib':
+            decompressor = zlib.decompressobj()
+            output = decompressor.decompress(data, max_size + 1)
+            complete = decompressor.eof
+        elif compression == 'lzma':
+            decompressor = lzma.LZMADecompressor()
+            output = decompressor.decompress(data, max_size + 1)
+            complete = decompressor.eof
+        else:
+            # The frame header records the content size (see StreamDecompressor); check it before inflating
+            content_size = zstandard.frame_content_size(data)
+            if content_size < 0 or content_size > max_size:
+                raise ValueError(f"Embedded payload expands beyond {max_size} bytes")
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+            output = decompressor.decompress(data)
+            complete = decompressor.eof
+    except DECOMPRESS_ERRORS as e:
+        raise ValueError(f"Embedded payload is corrupt: {str(e)}")
+
+    if len(output) > max_size:
+        raise ValueError(f"Embedded payload expands beyond {max_size} bytes")
+    if not complete:
+        raise ValueError("Embedded payload is truncated")
+    return output
+
+
+class StreamDecompressor:
+    """Undoes `compress` on a payload that arrives in pieces; refuses outputs larger than `max_size` bytes
+
+    zstd frames are only decompressed once their header shows a content size
+    within the limit (the zstd compressor above always records it).
+    """
+
+    def __init__(self, compression: str, max_size: int = MAX_DECOMPRESSED_BYTES):
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("Payload is zstd-compressed, which requires the zstandard package")
+        self.compression = compression
+        self.max_size = max_size
+        self.size = 0
+        self._pending = b''
+        self._checked = False
+        if compression == 'zlib':
+            self._decompressor = zlib.decompressobj()
+        elif compression == 'lzma':
+            self._decompressor = lzma.LZMADecompressor()
+        elif compression == 'zstd':
+            self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def _feed_zstd(self, data: bytes) -> bytes:
+        if not self._checked:
+            self._pending += data
+            try:
+                content_size = zstandard.frame_content_size(self._pending)
+            except zstandard.ZstdError:
+                return b''  # frame header not complete yet
+            if content_size < 0 or content_size > self.max_size:
+                raise ValueError(f"Embedded payload expands beyond {self.max_size} bytes")
+            data, self._pending, self._checked = self._pending, b'', True
+        return self._decompressor.decompress(data)
+
+    def feed(self, data: bytes) -> bytes:
+        """Decompress the next piece of the payload and return the output it completes"""
+        if self.compression == 'none':
+            output = data
+        else:
+            try:
+                if self.compression == 'zstd':
+                    output = self._feed_zstd(data)
+                else:
+                    output = self._decompressor.decompress(data, self.max_size - self.size + 1)
+            except (EOFError,) + DECOMPRESS_ERRORS as e:
+                raise ValueError(f"Embedded payload is corrupt: {str(e)}")
+        self.size += len(output)
+        if self.size > self.max_size:
+            raise ValueError(f"Embedded payload expands beyond {self.max_size} bytes")
+        return output
+
+    def finish(self) -> None:
+        """Check that the whole payload was fed"""
+        if self.compression != 'none' and not self._decompressor.eof:
+            raise ValueError("Embedded payload is truncated")
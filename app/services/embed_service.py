@@ -1,211 +1,571 @@
 from PIL import Image
+import contextlib
+import functools
+import io
 import os
-import tempfile
 import logging
+import math
 import time
-import sys
 import base64
-import magic
-from stegano import lsb
-from stegano.lsb import generators
-import hashlib
-
-# Configure more detailed logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+import secrets
+from typing import BinaryIO, Callable, ContextManager, Iterator, NamedTuple, Optional, Tuple, Union
+import numpy as np
+from . import compression as payload_compression, file_types, lsb_engine, metrics, payload_format, pixel_buffer
+from ..config import COMPRESSION, EMBED_ALPHA, MAX_CARRIER_PIXELS, PNG_COMPRESS_LEVEL
+
 logger = logging.getLogger(__name__)
 
-def get_file_extension(file_path: str) -> str:
-    """Get file extension using python-magic"""
-    try:
-        mime = magic.Magic(mime=True)
-        mime_type = mime.from_file(file_path)
-        logger.info(f"Detected MIME type: {mime_type}")
-        
-        # Map common MIME types to extensions
-        mime_to_ext = {
-            'application/pdf': '.pdf',
-            'image/jpeg': '.jpg',
-            'image/png': '.png',
-            'image/gif': '.gif',
-            'application/msword': '.doc',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
-            'application/vnd.ms-excel': '.xls',
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': '.xlsx',
-            'application/zip': '.zip',
-            'application/x-rar-compressed': '.rar',
-            'application/x-7z-compressed': '.7z',
-            'text/plain': '.txt',
-            'text/html': '.html',
-            'application/json': '.json',
-            'application/xml': '.xml',
-            'application/x-msdownload': '.exe',  # Added for Windows executables
-            'application/x-dosexec': '.exe',     # Alternative MIME type for executables
-            'application/octet-stream': '.bin'  # Default for unknown binary
-        }
-        
-        extension = mime_to_ext.get(mime_type, '.bin')
-        logger.info(f"Using extension: {extension}")
-        return extension
-    except Exception as e:
-        logger.error(f"Error detecting file type: {str(e)}")
-        return '.bin'  # Default extension if detection fails
+def is_binary_data(data: bytes) -> bool:
+    """Check if data is binary by looking for non-text characters in the first 1024 bytes"""
+    return any(byte > 127 for byte in bytes(data[:1024]))
+
+# Carriers can be a path, a binary file object, raw encoded bytes or an open Pillow image
+ImageSource = Union[str, BinaryIO, bytes, bytearray, memoryview, Image.Image]
+
+def source_name(source: ImageSource) -> str:
+    """Readable name of a file path or in-memory buffer for log messages"""
+    if isinstance(source, str):
+        return os.path.basename(source)
+    if isinstance(source, Image.Image):
+        return os.path.basename(getattr(source, 'filename', '') or '<image>')
+    return os.path.basename(getattr(source, 'name', '') or '<buffer>')
+
+def open_image(source: ImageSource) -> ContextManager[Image.Image]:
+    """Open a carrier from any supported source without touching the disk for buffers"""
+    if isinstance(source, Image.Image):
+        # Images passed in stay owned (and open) by the caller
+        return contextlib.nullcontext(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif hasattr(source, 'seek'):
+        # The same buffer may be opened again, e.g. after a header-only pass
+        source.seek(0)
+    return Image.open(source)
+
+# Leading bytes of the prime stream that identify a container or a legacy message
+HEAD_BYTES = max(payload_format.HEADER_SIZE, lsb_engine.MAX_PREFIX_LENGTH)
+
+# Leading pixels holding HEAD_BYTES on any carrier; single-channel carriers need the most
+HEAD_PIXELS = lsb_engine.head_pixel_count(HEAD_BYTES, 1)
 
-def is_binary_file(file_path: str) -> bool:
-    """Check if a file is binary by looking for non-text characters"""
+@contextlib.contextmanager
+def carrier_pixels(img: Image.Image, mode: str) -> Iterator[np.ndarray]:
+    """Flat pixel array of a whole carrier in `mode`, valid until the block exits
+
+    Large carriers are decoded into a memory-mapped scratch buffer, which is
+    released (with its scratch space reservation) when the block exits.
+    """
+    if pixel_buffer.use_mapped(img.size, mode):
+        with pixel_buffer.mapped_image(img, mode) as (_, pixels):
+            yield pixels
+    else:
+        with metrics.stage('decode'):
+            pixels = lsb_engine.load_pixels(img, mode)
+        yield pixels
+
+def load_leading_pixels(img: Image.Image, pixel_count: int, buffers: contextlib.ExitStack) -> Tuple[np.ndarray, bool]:
+    """Decode only as many rows as the first `pixel_count` pixels need, when the format allows it
+
+    A non-interlaced PNG is one zlib tile decoded top to bottom, so shrinking the
+    tile stops the decoder after those rows. Anything else is decoded in full,
+    into a buffer that stays valid until `buffers` is closed.
+    Returns the flat pixels, in the carrier mode of `img`, and whether they cover
+    the whole image; `img` must not be used afterwards.
+    """
+    mode = lsb_engine.carrier_mode(img)
+    rows = -(-pixel_count // img.width)
+    if (img.format == 'PNG' and rows < img.height and len(img.tile) == 1
+            and img.tile[0][0] == 'zip' and not img.info.get('interlace')):
+        decoder, _, offset, args = img.tile[0]
+        img.tile = [(decoder, (0, 0, img.width, rows), offset, args)]
+        img._size = (img.width, rows)
+        with metrics.stage('decode'):
+            return lsb_engine.load_pixels(img, mode), False
+    return buffers.enter_context(carrier_pixels(img, mode)), True
+
+def read_leading_pixels(image: ImageSource, pixel_count: int,
+                        buffers: contextlib.ExitStack) -> Tuple[tuple, str, np.ndarray, bool]:
+    """Open an image and decode its first `pixel_count` pixels; returns (size, carrier mode, pixels, complete)
+
+    The pixels stay valid until `buffers` is closed.
+    """
+    with open_image(image) as img:
+        size, mode = img.size, lsb_engine.carrier_mode(img)
+        pixels, complete = load_leading_pixels(img, pixel_count, buffers)
+    return size, mode, pixels, complete
+
+def is_embedded(head: bytes, legacy: bool = True) -> bool:
+    """Check the leading bytes of the prime stream for a container or, if `legacy`, a "<length>:" prefix
+
+    Legacy (stegano) messages only exist in RGB and RGBA images.
+    """
+    if payload_format.is_container(head):
+        return True
+    if not legacy:
+        return False
     try:
-        with open(file_path, 'rb') as f:
-            # Read first 1024 bytes
-            data = f.read(1024)
-            # Check for non-text characters
-            return any(byte > 127 for byte in data)
-    except Exception as e:
-        logger.error(f"Error checking file type: {str(e)}")
+        lsb_engine.parse_prefix(head)
+    except ValueError:
         return False
+    return True
+
+class OutputFormat(NamedTuple):
+    pillow_format: str
+    mime_type: str
+    extension: str
+    modes: Tuple[str, ...]  # carrier modes the format stores unchanged
+
+# Lossless formats the LSB data survives in; keys are the embed `output_format` values
+OUTPUT_FORMATS = {
+    'png': OutputFormat('PNG', 'image/png', '.png', tuple(lsb_engine.NATIVE_MODES)),
+    'webp': OutputFormat('WEBP', 'image/webp', '.webp', ('RGB', 'RGBA')),
+    'tiff': OutputFormat('TIFF', 'image/tiff', '.tiff', tuple(lsb_engine.NATIVE_MODES)),
+}
+
+def check_sample_range(mode: str, output_format: str, extrema: Callable[[], Tuple[int, int]]) -> None:
+    """Refuse 32-bit carriers that PNG output would clip
+
+    PNG stores 'I' images with 16 bits per sample, so samples outside 0-65535
+    would be clipped on encoding and the payload lost. `extrema` returns the
+    lowest and highest sample; it is only called for 'I' carriers going to PNG.
+    """
+    if mode != 'I' or OUTPUT_FORMATS[output_format].pillow_format != 'PNG':
+        return
+    low, high = extrema()
+    if low < 0 or high > 0xFFFF:
+        raise ValueError(f"Carrier samples range from {low} to {high}, but PNG output holds 0-65535; "
+                         f"use tiff output for this carrier")
+
+def validate_output(output_format: str, compress_level: Optional[int]) -> None:
+    """Reject output formats and compression levels the encoder does not support"""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format} "
+                         f"(expected one of: {', '.join(OUTPUT_FORMATS)})")
+    if compress_level is not None and not 0 <= compress_level <= 9:
+        raise ValueError("compress_level must be between 0 and 9")
+
+def encode_image(image: Image.Image, output_format: str = 'png', compress_level: Optional[int] = None,
+                 optimize: bool = False) -> bytes:
+    """Encode an image losslessly into memory
+
+    `compress_level` (0-9) trades encode time for size: zlib level for PNG,
+    method/effort for lossless WebP, and raw (0) vs. deflate for TIFF.
+    `optimize` asks the encoder for its smallest output regardless of time.
+    """
+    validate_output(output_format, compress_level)
+    level = PNG_COMPRESS_LEVEL if compress_level is None else compress_level
+    options = {}
+    if output_format == 'png':
+        options = {'compress_level': level, 'optimize': optimize}
+    elif output_format == 'webp':
+        # exact keeps the RGB values of fully transparent pixels, which carry data too.
+        # Effort stops at quality 80: above that libwebp gets many times slower for no gain.
+        level = 9 if optimize else level
+        options = {'lossless': True, 'exact': True,
+                   'method': round(level * 6 / 9), 'quality': round(level * 80 / 9)}
+    elif output_format == 'tiff':
+        options = {'compression': 'tiff_adobe_deflate' if level or optimize else 'raw'}
+    
+    buffer = io.BytesIO()
+    image.save(buffer, format=OUTPUT_FORMATS[output_format].pillow_format, **options)
+    return buffer.getvalue()
+
+class ExtractedFile(NamedTuple):
+    data: bytes
+    filename: str
+    mime_type: str
+
+def payload_capacity(width: int, height: int, bits_per_channel: int = 1, strategy: str = 'prime',
+                     filename: str = '', mime_type: str = '', channels: int = lsb_engine.CHANNELS) -> int:
+    """Maximum payload size in bytes for a carrier of the given size and layout
+
+    `channels` is the number of channels per pixel holding the body (see
+    lsb_engine.body_channels): 3 for RGB, 1 for grayscale, 4 for RGBA with alpha.
+    """
+    payload_format.validate_layout(bits_per_channel, strategy)
+    if width <= 0 or height <= 0:
+        raise ValueError("Carrier dimensions must be positive")
+    if Image.MAX_IMAGE_PIXELS and width * height > Image.MAX_IMAGE_PIXELS:
+        raise ValueError(f"Carrier larger than {Image.MAX_IMAGE_PIXELS} pixels is not supported")
+    _, name_length, mime_length = payload_format.pack_body(b'', filename, mime_type)
+    layout = lsb_engine.Layout(bits_per_channel, strategy, channels=channels)
+    try:
+        body = lsb_engine.body_capacity((width, height), layout, payload_format.HEADER_SIZE)
+    except ValueError:
+        return 0
+    return max(0, body - name_length - mime_length)
+
+def _no_progress(stage: str, done: int, total: int) -> None:
+    pass
+
+def fitted_size(size: tuple, max_pixels: int) -> tuple:
+    """Size of a carrier after fit_carrier"""
+    width, height = size
+    if not max_pixels or width * height <= max_pixels:
+        return size
+    scale = math.sqrt(max_pixels / (width * height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def carrier_capacity(image: ImageSource, bits_per_channel: int = 1, strategy: str = 'prime', filename: str = '',
+                     mime_type: str = '', output_format: str = 'png', use_alpha: Optional[bool] = None,
+                     max_pixels: Optional[int] = None) -> int:
+    """Payload capacity of a carrier as embed_file_in_image would use it, read from the image header only"""
+    use_alpha = EMBED_ALPHA if use_alpha is None else use_alpha
+    max_pixels = MAX_CARRIER_PIXELS if max_pixels is None else max_pixels
+    validate_output(output_format, None)
+    with open_image(image) as img:
+        mode = lsb_engine.carrier_mode(img, OUTPUT_FORMATS[output_format].modes)
+        size = fitted_size(img.size, max_pixels)
+    return payload_capacity(*size, bits_per_channel, strategy, filename, mime_type,
+                            lsb_engine.body_channels(mode, use_alpha))
+
+def fit_carrier(img: Image.Image, max_pixels: int, mode: str) -> Image.Image:
+    """Scale a carrier down to at most `max_pixels` pixels, keeping its aspect ratio (0 keeps its size)
+
+    JPEG carriers are first scaled by the decoder (draft), which skips most of the
+    decoding work; what remains, and other formats, is resized with Pillow's
+    reduce-then-resample shortcut.
+    """
+    width, height = img.size
+    target = fitted_size(img.size, max_pixels)
+    if target == img.size:
+        return img
+    if img.format == 'JPEG':
+        img.draft(img.mode, target)
+    if img.mode != mode:
+        with metrics.stage('convert'):
+            img = img.convert(mode)
+    if img.size != target:
+        with metrics.stage('resize'):
+            img = img.resize(target, Image.BOX, reducing_gap=2.0)
+    logger.debug("Scaled carrier from %sx%s to %sx%s", width, height, *img.size)
+    return img
+
+def embed_file_in_image(image: ImageSource, payload: Union[str, bytes, memoryview], filename: str = '',
+                        mime_type: str = '', bits_per_channel: int = 1, strategy: str = 'prime',
+                        seed: Optional[int] = None, output_format: str = 'png',
+                        compress_level: Optional[int] = None, optimize: bool = False,
+                        compression: Optional[str] = None, use_alpha: Optional[bool] = None,
+                        max_pixels: Optional[int] = None, shard: bool = False,
+                        progress: Optional[Callable[[str, int, int], None]] = None) -> bytes:
+    """Embeds a file into an image using LSB steganography and returns the encoded image
 
-def embed_file_in_image(image_path: str, file_path: str) -> str:
-    """Embeds a file into an image using LSB steganography with Stegano"""
+    `image` is a path, a binary file object, encoded image bytes or an open Pillow
+    image; `payload` is a path or the file's bytes (any bytes-like object, so upload
+    buffers can be passed without copying). Nothing is written to disk. The output
+    is PNG unless `output_format` selects another lossless format (see encode_image).
+    The payload is compressed first according to `compression` (default
+    EMPY_COMPRESSION, see compression.compress); extraction undoes it.
+    The carrier keeps its mode where the output format can store it (RGB, RGBA,
+    grayscale, 16-bit); `use_alpha` (default EMPY_EMBED_ALPHA) also writes the
+    body to the alpha channel of RGBA carriers. Carriers larger than `max_pixels`
+    (default EMPY_MAX_CARRIER_PIXELS, 0 for no limit) are scaled down first.
+    With `shard`, the payload is a shard built by shards.split_payload and the
+    container is flagged as one.
+    `progress`, if given, is called with (stage, bytes done, bytes total) as the
+    job moves through the compress, decode, embed and encode stages; the embed
+    stage reports after every chunk of pixels.
+    """
+    progress = progress or _no_progress
     start_time = time.time()
-    logger.info(f"Starting Stegano embedding process")
-    logger.info(f"Carrier image: {os.path.basename(image_path)}")
-    logger.info(f"File to embed: {os.path.basename(file_path)}")
+    logger.debug("Starting LSB embedding process")
+    logger.debug("Carrier image: %s", source_name(image))
     
     try:
+        if isinstance(payload, str):
+            filename = filename or os.path.basename(payload)
+            with open(payload, 'rb') as f:
+                payload = f.read()
+        logger.debug("File to embed: %s", filename or '<unnamed>')
+        
         # Log file details
-        file_size = os.path.getsize(file_path)
-        logger.info(f"File size: {file_size} bytes")
+        logger.debug("File size: %s bytes", len(payload))
         
         # Check if file is binary
-        is_binary = is_binary_file(file_path)
-        logger.info(f"File type: {'Binary' if is_binary else 'Text'}")
+        is_binary = is_binary_data(payload)
+        logger.debug("File type: %s", 'Binary' if is_binary else 'Text')
+        
+        # Shards are sniffed before they are split
+        if not shard and (not mime_type or mime_type == 'application/octet-stream'):
+            mime_type = file_types.detect_mime_type(payload)
+        
+        payload_format.validate_layout(bits_per_channel, strategy)
+        validate_output(output_format, compress_level)
+        compression = compression or COMPRESSION
+        payload_compression.validate_compression(compression)
+        use_alpha = EMBED_ALPHA if use_alpha is None else use_alpha
+        max_pixels = MAX_CARRIER_PIXELS if max_pixels is None else max_pixels
+        if strategy != 'shuffle':
+            seed = 0
+        elif seed is None:
+            seed = secrets.randbelow(2 ** 32)
         
-        # Use Stegano with Eratosthenes generator for better pixel selection
+        # Use the vectorized LSB engine with the requested pixel selection
         try:
             embed_start = time.time()
-            output_path = tempfile.mktemp(suffix='.png')
-            logger.info(f"Using Eratosthenes generator for pixel selection")
-            
-            # Convert image to RGB if needed
-            with Image.open(image_path) as img:
-                if img.mode != 'RGB':
-                    logger.info(f"Converting image from {img.mode} to RGB mode")
-                    img = img.convert('RGB')
-                    # Save the converted image to a temporary file
-                    temp_img_path = tempfile.mktemp(suffix='.png')
-                    img.save(temp_img_path)
-                    image_path = temp_img_path
-            
-            # Use Stegano's direct file embedding
-            logger.info("Starting Stegano hide operation")
-            if is_binary:
-                # For binary files, read and encode as base64
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
-                encoded_data = base64.b64encode(file_data).decode('utf-8')
-                secret = lsb.hide(image_path, encoded_data, generators.eratosthenes())
-            else:
-                # For text files, use direct file path
-                secret = lsb.hide(image_path, file_path, generators.eratosthenes())
+            logger.debug("Using %s pixel selection, %s bit(s) per channel", strategy, bits_per_channel)
             
-            secret.save(output_path)
+            # Frame the raw (or compressed) file bytes; no base64 inflation
+            compress_start = time.time()
+            progress('compress', 0, len(payload))
+            with metrics.stage('compress'):
+                method, stored = payload_compression.compress(payload, compression, mime_type)
+            if method != 'none':
+                logger.debug("Compressed payload with %s: %s -> %s bytes in %.2fs",
+                             method, len(payload), len(stored), time.time() - compress_start)
+            flags = (0 if is_binary else payload_format.FLAG_TEXT) | payload_format.compression_flags(method)
+            if shard:
+                flags |= payload_format.FLAG_SHARD
             
-            # Clean up temporary converted image if it was created
-            if 'temp_img_path' in locals():
-                os.remove(temp_img_path)
-            
-            embed_time = time.time() - embed_start
-            logger.info(f"Stegano hide operation completed in {embed_time:.2f}s")
-            
-            # Check output file details
-            output_size = os.path.getsize(output_path)
-            logger.info(f"Output image size: {output_size} bytes")
-            logger.info(f"Output saved to: {output_path}")
+            # The mapped buffer and its scratch file must outlive the encoder, which reads them
+            with open_image(image) as img, contextlib.ExitStack() as buffers:
+                mode = lsb_engine.carrier_mode(img, OUTPUT_FORMATS[output_format].modes)
+                img = fit_carrier(img, max_pixels, mode)
+                layout = lsb_engine.Layout(bits_per_channel, strategy, seed, lsb_engine.body_channels(mode, use_alpha))
+                if layout.channels == 4:
+                    flags |= payload_format.FLAG_ALPHA
+                header, body = payload_format.pack(stored, filename, mime_type, flags,
+                                                   bits_per_channel, strategy, seed)
+                logger.debug("Payload container: %s bytes (%s), %s carrier using %s channel(s)",
+                             len(header) + len(body), mime_type, mode, layout.channels)
+                
+                # Fail fast: only the image header has been read at this point (unless it was scaled)
+                capacity = payload_capacity(*img.size, bits_per_channel, strategy, channels=layout.channels)
+                if len(body) > capacity:
+                    raise ValueError(f"Carrier image too small: payload needs {len(body)} bytes, "
+                                     f"carrier holds {capacity} bytes with this layout")
+                
+                logger.debug("Starting LSB hide operation")
+                progress('decode', 0, len(body))
+                report = functools.partial(progress, 'embed')
+                if pixel_buffer.use_mapped(img.size, mode):
+                    # Large carrier: edit the decoded pixels in place, the encoder reads the same buffer
+                    secret, pixels = buffers.enter_context(pixel_buffer.mapped_image(img, mode))
+                    check_sample_range(mode, output_format, lambda: (int(pixels.min()), int(pixels.max())))
+                    with metrics.stage('bit_write'):
+                        lsb_engine.write_container(pixels, img.size, header, body, layout, report)
+                else:
+                    with metrics.stage('decode'):
+                        img.load()
+                    # Convert the image only if its mode has no native support; the engine
+                    # works on the pixel array in memory
+                    if img.mode != mode:
+                        logger.debug("Converting image from %s to %s mode", img.mode, mode)
+                        with metrics.stage('convert'):
+                            img = img.convert(mode)
+                    check_sample_range(mode, output_format, img.getextrema)
+                    with metrics.stage('bit_write'):
+                        secret = lsb_engine.hide_container(img, header, body, layout, report)
+                
+                embed_time = time.time() - embed_start
+                logger.debug("LSB hide operation completed in %.2fs", embed_time)
+                
+                encode_start = time.time()
+                progress('encode', len(body), len(body))
+                with metrics.stage('encode'):
+                    output = encode_image(secret, output_format, compress_level, optimize)
+            logger.debug("Encoded %s output in %.2fs", output_format.upper(), time.time() - encode_start)
+            logger.debug("Output image size: %s bytes", len(output))
             
         except Exception as e:
-            logger.error(f"Stegano hide operation failed: {str(e)}")
+            logger.error("LSB hide operation failed: %s", e)
             raise ValueError(f"Failed to embed data into image: {str(e)}")
         
         total_time = time.time() - start_time
-        logger.info(f"Embedding process completed successfully in {total_time:.2f}s")
-        return output_path
+        logger.info("Embedding process completed successfully in %.2fs", total_time)
+        metrics.add_payload_bytes('embed', len(payload))
+        return output
         
     except Exception as e:
         total_time = time.time() - start_time
-        logger.error(f"Error during embedding (after {total_time:.2f}s): {str(e)}")
+        logger.error("Error during embedding (after %.2fs): %s", total_time, e)
         raise ValueError(f"Failed to embed file: {str(e)}")
 
-def extract_file_from_image(image_path: str) -> str:
-    """Extracts an embedded file from an image using Stegano"""
+def _extract_legacy(pixels, size: tuple) -> ExtractedFile:
+    """Extract a stegano-style "<length>:" message written before the payload container"""
+    extracted_data = lsb_engine.reveal_pixels(pixels, size)
+    
+    # Old images hide binary files as base64 and text files as-is
+    try:
+        decoded_data = base64.b64decode(extracted_data, validate=True)
+    except ValueError:  # binascii.Error, or a message with non-ASCII characters
+        logger.debug("Treating legacy payload as text file")
+        return ExtractedFile(extracted_data.encode('utf-8'), 'extracted.txt', 'text/plain')
+    
+    logger.debug("Decoded legacy payload as base64 binary file")
+    mime_type = file_types.detect_mime_type(decoded_data)
+    return ExtractedFile(decoded_data, f"extracted{file_types.extension_for(mime_type)}", mime_type)
+
+def extract_file_from_image(image: ImageSource, shard: bool = False) -> ExtractedFile:
+    """Extracts an embedded file from an image using LSB steganography
+
+    `image` accepts the same sources as embed_file_in_image; the file is returned
+    in memory together with its original name and MIME type. Images holding a
+    shard are only accepted with `shard`, which returns the shard itself (see
+    shards.extract_shard).
+    """
     start_time = time.time()
-    logger.info(f"Starting Stegano extraction process")
-    logger.info(f"Source image: {os.path.basename(image_path)}")
+    logger.debug("Starting LSB extraction process")
+    logger.debug("Source image: %s", source_name(image))
     
     try:
-        # Use Stegano with Eratosthenes generator to extract the hidden data
+        # Use the vectorized LSB engine with Eratosthenes pixel selection
         try:
-            extract_start = time.time()
-            logger.info(f"Using Eratosthenes generator for extraction")
-            
-            # Use Stegano's direct file extraction
-            logger.info("Starting Stegano reveal operation")
-            extracted_data = lsb.reveal(image_path, generators.eratosthenes())
-            
-            # Try to decode as base64 first (binary file)
-            try:
-                logger.info("Attempting to decode as base64 (binary file)")
-                decoded_data = base64.b64decode(extracted_data)
+            with contextlib.ExitStack() as buffers:
+                extract_start = time.time()
+                logger.debug("Reading payload header from prime pixel indices")
+                    
+                logger.debug("Starting LSB reveal operation")
+                # Decode only the rows holding the header; images without one stop here
+                size, mode, pixels, complete = read_leading_pixels(image, HEAD_PIXELS, buffers)
+                channels = lsb_engine.NATIVE_MODES[mode]
+                head = lsb_engine.read_head(pixels, size, HEAD_BYTES, channels)
+                if not is_embedded(head, legacy=channels == lsb_engine.CHANNELS):
+                    raise ValueError("No embedded file found in this image")
+                    
+                # Then decode the whole image and read exactly the bytes the header announces
+                if not complete:
+                    img = buffers.enter_context(open_image(image))
+                    pixels = buffers.enter_context(carrier_pixels(img, mode))
+                    
+                if payload_format.is_container(head):
+                    header = payload_format.parse_header(head)
+                    if header.is_shard != shard:
+                        raise ValueError("This image holds one shard of a larger payload; extract it together "
+                                         "with the other shards" if header.is_shard else "This image holds no shard")
+                    if header.version == 1:
+                        # Version 1 bodies follow the header on the same prime stream
+                        if header.size + header.body_size > lsb_engine.stream_capacity(size, channels):
+                            raise ValueError("Embedded payload header is corrupt")
+                        with metrics.stage('bit_read'):
+                            stream = lsb_engine.read_bytes(pixels, size, header.size + header.body_size, channels)
+                        body = stream[header.size:]
+                    else:
+                        layout = lsb_engine.Layout(header.bits_per_channel, header.strategy, header.seed,
+                                                   lsb_engine.body_channels(mode, header.uses_alpha))
+                        logger.debug("Detected %s pixel selection, %s bit(s) per channel",
+                                     header.strategy, header.bits_per_channel)
+                        if header.body_size > lsb_engine.body_capacity(size, layout, header.size):
+                            raise ValueError("Embedded payload header is corrupt")
+                        with metrics.stage('bit_read'):
+                            body = lsb_engine.read_body(pixels, size, layout, header.size, header.body_size)
+                    payload = payload_format.unpack(header, body)
+                    data = payload.data
+                    if header.compression != 'none':
+                        with metrics.stage('decompress'):
+                            data = payload_compression.decompress(data, header.compression)
+                        logger.debug("Decompressed %s payload: %s -> %s bytes",
+                                     header.compression, len(payload.data), len(data))
+                        
+                    # The header records the MIME type; only sniff payloads embedded without one
+                    mime_type = payload.mime_type or file_types.detect_mime_type(data)
+                    filename = os.path.basename(payload.filename)
+                    if not filename:
+                        if mime_type:
+                            default_ext = file_types.extension_for(mime_type)
+                        else:
+                            default_ext = '.txt' if payload.flags & payload_format.FLAG_TEXT else '.bin'
+                        filename = f"extracted{default_ext}"
+                    extracted = ExtractedFile(data, filename, mime_type)
+                    logger.debug("Read payload container: %s (%s)", filename, mime_type)
+                elif shard:
+                    raise ValueError("This image holds no shard")
+                else:
+                    logger.debug("No payload container found, falling back to legacy format")
+                    with metrics.stage('bit_read'):
+                        extracted = _extract_legacy(pixels, size)
+                    
+                extract_time = time.time() - extract_start
+                logger.debug("LSB reveal operation completed in %.2fs", extract_time)
+                logger.debug("Extracted file size: %s bytes", len(extracted.data))
                 
-                # Create a temporary file to detect its type
-                temp_input = tempfile.mktemp(suffix='_temp')
-                with open(temp_input, 'wb') as f:
-                    f.write(decoded_data)
-                
-                # Get the correct extension
-                extension = get_file_extension(temp_input)
-                output_path = tempfile.mktemp(suffix=extension)
-                
-                # Save the decoded data with correct extension
-                with open(output_path, 'wb') as f:
-                    f.write(decoded_data)
-                
-                # Clean up temporary file
-                os.remove(temp_input)
-                
-                logger.info("Successfully decoded as binary file")
-            except:
-                # If base64 decode fails, treat as text
-                logger.info("Treating as text file")
-                output_path = tempfile.mktemp(suffix='.txt')
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(extracted_data)
+        except Exception as e:
+            logger.error("LSB reveal operation failed: %s", e)
+            raise ValueError(f"Failed to extract data from image: {str(e)}")
             
-            extract_time = time.time() - extract_start
-            logger.info(f"Stegano reveal operation completed in {extract_time:.2f}s")
+        total_time = time.time() - start_time
+        logger.info("Extraction process completed successfully in %.2fs", total_time)
+        metrics.add_payload_bytes('extract', len(extracted.data))
+        return extracted
             
-            # Log extraction details
-            if os.path.exists(output_path):
-                extracted_size = os.path.getsize(output_path)
-                logger.info(f"Extracted file size: {extracted_size} bytes")
-                logger.info(f"Extracted file saved to: {output_path}")
-            else:
-                logger.error("Extracted file was not created")
-                raise ValueError("Failed to create extracted file")
+    except Exception as e:
+        total_time = time.time() - start_time
+        logger.error("Error during extraction (after %.2fs): %s", total_time, e)
+        raise ValueError(f"Failed to extract file: {str(e)}")
+
+def probe_image(image: ImageSource) -> dict:
+    """Report whether an image carries a payload, and its size, without decoding the payload
+
+    Only the rows holding the header are decoded, plus, for containers, the rows
+    holding the filename and MIME type at the start of the body.
+    """
+    start_time = time.time()
+    try:
+        with contextlib.ExitStack() as buffers:
+            size, mode, pixels, complete = read_leading_pixels(image, HEAD_PIXELS, buffers)
+            channels = lsb_engine.NATIVE_MODES[mode]
+            head = lsb_engine.read_head(pixels, size, HEAD_BYTES, channels)
             
-        except Exception as e:
-            logger.error(f"Stegano reveal operation failed: {str(e)}")
-            raise ValueError(f"Failed to extract data from image: {str(e)}")
+            info = {"embedded": False, "format": None, "version": None, "filename": None,
+                    "mime_type": None, "payload_size": 0, "stored_size": 0, "compression": None}
+            layout = lsb_engine.Layout(channels=lsb_engine.body_channels(mode, EMBED_ALPHA))
+            filename = mime_type = ''
+            if payload_format.is_container(head):
+                header = payload_format.parse_header(head)
+                meta_size = header.name_length + header.mime_length
+                # A shard's manifest entry, which records the size of the whole payload, opens its data
+                lead_size = meta_size + min(header.length, payload_format.SHARD.size if header.is_shard else 0)
+                if header.version == 1:
+                    # Version 1 metadata follows the header on the prime stream
+                    layout = lsb_engine.Layout(channels=channels)
+                    needed = lsb_engine.head_pixel_count(header.size + lead_size, channels)
+                    if not complete and needed > len(pixels):
+                        size, mode, pixels, complete = read_leading_pixels(image, needed, buffers)
+                    meta = lsb_engine.read_head(pixels, size, header.size + lead_size, channels)[header.size:]
+                else:
+                    layout = lsb_engine.Layout(header.bits_per_channel, header.strategy, header.seed,
+                                               lsb_engine.body_channels(mode, header.uses_alpha))
+                    if header.body_size > lsb_engine.body_capacity(size, layout, header.size):
+                        raise ValueError("Embedded payload header is corrupt")
+                    indices = lsb_engine.body_indices(size, layout, header.size,
+                                                      lsb_engine.pixels_for_bytes(lead_size, layout.bits_per_channel,
+                                                                                  layout.channels))
+                    needed = int(indices.max()) + 1 if len(indices) else 0
+                    if not complete and needed > len(pixels):
+                        size, mode, pixels, complete = read_leading_pixels(image, needed, buffers)
+                    meta = lsb_engine.read_body(pixels, size, layout, header.size, lead_size)
+                
+                metadata = payload_format.unpack(header._replace(length=0), meta[:meta_size])
+                filename, mime_type = metadata.filename, metadata.mime_type
+                info.update(embedded=True, format='container', version=header.version, filename=filename,
+                            mime_type=mime_type, stored_size=header.length, compression=header.compression,
+                            # Compressed payloads do not record their original size
+                            payload_size=header.length if header.compression == 'none' else None)
+                if header.is_shard:
+                    manifest = payload_format.shard_manifest(meta[meta_size:])
+                    info.update(format='shard', payload_size=manifest.size, compression=manifest.compression,
+                                shard_index=manifest.index + 1, shard_count=manifest.count)
+            elif is_embedded(head, legacy=channels == lsb_engine.CHANNELS):
+                _, length = lsb_engine.parse_prefix(head)
+                info.update(embedded=True, format='legacy', payload_size=length, stored_size=length)
         
-        total_time = time.time() - start_time
-        logger.info(f"Extraction process completed successfully in {total_time:.2f}s")
-        return output_path
+        capacity = payload_capacity(*size, layout.bits_per_channel, layout.strategy, filename, mime_type,
+                                    layout.channels)
+        info.update(
+            width=size[0],
+            height=size[1],
+            mode=mode,
+            channels=layout.channels,
+            bits_per_channel=layout.bits_per_channel,
+            strategy=layout.strategy,
+            capacity_bytes=capacity,
+            remaining_bytes=max(0, capacity - info["stored_size"]),
+            decoded_rows=len(pixels) // size[0],
+        )
+        logger.info("Probed %s in %.3fs: %s bytes of payload stored", source_name(image), time.time() - start_time,
+                    info["stored_size"])
+        return info
         
     except Exception as e:
-        total_time = time.time() - start_time
-        logger.error(f"Error during extraction (after {total_time:.2f}s): {str(e)}")
-        raise ValueError(f"Failed to extract file: {str(e)}") 
\ No newline at end of file
+        logger.error("Error during probe: %s", e)
+        raise ValueError(f"Failed to probe image: {str(e)}")
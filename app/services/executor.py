@@ -0,0 +1,128 @@
+"""
+Execution layer for EmPy
+Runs the CPU-bound embed/extract service functions off the event loop, in a
+warmed-up process pool with a bounded queue and a per-job timeout.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+from typing import Callable, Optional
+
+from . import metrics
+from ..log_config import call_sampled, debug_sampled
+from ..config import EXECUTOR, WORKERS, MAX_PENDING_JOBS, JOB_TIMEOUT, WARM_CARRIER_SIZES
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when every worker is busy and the pending queue is full"""
+
+
+class JobTimeoutError(TimeoutError):
+    """Raised when a job does not finish within JOB_TIMEOUT seconds"""
+
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+_in_flight = 0
+
+
+def _warm_up_worker() -> None:
+    """Pool initializer: import the engine and pre-build common index sequences"""
+    from . import embed_service  # noqa: F401
+    from .pixel_index import get_pixel_indices
+
+    for width, height in WARM_CARRIER_SIZES:
+        get_pixel_indices(width, height)
+
+
+def _ping() -> bool:
+    return True
+
+
+def get_executor() -> Optional[Executor]:
+    """Return the shared executor, creating it on first use (None when running inline)"""
+    global _executor
+    if EXECUTOR == 'inline':
+        return None
+    with _executor_lock:
+        if _executor is None:
+            if EXECUTOR == 'thread':
+                _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='empy-worker',
+                                               initializer=_warm_up_worker)
+            else:
+                _executor = ProcessPoolExecutor(max_workers=WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=_warm_up_worker)
+            logger.info("Started %s executor with %s worker(s)", EXECUTOR, WORKERS)
+        return _executor
+
+
+def start_pool() -> None:
+    """Create the executor and wait until every worker has started and warmed up"""
+    executor = get_executor()
+    if executor is None:
+        return
+    start = time.time()
+    for future in [executor.submit(_ping) for _ in range(WORKERS)]:
+        future.result()
+    logger.info("Worker pool warmed up in %.2fs", time.time() - start)
+
+
+def shutdown_pool() -> None:
+    """Stop the executor, cancelling jobs that have not started yet"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+
+
+def queue_depth() -> int:
+    """Number of jobs submitted and not yet finished"""
+    return _in_flight
+
+
+metrics.Gauge('empy_pool_queue_depth', "Jobs submitted to the worker pool and not yet finished", queue_depth)
+
+
+def _release(_future) -> None:
+    global _in_flight
+    _in_flight -= 1
+
+
+async def run_job(func: Callable, *args, timeout: float = JOB_TIMEOUT, **kwargs):
+    """Run a service function in the pool without blocking the event loop
+
+    Raises PoolSaturatedError when WORKERS + MAX_PENDING_JOBS jobs are already
+    queued, and JobTimeoutError when the job takes longer than `timeout`. A job
+    that timed out keeps its slot until the worker really finishes it. Stage
+    timings and counters the function records are replayed here (see metrics).
+    """
+    global _in_flight
+    executor = get_executor()
+    if executor is None:
+        result, events = metrics.call_with_events(func, *args, **kwargs)
+        metrics.replay(events)
+        return result
+
+    if _in_flight >= WORKERS + MAX_PENDING_JOBS:
+        raise PoolSaturatedError("All workers are busy, try again later")
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, functools.partial(call_sampled, debug_sampled(), metrics.call_with_events,
+                                                              func, *args, **kwargs))
+    _in_flight += 1
+    future.add_done_callback(_release)
+    try:
+        result, events = await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        raise JobTimeoutError(f"Job did not finish within {timeout:.0f}s")
+    metrics.replay(events)
+    return result
@@ -0,0 +1,117 @@
+"""
+File type detection for EmPy
+Sniffs the MIME type of in-memory payloads with libmagic and maps MIME types
+to file extensions.
+
+Opening a libmagic handle loads its whole database, so each process (every
+pool worker) opens one on first use and keeps it; a lock serialises access
+because a handle must not be used by two threads at once. Only the first
+DETECT_BYTES bytes of a buffer are looked at.
+"""
+
+import logging
+import mimetypes
+import threading
+from typing import Optional
+
+import magic
+
+from ..config import DETECT_BYTES, MIME_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIME_TYPE = 'application/octet-stream'
+DEFAULT_EXTENSION = '.bin'
+
+# Extensions for the MIME types libmagic reports, checked before the mimetypes module;
+# EMPY_MIME_EXTENSIONS adds to and overrides this table
+EXTENSIONS = {
+    'application/pdf': '.pdf',
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/bmp': '.bmp',
+    'image/x-ms-bmp': '.bmp',
+    'image/tiff': '.tiff',
+    'image/svg+xml': '.svg',
+    'image/x-icon': '.ico',
+    'image/vnd.microsoft.icon': '.ico',
+    'image/heic': '.heic',
+    'audio/mpeg': '.mp3',
+    'audio/x-wav': '.wav',
+    'audio/wav': '.wav',
+    'audio/flac': '.flac',
+    'audio/ogg': '.ogg',
+    'video/mp4': '.mp4',
+    'video/quicktime': '.mov',
+    'video/webm': '.webm',
+    'video/x-matroska': '.mkv',
+    'application/msword': '.doc',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
+    'application/vnd.ms-excel': '.xls',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': '.xlsx',
+    'application/vnd.ms-powerpoint': '.ppt',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation': '.pptx',
+    'application/vnd.oasis.opendocument.text': '.odt',
+    'application/vnd.oasis.opendocument.spreadsheet': '.ods',
+    'application/rtf': '.rtf',
+    'text/rtf': '.rtf',
+    'application/epub+zip': '.epub',
+    'application/zip': '.zip',
+    'application/gzip': '.gz',
+    'application/x-gzip': '.gz',
+    'application/x-bzip2': '.bz2',
+    'application/x-xz': '.xz',
+    'application/zstd': '.zst',
+    'application/x-tar': '.tar',
+    'application/x-rar-compressed': '.rar',
+    'application/x-rar': '.rar',
+    'application/vnd.rar': '.rar',
+    'application/x-7z-compressed': '.7z',
+    'application/x-sqlite3': '.sqlite',
+    'application/vnd.sqlite3': '.sqlite',
+    'text/plain': '.txt',
+    'text/html': '.html',
+    'text/csv': '.csv',
+    'text/markdown': '.md',
+    'text/css': '.css',
+    'text/javascript': '.js',
+    'application/javascript': '.js',
+    'text/x-python': '.py',
+    'text/x-script.python': '.py',
+    'text/x-shellscript': '.sh',
+    'application/json': '.json',
+    'application/xml': '.xml',
+    'text/xml': '.xml',
+    'application/x-msdownload': '.exe',
+    'application/x-dosexec': '.exe',
+    'application/x-executable': '.elf',
+    'application/x-sharedlib': '.so',
+    DEFAULT_MIME_TYPE: DEFAULT_EXTENSION,
+}
+EXTENSIONS.update(MIME_EXTENSIONS)
+
+_magic: Optional[magic.Magic] = None
+_magic_lock = threading.Lock()
+
+
+def detect_mime_type(data: bytes) -> str:
+    """MIME type of in-memory data, sniffed from its first DETECT_BYTES bytes"""
+    global _magic
+    try:
+        with _magic_lock:
+            if _magic is None:
+                _magic = magic.Magic(mime=True)
+            mime_type = _magic.from_buffer(bytes(data[:DETECT_BYTES]))
+    except Exception as e:
+        logger.error("Error detecting MIME type: %s", e)
+        return DEFAULT_MIME_TYPE
+    logger.debug("Detected MIME type: %s", mime_type)
+    return mime_type
+
+
+def extension_for(mime_type: str) -> str:
+    """File extension for a MIME type, '.bin' when it has no known one"""
+    mime_type = mime_type.split(';', 1)[0].strip().lower()
+    return EXTENSIONS.get(mime_type) or mimetypes.guess_extension(mime_type) or DEFAULT_EXTENSION
@@ -0,0 +1,233 @@
+"""
+Job store for EmPy
+Keeps the state, progress and result of asynchronous jobs so clients can poll
+for them. Two backends share one interface: an in-memory store (the default)
+and a SQLite store, which keeps results in a local database file instead of
+the heap. Finished jobs expire after a TTL and are removed by purge_expired.
+"""
+
+from abc import ABC, abstractmethod
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from ..config import JOB_STORE, JOB_STORE_PATH
+
+logger = logging.getLogger(__name__)
+
+# Job states; done and failed jobs are finished and expire
+STATUSES = ('queued', 'running', 'done', 'failed')
+FINISHED = ('done', 'failed')
+# Why a job failed, as in the error_type of the synchronous endpoints; the last three may work if resubmitted
+ERROR_TYPES = ('validation_error', 'server_error', 'pool_saturated', 'job_timeout', 'interrupted')
+RETRYABLE = ('pool_saturated', 'job_timeout', 'interrupted')
+
+
+class Job(NamedTuple):
+    id: str
+    status: str
+    created: float
+    updated: float
+    stage: str = ''
+    done: int = 0
+    total: int = 0
+    error: str = ''
+    error_type: str = ''
+    filename: str = ''
+    mime_type: str = ''
+    result_size: int = 0
+    expires: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 'failed' and self.error_type in RETRYABLE
+
+
+class JobStore(ABC):
+    """Interface shared by the job store backends; every method is thread-safe"""
+
+    @abstractmethod
+    def create(self, job: Job) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    def update(self, job_id: str, **fields) -> Optional[Job]:
+        """Change fields of a job and bump its updated time; None if the job is gone"""
+        ...
+
+    @abstractmethod
+    def set_result(self, job_id: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def get_result(self, job_id: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def delete(self, job_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def active_count(self) -> int:
+        """Number of queued and running jobs"""
+        ...
+
+    @abstractmethod
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Remove finished jobs past their expiry time; returns how many were removed"""
+        ...
+
+
+class MemoryJobStore(JobStore):
+    """Jobs and results in dictionaries; lost when the process exits"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._results: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def update(self, job_id: str, **fields) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = self._jobs[job_id] = job._replace(updated=time.time(), **fields)
+            return job
+
+    def set_result(self, job_id: str, data: bytes) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._results[job_id] = data
+
+    def get_result(self, job_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self._results.get(job_id)
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            self._results.pop(job_id, None)
+            return self._jobs.pop(job_id, None) is not None
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(not job.finished for job in self._jobs.values())
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        with self._lock:
+            expired = [job.id for job in self._jobs.values() if job.finished and job.expires <= now]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._results.pop(job_id, None)
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """Jobs and results in a SQLite database file, shared by every thread of the process
+
+    Jobs that were queued or running when the previous process stopped cannot
+    finish any more; they are marked failed when the store is opened.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, status TEXT, created REAL, updated REAL, stage TEXT, '
+            'done INTEGER, total INTEGER, error TEXT, error_type TEXT, filename TEXT, mime_type TEXT, '
+            'result_size INTEGER, expires REAL, result BLOB)'
+        )
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(jobs)')}
+        if 'error_type' not in columns:
+            # Databases written before failures were classified
+            self._db.execute("ALTER TABLE jobs ADD COLUMN error_type TEXT DEFAULT ''")
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (status, expires)')
+        interrupted = self._db.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Server restarted before the job finished', "
+            "error_type = 'interrupted', updated = ? WHERE status IN ('queued', 'running')", (time.time(),)
+        ).rowcount
+        if interrupted:
+            logger.info("Marked %s interrupted job(s) in %s as failed", interrupted, path)
+
+    def create(self, job: Job) -> None:
+        columns = ', '.join(Job._fields)
+        placeholders = ', '.join('?' for _ in Job._fields)
+        with self._lock:
+            self._db.execute(f'INSERT INTO jobs ({columns}) VALUES ({placeholders})', job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        columns = ', '.join(Job._fields)
+        with self._lock:
+            row = self._db.execute(f'SELECT {columns} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return Job(*row) if row else None
+
+    def update(self, job_id: str, **fields) -> Optional[Job]:
+        fields['updated'] = time.time()
+        for name in fields:
+            if name not in Job._fields or name == 'id':
+                raise ValueError(f"Unknown job field: {name}")
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock:
+            changed = self._db.execute(f'UPDATE jobs SET {assignments} WHERE id = ?',
+                                       (*fields.values(), job_id)).rowcount
+        return self.get(job_id) if changed else None
+
+    def set_result(self, job_id: str, data: bytes) -> None:
+        with self._lock:
+            self._db.execute('UPDATE jobs SET result = ? WHERE id = ?', (data, job_id))
+
+    def get_result(self, job_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute('SELECT result FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            return self._db.execute('DELETE FROM jobs WHERE id = ?', (job_id,)).rowcount > 0
+
+    def active_count(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND expires <= ?",
+                (now or time.time(),)
+            ).rowcount
+
+
+def make_job_store(kind: str = JOB_STORE, path: str = JOB_STORE_PATH) -> JobStore:
+    """Create the store selected by EMPY_JOB_STORE"""
+    if kind == 'memory':
+        return MemoryJobStore()
+    if kind == 'sqlite':
+        logger.info("Keeping job state in %s", path)
+        return SQLiteJobStore(path)
+    raise ValueError(f"Unknown job store: {kind} (expected 'memory' or 'sqlite')")
+
+
+job_store = make_job_store()
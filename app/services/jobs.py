@@ -0,0 +1,160 @@
+"""
+Asynchronous jobs for EmPy
+Runs service functions in the background for clients that poll for the result
+instead of holding a request open. Jobs wait in an asyncio queue of their own
+(at most WORKERS run at a time, so they never trip the pool's saturation
+check), report progress through a queue the workers can write to, and keep
+their state and result in the job store until the TTL runs out.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import secrets
+import threading
+import time
+import traceback
+from typing import Callable, Optional, Set
+
+from . import metrics
+from .executor import run_job, PoolSaturatedError, JobTimeoutError
+from .job_store import Job, job_store
+from ..config import (EXECUTOR, WORKERS, MAX_QUEUED_JOBS, BACKGROUND_JOB_TIMEOUT, JOB_RESULT_TTL,
+                      JOB_CLEANUP_INTERVAL)
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when MAX_QUEUED_JOBS jobs are already queued or running"""
+
+
+metrics.Gauge('empy_jobs_active', "Background jobs queued or running", lambda: job_store.active_count())
+
+
+class ProgressReporter:
+    """Picklable progress callback: forwards (job id, stage, done, total) to the progress queue"""
+
+    def __init__(self, progress_queue, job_id: str):
+        self.progress_queue = progress_queue
+        self.job_id = job_id
+
+    def __call__(self, stage: str, done: int, total: int) -> None:
+        self.progress_queue.put((self.job_id, stage, done, total))
+
+
+_manager = None
+_progress_queue = None
+_progress_thread: Optional[threading.Thread] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_tasks: Set[asyncio.Task] = set()
+_cleanup_task: Optional[asyncio.Task] = None
+
+
+def _record_progress() -> None:
+    """Progress thread: copy reports from the queue into the job store until a None arrives"""
+    while True:
+        report = _progress_queue.get()
+        if report is None:
+            return
+        job_id, stage, done, total = report
+        job = job_store.get(job_id)
+        if job is not None and job.status == 'running':
+            job_store.update(job_id, stage=stage, done=done, total=total)
+
+
+async def _cleanup_loop() -> None:
+    while True:
+        await asyncio.sleep(JOB_CLEANUP_INTERVAL)
+        try:
+            removed = await asyncio.to_thread(job_store.purge_expired)
+            if removed:
+                logger.info("Removed %s expired job(s)", removed)
+        except Exception as e:
+            logger.error("Job cleanup failed: %s", e)
+
+
+def start_jobs() -> None:
+    """Start the progress thread and the cleanup loop (call from the running event loop)"""
+    global _manager, _progress_queue, _progress_thread, _semaphore, _cleanup_task
+    if EXECUTOR == 'process':
+        # Worker processes cannot share a plain queue; a manager queue proxy pickles
+        _manager = multiprocessing.get_context('spawn').Manager()
+        _progress_queue = _manager.Queue()
+    else:
+        _progress_queue = queue.Queue()
+    _progress_thread = threading.Thread(target=_record_progress, name='empy-job-progress', daemon=True)
+    _progress_thread.start()
+    _semaphore = asyncio.Semaphore(WORKERS)
+    _cleanup_task = asyncio.create_task(_cleanup_loop())
+
+
+async def stop_jobs() -> None:
+    """Cancel unfinished jobs and stop the background helpers"""
+    global _manager, _progress_queue, _progress_thread, _cleanup_task
+    for task in list(_tasks) + ([_cleanup_task] if _cleanup_task else []):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _cleanup_task = None
+    if _progress_thread is not None:
+        _progress_queue.put(None)
+        _progress_thread.join()
+        _progress_thread = None
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
+    _progress_queue = None
+
+
+def submit(func: Callable, *args, result_filename: str = '', result_mime_type: str = '', **kwargs) -> Job:
+    """Queue `func(*args, progress=..., **kwargs)` as a background job and return it at once
+
+    `func` must return the result bytes; `result_filename` and `result_mime_type`
+    describe them for the download. Raises JobQueueFullError when MAX_QUEUED_JOBS jobs
+    are already queued or running.
+    """
+    if _semaphore is None:
+        raise RuntimeError("Background jobs are not started")
+    if job_store.active_count() >= MAX_QUEUED_JOBS:
+        raise JobQueueFullError("Too many jobs queued, try again later")
+
+    now = time.time()
+    job = Job(secrets.token_hex(16), 'queued', now, now, filename=result_filename, mime_type=result_mime_type)
+    job_store.create(job)
+    task = asyncio.create_task(_run(job.id, func, args, kwargs))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    logger.info("Queued job %s", job.id)
+    return job
+
+
+async def _run(job_id: str, func: Callable, args: tuple, kwargs: dict) -> None:
+    async with _semaphore:
+        if job_store.update(job_id, status='running') is None:
+            return  # deleted while queued
+        start = time.time()
+        try:
+            output = await run_job(func, *args, progress=ProgressReporter(_progress_queue, job_id),
+                                   timeout=BACKGROUND_JOB_TIMEOUT, **kwargs)
+            await asyncio.to_thread(job_store.set_result, job_id, output)
+            job_store.update(job_id, status='done', result_size=len(output), expires=time.time() + JOB_RESULT_TTL)
+            logger.info("Job %s done in %.2fs (%s bytes)", job_id, time.time() - start, len(output))
+        except asyncio.CancelledError:
+            job_store.update(job_id, status='failed', error="Server shut down before the job finished",
+                             error_type='interrupted', expires=time.time() + JOB_RESULT_TTL)
+            raise
+        except (ValueError, PoolSaturatedError, JobTimeoutError) as e:
+            # Same classes as the 400/503/504 of the synchronous endpoints; the last two are worth resubmitting
+            error_type = "validation_error" if isinstance(e, ValueError) else \
+                "pool_saturated" if isinstance(e, PoolSaturatedError) else "job_timeout"
+            metrics.count_error(error_type)
+            logger.error("Job %s failed: %s", job_id, e)
+            job_store.update(job_id, status='failed', error=str(e), error_type=error_type,
+                             expires=time.time() + JOB_RESULT_TTL)
+        except Exception as e:
+            metrics.count_error("server_error")
+            trace = traceback.format_exc()
+            logger.error("Unexpected error in job %s: %s\n%s", job_id, e, trace)
+            job_store.update(job_id, status='failed', error="Internal server error while processing job",
+                             error_type='server_error', expires=time.time() + JOB_RESULT_TTL)
@@ -0,0 +1,351 @@
+"""
+Vectorized LSB engine for EmPy
+Reads and writes least significant bits with NumPy instead of a per-pixel loop.
+The bit layout matches stegano's lsb module, so images written here can still
+be read with stegano.lsb.reveal (and the other way around).
+
+Carriers are edited in their own mode when it is one of NATIVE_MODES: RGB and
+RGBA carry data in the colour channels (and, when the header says so, in the
+alpha channel of the body), grayscale and 16-bit images in their single
+channel. Other modes are converted to the closest native mode first.
+"""
+
+import logging
+import math
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .pixel_index import get_pixel_indices, shuffled_indices, sieve_primes
+
+logger = logging.getLogger(__name__)
+
+# Stegano stores one bit in each of the R, G and B components of a pixel
+CHANNELS = 3
+
+# Modes edited without conversion, with the number of channels the header is written to
+NATIVE_MODES = {'RGB': 3, 'RGBA': 3, 'L': 1, 'I;16': 1, 'I': 1}
+
+# Longest "<length>:" prefix we look for when revealing a stegano message
+MAX_PREFIX_LENGTH = 20
+
+# Pixels written or read per step, so temporary arrays stay small for large bodies
+CHUNK_PIXELS = 1 << 20
+
+
+def carrier_mode(image: Image.Image, modes: Iterable[str] = tuple(NATIVE_MODES)) -> str:
+    """Mode a carrier is edited in: its own when it is in `modes`, else the closest one that is
+
+    Transparent images keep their alpha channel, bilevel images become grayscale
+    and big-endian 16-bit images become 'I'; anything else becomes RGB.
+    """
+    modes = tuple(modes)
+    if image.mode in modes:
+        return image.mode
+    if image.mode.startswith('I;16') and 'I' in modes:
+        return 'I'
+    if image.mode == '1' and 'L' in modes:
+        return 'L'
+    if image.mode in ('LA', 'La', 'PA', 'RGBa') or 'transparency' in image.info:
+        return 'RGBA'
+    return 'RGB'
+
+
+def body_channels(mode: str, use_alpha: bool = False) -> int:
+    """Channels per pixel holding the body in a carrier of a native `mode`"""
+    if mode == 'RGBA' and use_alpha:
+        return 4
+    return NATIVE_MODES[mode]
+
+
+def header_channels(channels: int) -> int:
+    """Channels per pixel holding the header when the body uses `channels`; never the alpha channel"""
+    return min(channels, CHANNELS)
+
+
+def load_pixels(image: Image.Image, mode: Optional[str] = None) -> np.ndarray:
+    """Load an image as a flat (pixels, bands) array, in `mode` or its carrier mode
+
+    The array keeps the sample type of the mode: uint8, or 16/32-bit integers
+    for 'I;16' and 'I'.
+    """
+    mode = mode or carrier_mode(image)
+    if image.mode != mode:
+        image = image.convert(mode)
+    pixels = np.array(image)
+    return pixels.reshape(image.width * image.height, -1)
+
+
+def to_image(pixels: np.ndarray, size: tuple, mode: str) -> Image.Image:
+    """Rebuild a Pillow image from a flat pixel array"""
+    width, height = size
+    shape = (height, width) if pixels.shape[1] == 1 else (height, width, -1)
+    return Image.fromarray(pixels.reshape(shape), mode)
+
+
+class Layout(NamedTuple):
+    """Where and how densely the body of a payload container is written"""
+    bits_per_channel: int = 1
+    strategy: str = 'prime'
+    seed: int = 0
+    channels: int = CHANNELS
+
+
+def eratosthenes_indices(size: tuple, count: int) -> np.ndarray:
+    """Return the first `count` prime pixel indices, checking they fit the carrier"""
+    indices = get_pixel_indices(*size)
+    if count > len(indices):
+        raise ValueError("The carrier image is too small for this payload")
+    return indices[:count]
+
+
+def leading_primes(count: int) -> np.ndarray:
+    """First `count` prime pixel indices, without building the sequence for a whole carrier"""
+    # Upper bound for the n-th prime (Rosser): n (ln n + ln ln n) for n >= 6
+    limit = int(count * (math.log(count + 6) + math.log(math.log(count + 6)))) + 16
+    return sieve_primes(limit)[:count]
+
+
+def head_pixel_count(byte_count: int, channels: int = CHANNELS) -> int:
+    """Number of leading pixels that hold the first `byte_count` bytes of the prime stream"""
+    return int(leading_primes(pixels_for_bytes(byte_count, 1, channels))[-1]) + 1 if byte_count else 0
+
+
+def bytes_to_values(data: bytes, bits_per_channel: int = 1, channels: int = CHANNELS) -> np.ndarray:
+    """Split bytes into MSB-first groups of `bits_per_channel` bits, `channels` per row
+
+    The result is padded with zeros to whole pixels. When the group size divides
+    a byte the groups are cut straight out of the bytes, without an intermediate
+    one-byte-per-bit array.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    mask = (1 << bits_per_channel) - 1
+
+    if 8 % bits_per_channel == 0:
+        per_byte = 8 // bits_per_channel
+        count = len(raw) * per_byte
+        values = np.zeros(count + (-count % channels), dtype=np.uint8)
+        for position, shift in enumerate(range(8 - bits_per_channel, -1, -bits_per_channel)):
+            values[position:count:per_byte] = (raw >> shift) & mask
+        return values.reshape(-1, channels)
+
+    bits = np.unpackbits(raw)
+    padded = np.zeros(len(bits) + (-len(bits) % (channels * bits_per_channel)), dtype=np.uint8)
+    padded[:len(bits)] = bits
+    weights = (1 << np.arange(bits_per_channel - 1, -1, -1)).astype(np.uint8)
+    return (padded.reshape(-1, channels, bits_per_channel) * weights).sum(axis=2, dtype=np.uint8)
+
+
+def values_to_bytes(values: np.ndarray, bits_per_channel: int, count: int) -> bytes:
+    """Reassemble the first `count` bytes from MSB-first groups of bits"""
+    values = values.reshape(-1)
+    if 8 % bits_per_channel == 0:
+        per_byte = 8 // bits_per_channel
+        data = np.zeros(count, dtype=np.uint8)
+        for position, shift in enumerate(range(8 - bits_per_channel, -1, -bits_per_channel)):
+            data |= values[position:count * per_byte:per_byte] << shift
+        return data.tobytes()
+
+    shifts = np.arange(bits_per_channel - 1, -1, -1, dtype=np.uint8)
+    bits = ((values[:, np.newaxis] >> shifts) & 1).reshape(-1)
+    return np.packbits(bits[:count * 8]).tobytes()
+
+
+def write_values(pixels: np.ndarray, indices: np.ndarray, values: np.ndarray,
+                 bits_per_channel: int = 1) -> None:
+    """Write (pixels, channels) bit groups into the low bits of the first channels of the selected pixels"""
+    channels = values.shape[1]
+    keep = ~np.array((1 << bits_per_channel) - 1, dtype=pixels.dtype)
+    pixels[indices, :channels] = (pixels[indices, :channels] & keep) | values
+
+
+def read_values(pixels: np.ndarray, indices: np.ndarray, bits_per_channel: int = 1,
+                channels: int = CHANNELS) -> np.ndarray:
+    """Read the low bits of the first `channels` channels of the selected pixels as bit groups"""
+    return (pixels[indices, :channels] & ((1 << bits_per_channel) - 1)).astype(np.uint8, copy=False)
+
+
+def pixels_for_bytes(byte_count: int, bits_per_channel: int = 1, channels: int = CHANNELS) -> int:
+    """Number of pixels needed to hold `byte_count` bytes"""
+    return -(-byte_count * 8 // (channels * bits_per_channel))
+
+
+def stream_capacity(size: tuple, channels: int = CHANNELS) -> int:
+    """Number of whole bytes a plain prime-indexed 1-bit stream can hold"""
+    return len(get_pixel_indices(*size)) * channels // 8
+
+
+def _body_region(size: tuple, header_size: int, channels: int = CHANNELS) -> tuple:
+    """Return (primes used by the header, first pixel after the header) for a body using `channels`"""
+    primes = get_pixel_indices(*size)
+    header_pixels = pixels_for_bytes(header_size, 1, header_channels(channels))
+    if header_pixels > len(primes):
+        raise ValueError("The carrier image is too small for this payload")
+    start = int(primes[header_pixels - 1]) + 1 if header_pixels else 0
+    return header_pixels, start
+
+
+def body_capacity(size: tuple, layout: Layout, header_size: int) -> int:
+    """Number of whole body bytes that fit after a header of `header_size` bytes"""
+    header_pixels, start = _body_region(size, header_size, layout.channels)
+    if layout.strategy == 'prime':
+        available = len(get_pixel_indices(*size)) - header_pixels
+    else:
+        available = size[0] * size[1] - start
+    return available * layout.channels * layout.bits_per_channel // 8
+
+
+def body_indices(size: tuple, layout: Layout, header_size: int, count: int) -> np.ndarray:
+    """Return the pixel indices holding the first `count` pixels of a container body"""
+    header_pixels, start = _body_region(size, header_size, layout.channels)
+    if layout.strategy == 'prime':
+        indices = get_pixel_indices(*size)[header_pixels:header_pixels + count]
+        if len(indices) < count:
+            raise ValueError("The carrier image is too small for this payload")
+        return indices
+
+    stop = size[0] * size[1]
+    if layout.strategy == 'sequential':
+        if start + count > stop:
+            raise ValueError("The carrier image is too small for this payload")
+        return np.arange(start, start + count, dtype=np.int64)
+    return shuffled_indices(start, stop, count, layout.seed)
+
+
+def body_chunks(size: tuple, layout: Layout, header_size: int, count: int,
+                chunk_pixels: int = CHUNK_PIXELS) -> Iterator[Union[np.ndarray, slice]]:
+    """Yield the pixel indices of the first `count` body pixels, `chunk_pixels` at a time
+
+    Sequential bodies are yielded as slices, so no index array is built at all.
+    """
+    header_pixels, start = _body_region(size, header_size, layout.channels)
+    stop = size[0] * size[1]
+    if layout.strategy == 'prime':
+        primes = get_pixel_indices(*size)
+        if header_pixels + count > len(primes):
+            raise ValueError("The carrier image is too small for this payload")
+    elif layout.strategy == 'sequential' and start + count > stop:
+        raise ValueError("The carrier image is too small for this payload")
+
+    for first in range(0, count, chunk_pixels):
+        last = min(first + chunk_pixels, count)
+        if layout.strategy == 'prime':
+            yield primes[header_pixels + first:header_pixels + last]
+        elif layout.strategy == 'sequential':
+            yield slice(start + first, start + last)
+        else:
+            yield shuffled_indices(start, stop, last - first, layout.seed, first)
+
+
+def write_body(pixels: np.ndarray, size: tuple, layout: Layout, header_size: int, body: bytes,
+               progress: Optional[Callable[[int, int], None]] = None) -> None:
+    """Write a container body into `pixels` in place, one chunk of pixels at a time
+
+    `progress`, if given, is called with (bytes written, body size) after every chunk.
+    """
+    bits, channels = layout.bits_per_channel, layout.channels
+    # CHUNK_PIXELS pixels hold exactly this many bytes, so chunks never split a pixel
+    step = CHUNK_PIXELS * channels * bits // 8
+    body = memoryview(body)
+    count = pixels_for_bytes(len(body), bits, channels)
+    for offset, indices in zip(range(0, len(body), step),
+                                   body_chunks(size, layout, header_size, count, CHUNK_PIXELS)):
+        write_values(pixels, indices, bytes_to_values(body[offset:offset + step], bits, channels), bits)
+        if progress is not None:
+            progress(min(offset + step, len(body)), len(body))
+
+
+def write_container(pixels: np.ndarray, size: tuple, header: bytes, body: bytes, layout: Layout,
+                    progress: Optional[Callable[[int, int], None]] = None) -> None:
+    """Write a container into `pixels` in place: the header 1 bit per channel on primes, the body per `layout`"""
+    values = bytes_to_values(header, 1, header_channels(layout.channels))
+    write_values(pixels, eratosthenes_indices(size, len(values)), values)
+    write_body(pixels, size, layout, len(header), body, progress)
+
+
+def hide_bytes(image: Image.Image, data: bytes) -> Image.Image:
+    """Hide raw bytes in an image using prime pixel indices (RGB or RGBA, like stegano)"""
+    pixels = load_pixels(image, carrier_mode(image, ('RGB', 'RGBA')))
+    values = bytes_to_values(data)
+    write_values(pixels, eratosthenes_indices(image.size, len(values)), values)
+
+    mode = 'RGBA' if pixels.shape[1] == 4 else 'RGB'
+    return to_image(pixels, image.size, mode)
+
+
+def hide_container(image: Image.Image, header: bytes, body: bytes, layout: Layout,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Image.Image:
+    """Hide a container: the header 1 bit per channel on primes, the body per `layout`
+
+    `image` must be in a native mode (see carrier_mode); the result has the same mode.
+    """
+    pixels = load_pixels(image, image.mode)
+    write_container(pixels, image.size, header, body, layout, progress)
+    return to_image(pixels, image.size, image.mode)
+
+
+def read_bytes(pixels: np.ndarray, size: tuple, count: int, channels: int = CHANNELS) -> bytes:
+    """Read the first `count` hidden bytes, touching only the pixels that hold them"""
+    indices = eratosthenes_indices(size, pixels_for_bytes(count, 1, channels))
+    return values_to_bytes(read_values(pixels, indices, 1, channels), 1, count)
+
+
+def read_head(pixels: np.ndarray, size: tuple, count: int, channels: int = CHANNELS) -> bytes:
+    """Read up to `count` bytes of the prime stream from the leading pixels only
+
+    `pixels` only needs to cover the first head_pixel_count(count, channels)
+    pixels. Fewer bytes are returned when the carrier is too small to hold `count`.
+    """
+    indices = leading_primes(pixels_for_bytes(count, 1, channels))
+    indices = indices[indices < min(size[0] * size[1], len(pixels))]
+    count = min(count, len(indices) * channels // 8)
+    return values_to_bytes(read_values(pixels, indices, 1, channels), 1, count)
+
+
+def parse_prefix(head: bytes) -> Tuple[int, int]:
+    """Find a stegano "<length>:" prefix; returns (separator position, message length)"""
+    separator = head.find(b':')
+    if separator <= 0 or not head[:separator].isdigit():
+        raise ValueError("Impossible to detect message")
+    return separator, int(head[:separator])
+
+
+def read_body(pixels: np.ndarray, size: tuple, layout: Layout, header_size: int, count: int) -> bytes:
+    """Read the first `count` bytes of a container body, one chunk of pixels at a time"""
+    bits, channels = layout.bits_per_channel, layout.channels
+    step = CHUNK_PIXELS * channels * bits // 8
+    body = bytearray()
+    chunks = body_chunks(size, layout, header_size, pixels_for_bytes(count, bits, channels), CHUNK_PIXELS)
+    for offset, indices in zip(range(0, count, step), chunks):
+        body += values_to_bytes(read_values(pixels, indices, bits, channels), bits, min(step, count - offset))
+    return bytes(body)
+
+
+def hide(image: Image.Image, message: str) -> Image.Image:
+    """Hide a message in an image, stegano-compatible, using prime pixel indices
+
+    Like stegano, the prefix holds the number of characters and every character
+    takes 8 bits, so only code points up to U+00FF can be hidden.
+    """
+    try:
+        data = message.encode('latin-1')
+    except UnicodeEncodeError:
+        raise ValueError("Legacy messages can only hold characters up to U+00FF")
+    return hide_bytes(image, f"{len(message)}:".encode('ascii') + data)
+
+
+def reveal(image: Image.Image) -> str:
+    """Reveal a stegano-compatible message hidden with prime pixel indices"""
+    return reveal_pixels(load_pixels(image, carrier_mode(image, ('RGB', 'RGBA'))), image.size)
+
+
+def reveal_pixels(pixels: np.ndarray, size: tuple) -> str:
+    """Reveal a stegano-compatible message from an already loaded pixel array"""
+    # Read just enough pixels to find the "<length>:" prefix
+    separator, length = parse_prefix(read_head(pixels, size, MAX_PREFIX_LENGTH))
+    if separator + 1 + length > stream_capacity(size):
+        raise ValueError("Impossible to detect message")
+    data = read_bytes(pixels, size, separator + 1 + length)
+    # One 8-bit code point per character, as stegano writes them
+    return data[separator + 1:].decode('latin-1')
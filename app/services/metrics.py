@@ -0,0 +1,235 @@
+"""
+Metrics for EmPy
+A small in-process registry of counters, gauges and histograms, rendered in
+the Prometheus text format, plus per-stage timing of the embed/extract work.
+
+Stages are timed with `with stage('decode'):`. Service functions usually run
+in worker processes whose metrics nobody scrapes, so run_job wraps them in
+call_with_events: stage timings and byte counts recorded during the call are
+collected and returned with the result, then replayed in the server process,
+where they also feed the request's Server-Timing header.
+"""
+
+from abc import ABC, abstractmethod
+import bisect
+import contextlib
+import contextvars
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Stage histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Event = Tuple[str, str, float]
+
+# Events recorded inside call_with_events, to be replayed by the caller
+_collector: contextvars.ContextVar[Optional[List[Event]]] = contextvars.ContextVar('empy_collector', default=None)
+# (stage, seconds) of the request being handled, for the Server-Timing header
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = \
+    contextvars.ContextVar('empy_request_timings', default=None)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """Base class: a named family of samples, one per combination of label values"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Gauge(Metric):
+    """A value set directly, or read from `function` at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.function = function
+        self._value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def samples(self) -> Iterator[str]:
+        value = self.function() if self.function is not None else self._value
+        yield f'{self.name} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: counts per bucket (the last one is +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}'
+
+
+REGISTRY: List[Metric] = []
+
+STAGE_SECONDS = Histogram('empy_stage_seconds', "Time spent per processing stage", ('stage',))
+PAYLOAD_BYTES = Counter('empy_payload_bytes_total', "Payload bytes embedded or extracted", ('operation',))
+ERRORS = Counter('empy_errors_total', "Errors returned to clients, by type", ('type',))
+IN_FLIGHT = Gauge('empy_requests_in_flight', "HTTP requests being handled")
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+def _record(kind: str, name: str, value: float) -> None:
+    collector = _collector.get()
+    if collector is not None:
+        collector.append((kind, name, value))
+    else:
+        _apply((kind, name, value))
+
+
+def _apply(event: Event) -> None:
+    kind, name, value = event
+    if kind == 'stage':
+        STAGE_SECONDS.observe(value, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, value))
+    elif kind == 'bytes':
+        PAYLOAD_BYTES.inc(value, operation=name)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    _record('stage', name, seconds)
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as one processing stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def add_payload_bytes(operation: str, count: int) -> None:
+    """Count payload bytes embedded or extracted"""
+    _record('bytes', operation, count)
+
+
+def count_error(error_type: str) -> None:
+    ERRORS.inc(type=error_type)
+
+
+def call_with_events(func: Callable, *args, **kwargs) -> Tuple[object, List[Event]]:
+    """Run `func` and return its result with the events it recorded (runs in the worker)"""
+    events: List[Event] = []
+    token = _collector.set(events)
+    try:
+        return func(*args, **kwargs), events
+    finally:
+        _collector.reset(token)
+
+
+def replay(events: List[Event]) -> None:
+    """Apply events returned by call_with_events in this process"""
+    for event in events:
+        _apply(event)
+
+
+def start_request_timings() -> Tuple[List[Tuple[str, float]], contextvars.Token]:
+    """Collect stage timings of the current request; returns the list and a token for reset"""
+    timings: List[Tuple[str, float]] = []
+    return timings, _request_timings.set(timings)
+
+
+def reset_request_timings(token: contextvars.Token) -> None:
+    _request_timings.reset(token)
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    """Server-Timing header value; repeated stages (batch items) are added up"""
+    totals: Dict[str, float] = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in totals.items())
@@ -0,0 +1,228 @@
+"""
+Binary payload container for EmPy
+Frames the raw payload bytes with a small versioned header so extraction knows
+exactly how many bytes to read, where they live and what the original file
+was called.
+
+The container is split in two parts. The fixed-size header is always written
+1 bit per colour (or gray) channel on prime pixel indices, so it can be found
+knowing nothing but the image mode. The body (filename, MIME type, payload) follows with
+the bit density and pixel selection strategy recorded in the header.
+
+Header layout, version 2 (big-endian):
+    magic      4s   b'EMPY'
+    version    B
+    flags      B
+    bits       B    bits per channel used for the body (1-4)
+    strategy   B    index into STRATEGIES
+    seed       I    seed for the shuffle strategy
+    length     I    payload length in bytes
+    name_len   H    UTF-8 filename length
+    mime_len   B    ASCII MIME type length
+
+Flags: bit 0 marks text payloads; bits 1-2 hold the compression applied to the
+payload, an index into COMPRESSIONS (the length field is the compressed size);
+bit 3 marks bodies that also use the alpha channel of an RGBA carrier; bit 4
+marks shards (see below).
+
+A payload too large for one carrier can be sharded: it is compressed once, the
+stored bytes are cut into chunks, and each chunk is embedded into its own
+carrier as the payload of a container flagged as a shard. Each chunk is
+preceded by its entry in the shard manifest (big-endian):
+    set_id     16s  random id shared by all shards of the payload
+    index      H    position of this shard
+    count      H    number of shards
+    method     B    compression of the whole payload, index into COMPRESSIONS
+    offset     Q    position of the chunk in the stored payload
+    stored     Q    size of the stored (compressed) payload
+    size       Q    size of the payload after decompression
+    checksum   32s  SHA-256 of the chunk
+
+Version 1 headers have no bits/strategy/seed fields; their body follows the
+header directly, 1 bit per channel on prime pixel indices.
+"""
+
+import hashlib
+import struct
+from typing import NamedTuple, Tuple
+
+MAGIC = b'EMPY'
+VERSION = 2
+
+HEADER = struct.Struct('>4sBBBBIIHB')
+HEADER_V1 = struct.Struct('>4sBBIHB')
+HEADER_SIZE = HEADER.size
+SHARD = struct.Struct('>16sHHBQQQ32s')
+
+# Pixel selection strategies, stored in the header by position
+STRATEGIES = ('prime', 'sequential', 'shuffle')
+MAX_BITS_PER_CHANNEL = 4
+
+# Flag bits
+FLAG_TEXT = 0x01  # payload was detected as text when it was embedded
+FLAG_COMPRESSION = 0x06  # compression applied to the payload, index into COMPRESSIONS
+COMPRESSION_SHIFT = 1
+FLAG_ALPHA = 0x08  # the body is written to the alpha channel too
+FLAG_SHARD = 0x10  # the payload is one shard of a larger payload
+
+# Payload compression methods, stored in the flags by position
+COMPRESSIONS = ('none', 'zlib', 'lzma', 'zstd')
+
+MAX_FILENAME_LENGTH = 255
+MAX_MIME_LENGTH = 255
+
+
+class PayloadHeader(NamedTuple):
+    version: int
+    flags: int
+    bits_per_channel: int
+    strategy: str
+    seed: int
+    length: int
+    name_length: int
+    mime_length: int
+
+    @property
+    def size(self) -> int:
+        """Size of the fixed header itself"""
+        return HEADER_V1.size if self.version == 1 else HEADER.size
+
+    @property
+    def compression(self) -> str:
+        return compression_of(self.flags)
+
+    @property
+    def uses_alpha(self) -> bool:
+        return bool(self.flags & FLAG_ALPHA)
+
+    @property
+    def is_shard(self) -> bool:
+        return bool(self.flags & FLAG_SHARD)
+
+    @property
+    def body_size(self) -> int:
+        """Size of the body: filename, MIME type and payload"""
+        return self.name_length + self.mime_length + self.length
+
+
+class ShardInfo(NamedTuple):
+    set_id: bytes
+    index: int
+    count: int
+    compression: str
+    offset: int
+    stored_size: int
+    size: int
+
+
+class Payload(NamedTuple):
+    data: bytes
+    filename: str
+    mime_type: str
+    flags: int
+
+
+def compression_flags(compression: str) -> int:
+    """Flag bits recording a compression method"""
+    return COMPRESSIONS.index(compression) << COMPRESSION_SHIFT
+
+
+def compression_of(flags: int) -> str:
+    """Compression method recorded in the flag bits"""
+    return COMPRESSIONS[(flags & FLAG_COMPRESSION) >> COMPRESSION_SHIFT]
+
+
+def is_container(head: bytes) -> bool:
+    """Check whether the leading bytes of a hidden stream carry our magic"""
+    return head[:len(MAGIC)] == MAGIC
+
+
+def validate_layout(bits_per_channel: int, strategy: str) -> None:
+    """Reject bit densities and strategies the format cannot record"""
+    if not 1 <= bits_per_channel <= MAX_BITS_PER_CHANNEL:
+        raise ValueError(f"bits_per_channel must be between 1 and {MAX_BITS_PER_CHANNEL}")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown pixel selection strategy: {strategy} "
+                         f"(expected one of: {', '.join(STRATEGIES)})")
+
+
+def pack_body(data: bytes, filename: str = '', mime_type: str = '') -> Tuple[bytes, int, int]:
+    """Build the body and return it with the encoded filename and MIME type lengths"""
+    # Truncate without leaving a multi-byte character cut in half
+    name = filename.encode('utf-8')[:MAX_FILENAME_LENGTH]
+    name = name.decode('utf-8', errors='ignore').encode('utf-8')
+    mime = mime_type.encode('ascii', errors='ignore')[:MAX_MIME_LENGTH]
+    return name + mime + data, len(name), len(mime)
+
+
+def pack(data: bytes, filename: str = '', mime_type: str = '', flags: int = 0,
+         bits_per_channel: int = 1, strategy: str = 'prime', seed: int = 0) -> Tuple[bytes, bytes]:
+    """Frame payload bytes and return the (header, body) pair"""
+    validate_layout(bits_per_channel, strategy)
+    body, name_length, mime_length = pack_body(data, filename, mime_type)
+    header = HEADER.pack(MAGIC, VERSION, flags, bits_per_channel, STRATEGIES.index(strategy),
+                         seed, len(data), name_length, mime_length)
+    return header, body
+
+
+def parse_header(head: bytes) -> PayloadHeader:
+    """Parse the fixed-size header at the start of a hidden stream"""
+    if len(head) < HEADER_V1.size or not is_container(head):
+        raise ValueError("No EmPy payload header found")
+
+    version = head[len(MAGIC)]
+    if version == 1:
+        _, _, flags, length, name_length, mime_length = HEADER_V1.unpack(head[:HEADER_V1.size])
+        return PayloadHeader(version, flags, 1, 'prime', 0, length, name_length, mime_length)
+    if version != VERSION:
+        raise ValueError(f"Unsupported payload version: {version}")
+    if len(head) < HEADER.size:
+        raise ValueError("Embedded payload header is truncated")
+
+    (_, _, flags, bits_per_channel, strategy, seed,
+     length, name_length, mime_length) = HEADER.unpack(head[:HEADER.size])
+    if strategy >= len(STRATEGIES):
+        raise ValueError("Embedded payload header is corrupt")
+    validate_layout(bits_per_channel, STRATEGIES[strategy])
+    return PayloadHeader(version, flags, bits_per_channel, STRATEGIES[strategy], seed,
+                         length, name_length, mime_length)
+
+
+def unpack(header: PayloadHeader, body: bytes) -> Payload:
+    """Split a body into payload bytes and metadata"""
+    if len(body) < header.body_size:
+        raise ValueError("Embedded payload is truncated")
+
+    offset = header.name_length
+    filename = body[:offset].decode('utf-8', errors='replace')
+    mime_type = body[offset:offset + header.mime_length].decode('ascii', errors='replace')
+    offset += header.mime_length
+    return Payload(body[offset:offset + header.length], filename, mime_type, header.flags)
+
+
+def pack_shard(chunk: bytes, set_id: bytes, index: int, count: int, compression: str,
+               offset: int, stored_size: int, size: int) -> bytes:
+    """Prefix a chunk of a stored payload with its shard manifest entry"""
+    return SHARD.pack(set_id, index, count, COMPRESSIONS.index(compression), offset, stored_size, size,
+                      hashlib.sha256(chunk).digest()) + chunk
+
+
+def shard_manifest(record: bytes) -> ShardInfo:
+    """Read the manifest entry at the start of a shard, without checking its chunk"""
+    if len(record) < SHARD.size:
+        raise ValueError("Shard is truncated")
+    set_id, index, count, method, offset, stored_size, size, _ = SHARD.unpack(record[:SHARD.size])
+    if index >= count or method >= len(COMPRESSIONS):
+        raise ValueError("Shard manifest is corrupt")
+    return ShardInfo(set_id, index, count, COMPRESSIONS[method], offset, stored_size, size)
+
+
+def unpack_shard(record: bytes) -> Tuple[ShardInfo, bytes]:
+    """Split a shard into its manifest entry and chunk, checking the chunk against its checksum"""
+    info = shard_manifest(record)
+    chunk = record[SHARD.size:]
+    if info.offset + len(chunk) > info.stored_size:
+        raise ValueError("Shard manifest is corrupt")
+    if hashlib.sha256(chunk).digest() != record[SHARD.size - 32:SHARD.size]:
+        raise ValueError(f"Shard {info.index + 1} of {info.count} is corrupt: checksum mismatch")
+    return info, chunk
@@ -0,0 +1,93 @@
+"""
+Memory-mapped pixel buffers for EmPy
+Decodes large carriers straight into a file-backed buffer instead of the heap.
+Pillow and NumPy share that buffer: the LSB engine edits it in place and the
+encoder reads it back, so the process never holds another full-resolution copy
+and the kernel can page the buffer out under memory pressure.
+
+Buffers are scratch files of the pixel scratch space (EMPY_MMAP_DIR, or
+EMPY_SCRATCH_DIR when unset); a carrier whose buffer does not fit in the
+space's quota is decoded on the heap instead. A buffer counts against the
+quota for as long as its mapped_image block is open, so callers keep that
+block open until the encoder or the bit reader is done with the pixels.
+"""
+
+import contextlib
+import logging
+from typing import Iterator, Tuple
+
+import numpy as np
+from PIL import Image
+
+from . import metrics
+from .scratch import pixel_scratch
+from ..config import MMAP_MIN_PIXELS
+
+logger = logging.getLogger(__name__)
+
+# Rows converted per step when a carrier cannot be decoded into the buffer directly
+STRIP_ROWS = 256
+
+# Sample type and samples per pixel of the buffer, matching how Pillow stores each mode
+BUFFER_LAYOUTS = {
+    'RGB': (np.uint8, 4),
+    'RGBA': (np.uint8, 4),
+    'L': (np.uint8, 1),
+    'I;16': (np.uint16, 1),
+    'I': (np.int32, 1),
+}
+
+
+def buffer_bytes(size: tuple, mode: str) -> int:
+    dtype, samples = BUFFER_LAYOUTS[mode]
+    return size[0] * size[1] * samples * np.dtype(dtype).itemsize
+
+
+def use_mapped(size: tuple, mode: str) -> bool:
+    """Whether a carrier is large enough to be processed in a memory-mapped buffer, and the buffer fits"""
+    if size[0] * size[1] < MMAP_MIN_PIXELS:
+        return False
+    if not pixel_scratch.has_room(buffer_bytes(size, mode)):
+        logger.warning("No scratch space for a %sx%s pixel buffer, decoding in memory", *size)
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def mapped_image(img: Image.Image, mode: str) -> Iterator[Tuple[Image.Image, np.ndarray]]:
+    """Decode `img` into a memory-mapped buffer, converting it to `mode` (a native carrier mode)
+
+    Yields an image in `mode` backed by the buffer and a flat (pixels, samples)
+    view of it; for RGB the fourth byte of every pixel is padding. Both stay
+    valid, and the buffer reserved in the pixel scratch space, until the block
+    exits; neither may be used after that.
+    """
+    width, height = img.size
+    dtype, samples = BUFFER_LAYOUTS[mode]
+
+    # Pillow keeps RGB and RGBA pixels as 4 bytes, so the buffer matches its layout
+    size = buffer_bytes(img.size, mode)
+    with pixel_scratch.temporary_file(size, prefix='empy-pixels-') as backing:
+        backing.truncate(size)
+        buffer = np.memmap(backing, dtype=dtype, mode='r+', shape=(height, width, samples))
+        core = Image.core.map_buffer(buffer, img.size, 'raw', 0, (mode, 0, 1))
+
+        with metrics.stage('decode'):
+            if img.mode == mode and img.im is None:
+                # Let the decoder write into the buffer; load_prepare keeps an image of the right mode
+                img.im = core
+                img.load()
+            if img.im is not core:
+                # Already decoded, decoded elsewhere by the plugin, or needs conversion: copy in strips
+                logger.debug("Copying %s carrier into mapped buffer in strips of %s rows", img.mode, STRIP_ROWS)
+                for top in range(0, height, STRIP_ROWS):
+                    strip = img.crop((0, top, width, min(height, top + STRIP_ROWS)))
+                    if strip.mode != mode:
+                        strip = strip.convert(mode)
+                    bands = len(strip.getbands())
+                    buffer[top:top + strip.height, :, :bands] = np.asarray(strip).reshape(strip.height, width, bands)
+
+        mapped = Image.new(mode, (1, 1))._new(core)
+        logger.debug("Decoded %sx%s carrier into a memory-mapped buffer", width, height)
+        # The backing file is already unlinked; its pages go away with the last reference
+        yield mapped, buffer.reshape(-1, samples)
@@ -0,0 +1,122 @@
+"""
+Pixel index sequences for EmPy
+Builds the pixel selection order for a carrier in one vectorized pass and keeps
+recently used sequences in an LRU cache keyed by carrier size and bounded by
+the bytes the sequences hold.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import math
+import threading
+from typing import Callable, Dict
+
+import numpy as np
+
+from ..config import INDEX_CACHE_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+def sieve_primes(limit: int) -> np.ndarray:
+    """Return all primes below `limit` using a NumPy sieve of Eratosthenes"""
+    if limit < 3:
+        return np.empty(0, dtype=np.int64)
+    is_prime = np.ones(limit, dtype=bool)
+    is_prime[:2] = False
+    is_prime[4::2] = False
+    for i in range(3, int(limit ** 0.5) + 1, 2):
+        if is_prime[i]:
+            is_prime[i * i::2 * i] = False
+    return np.flatnonzero(is_prime)
+
+
+# Generators map a pixel count to the ordered pixel indices they select
+GENERATORS: Dict[str, Callable[[int], np.ndarray]] = {
+    'eratosthenes': sieve_primes,
+}
+
+_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_cache_bytes = 0
+_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def get_pixel_indices(width: int, height: int, generator: str = 'eratosthenes') -> np.ndarray:
+    """Return the (read-only) pixel index sequence for a carrier size"""
+    global _cache_bytes, _hits, _misses
+    key = (width, height, generator)
+
+    with _lock:
+        indices = _cache.get(key)
+        if indices is not None:
+            _cache.move_to_end(key)
+            _hits += 1
+            return indices
+        _misses += 1
+
+    if generator not in GENERATORS:
+        raise ValueError(f"Unknown pixel generator: {generator}")
+    indices = GENERATORS[generator](width * height)
+    indices.flags.writeable = False
+    logger.info("Built %s index sequence for %sx%s (%s pixels)", generator, width, height, len(indices))
+
+    if indices.nbytes > INDEX_CACHE_BYTES:
+        return indices  # would evict everything else and still not fit
+
+    with _lock:
+        previous = _cache.pop(key, None)
+        if previous is not None:
+            _cache_bytes -= previous.nbytes
+        _cache[key] = indices
+        _cache_bytes += indices.nbytes
+        while _cache_bytes > INDEX_CACHE_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= evicted.nbytes
+    return indices
+
+
+def cache_info() -> dict:
+    """Return hit/miss counters and occupancy of the index cache"""
+    with _lock:
+        return {
+            "hits": _hits,
+            "misses": _misses,
+            "size": len(_cache),
+            "bytes": _cache_bytes,
+            "max_bytes": INDEX_CACHE_BYTES,
+        }
+
+
+def clear_cache() -> None:
+    """Drop all cached sequences and reset the counters"""
+    global _cache_bytes, _hits, _misses
+    with _lock:
+        _cache.clear()
+        _cache_bytes = 0
+        _hits = 0
+        _misses = 0
+
+
+def shuffled_indices(start: int, stop: int, count: int, seed: int, first: int = 0) -> np.ndarray:
+    """Return `count` distinct pixel indices from [start, stop) in a seeded order
+
+    Uses an affine permutation i -> (a * i + b) mod n with a coprime to n, so the
+    order is stable across NumPy versions and costs O(count) memory. `first`
+    skips that many positions of the order, so long sequences can be produced
+    in pieces.
+    """
+    span = stop - start
+    if first + count > span:
+        raise ValueError("The carrier image is too small for this payload")
+    if span <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    digest = hashlib.sha256(f"{seed}:{span}".encode('ascii')).digest()
+    a = int.from_bytes(digest[:8], 'big') % span or 1
+    b = int.from_bytes(digest[8:16], 'big') % span
+    while math.gcd(a, span) != 1:
+        a = a % (span - 1) + 1
+    return (a * np.arange(first, first + count, dtype=np.int64) + b) % span + start
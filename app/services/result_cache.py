@@ -0,0 +1,229 @@
+"""
+Result cache for EmPy
+Keeps embed/extract outputs keyed by a SHA-256 of the inputs and parameters,
+so a repeated request is answered without decoding a single pixel.
+
+Entries live in a memory tier with a byte budget; entries evicted from memory
+(or too large for it) move to an optional disk tier with its own budget. Both
+tiers evict least recently used entries first.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from typing import List, NamedTuple, Optional, Tuple
+
+from ..config import RESULT_CACHE_BYTES, RESULT_CACHE_DIR, RESULT_CACHE_DISK_BYTES
+
+logger = logging.getLogger(__name__)
+
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class CachedResult(NamedTuple):
+    data: bytes
+    filename: str = ''
+    mime_type: str = ''
+
+
+def cache_key(operation: str, *parts) -> str:
+    """SHA-256 over an operation name and its inputs
+
+    Every part is length-prefixed, so different splits of the same bytes never
+    collide. Bytes-like parts are hashed as-is, everything else by its repr.
+    """
+    digest = hashlib.sha256(operation.encode('utf-8'))
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            view = memoryview(part)
+            digest.update(b'b%d:' % view.nbytes)
+            digest.update(view)
+        else:
+            text = repr(part).encode('utf-8')
+            digest.update(b's%d:' % len(text))
+            digest.update(text)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory, then disk) LRU cache with byte budgets"""
+
+    def __init__(self, memory_bytes: int, disk_dir: str = '', disk_bytes: int = 0):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir if disk_bytes > 0 else ''
+        self.disk_bytes = disk_bytes if disk_dir else 0
+        self._memory: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._memory_used = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_used = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_bytes > 0 or bool(self.disk_dir)
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        """Return the cached result for `key`, or None on a miss"""
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self._hits += 1
+                return result
+            if key not in self._disk:
+                self._misses += 1
+                return None
+            self._disk.move_to_end(key)
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self._misses += 1
+                self._forget_disk(key)
+                return None
+            self._hits += 1
+            evicted = self._store_memory(key, result)
+        self._spill(evicted)
+        return result
+
+    def put(self, key: str, result: CachedResult) -> None:
+        """Store a result; entries pushed out of memory move to the disk tier"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            evicted = self._store_memory(key, result)
+        self._spill(evicted)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and occupancy of both tiers"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "memory": {
+                    "entries": len(self._memory),
+                    "bytes": self._memory_used,
+                    "max_bytes": self.memory_bytes,
+                },
+                "disk": {
+                    "entries": len(self._disk),
+                    "bytes": self._disk_used,
+                    "max_bytes": self.disk_bytes,
+                    "path": self.disk_dir or None,
+                },
+            }
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers and reset the counters"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+            for key in list(self._disk):
+                self._forget_disk(key)
+            self._hits = 0
+            self._misses = 0
+
+    def _store_memory(self, key: str, result: CachedResult) -> List[Tuple[str, CachedResult]]:
+        """Add to the memory tier (lock held); returns the entries that no longer fit"""
+        size = len(result.data)
+        if size > self.memory_bytes:
+            return [(key, result)]
+        self._memory[key] = result
+        self._memory_used += size
+        evicted = []
+        while self._memory_used > self.memory_bytes:
+            old_key, old = self._memory.popitem(last=False)
+            self._memory_used -= len(old.data)
+            evicted.append((old_key, old))
+        return evicted
+
+    def _spill(self, entries: List[Tuple[str, CachedResult]]) -> None:
+        for key, result in entries:
+            self._write_disk(key, result)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key)
+
+    def _write_disk(self, key: str, result: CachedResult) -> None:
+        # One JSON metadata line, then the raw output; renamed into place atomically
+        meta = json.dumps({"filename": result.filename, "mime_type": result.mime_type}).encode('utf-8')
+        size = len(meta) + 1 + len(result.data)
+        if not self.disk_dir or size > self.disk_bytes:
+            return
+        with self._lock:
+            if key in self._disk:
+                return
+
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.disk_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(meta + b'\n')
+                f.write(result.data)
+            os.replace(temp_path, self._path(key))
+        except OSError as e:
+            logger.error("Failed to write cache entry %s: %s", key, e)
+            return
+
+        with self._lock:
+            if key in self._disk:
+                return
+            self._disk[key] = size
+            self._disk_used += size
+            while self._disk_used > self.disk_bytes:
+                self._forget_disk(next(iter(self._disk)))
+
+    def _read_disk(self, key: str) -> Optional[CachedResult]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                meta = json.loads(f.readline())
+                return CachedResult(f.read(), meta.get("filename", ''), meta.get("mime_type", ''))
+        except (OSError, ValueError) as e:
+            logger.error("Failed to read cache entry %s: %s", key, e)
+            return None
+
+    def _forget_disk(self, key: str) -> None:
+        """Remove a disk entry and its file (lock held)"""
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self._disk_used -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _load_disk_index(self) -> None:
+        """Pick up entries left by a previous run, oldest first"""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if name.startswith('.tmp-'):
+                os.remove(path)
+            elif _KEY_PATTERN.match(name):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_used += size
+        while self._disk_used > self.disk_bytes:
+            self._forget_disk(next(iter(self._disk)))
+        if self._disk:
+            logger.info("Loaded %s cached results (%s bytes) from %s", len(self._disk), self._disk_used, self.disk_dir)
+
+
+result_cache = ResultCache(RESULT_CACHE_BYTES, RESULT_CACHE_DIR, RESULT_CACHE_DISK_BYTES)
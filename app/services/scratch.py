@@ -0,0 +1,198 @@
+"""
+Scratch storage for EmPy
+Every temporary file the server writes goes through a ScratchSpace: response
+spools and memory-mapped pixel buffers. A space lives in a directory (EMPY_SCRATCH_DIR, which may be a tmpfs or
+RAM disk) in which each process keeps its own empy-<pid>-<token> subdirectory.
+
+Temporary files are unlinked as soon as they are created, so they disappear
+with the last handle whatever happens to the request. Every file is counted as
+bytes in flight while it exists; a space refuses new ones past its quota or when the file
+system would drop below EMPY_SCRATCH_MIN_FREE_BYTES, and callers fall back to
+memory. The janitor removes the directories of processes that are gone.
+"""
+
+import asyncio
+import contextlib
+import logging
+import multiprocessing.util
+import os
+import re
+import shutil
+import tempfile
+import threading
+from typing import BinaryIO, Iterator, List, Optional
+
+from . import metrics
+from ..config import SCRATCH_DIR, SCRATCH_QUOTA_BYTES, SCRATCH_MIN_FREE_BYTES, SCRATCH_SWEEP_INTERVAL, MMAP_DIR
+
+logger = logging.getLogger(__name__)
+
+_PROCESS_DIR = re.compile(r'^empy-(\d+)-\w+$')
+
+
+class ScratchQuotaError(RuntimeError):
+    """Raised when a scratch space has no room for another file"""
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _filesystem_type(path: str) -> str:
+    """Type of the file system holding `path` (from /proc/mounts; '' when unknown)"""
+    path = os.path.realpath(path)
+    best, fs_type = '', ''
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                mount_point = fields[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) \
+                        and len(mount_point) >= len(best):
+                    best, fs_type = mount_point, fields[2]
+    except OSError:
+        pass
+    return fs_type
+
+
+class ScratchSpace:
+    """Temporary files in one directory, with a quota on the bytes in flight
+
+    The quota is per process: every pool worker accounts for its own files.
+    """
+
+    def __init__(self, root: str = '', quota_bytes: int = SCRATCH_QUOTA_BYTES,
+                 min_free_bytes: int = SCRATCH_MIN_FREE_BYTES):
+        self.root = root or tempfile.gettempdir()
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self._directory = ''
+        self._pid = 0
+        self._in_flight = 0
+        self._files = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_memory(self) -> bool:
+        """Whether the space is on a tmpfs/RAM disk, where files take memory rather than disk"""
+        return _filesystem_type(self.root) in ('tmpfs', 'ramfs')
+
+    @property
+    def directory(self) -> str:
+        """This process' directory in the space, created on first use"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                os.makedirs(self.root, exist_ok=True)
+                self._directory = tempfile.mkdtemp(dir=self.root, prefix=f'empy-{self._pid}-')
+                # Remove it at exit; pool workers skip atexit, but run multiprocessing finalizers
+                multiprocessing.util.Finalize(None, shutil.rmtree, args=(self._directory, True), exitpriority=0)
+            return self._directory
+
+    def has_room(self, size: int) -> bool:
+        """Whether `size` more bytes fit in the quota and leave the minimum free space"""
+        with self._lock:
+            if self.quota_bytes and self._in_flight + size > self.quota_bytes:
+                return False
+        try:
+            return shutil.disk_usage(self.directory).free - size >= self.min_free_bytes
+        except OSError:
+            return False
+
+    @contextlib.contextmanager
+    def reserve(self, size: int) -> Iterator[None]:
+        """Count `size` bytes as in flight for the duration of the block
+
+        Raises ScratchQuotaError when they do not fit (see has_room).
+        """
+        if not self.has_room(size):
+            raise ScratchQuotaError(f"No room for {size} bytes of scratch space in {self.root}")
+        with self._lock:
+            self._in_flight += size
+            self._files += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= size
+                self._files -= 1
+
+    @contextlib.contextmanager
+    def temporary_file(self, size: int, prefix: str = 'empy-') -> Iterator[BinaryIO]:
+        """An unlinked temporary file for up to `size` bytes, closed when the block exits"""
+        with self.reserve(size), tempfile.TemporaryFile(dir=self.directory, prefix=prefix) as f:
+            yield f
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": self.root, "bytes_in_flight": self._in_flight, "files": self._files,
+                    "quota_bytes": self.quota_bytes}
+
+    def sweep(self) -> int:
+        """Remove the directories of dead processes; returns the count"""
+        removed = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return 0
+        for entry in entries:
+            match = _PROCESS_DIR.match(entry.name)
+            if not match or not entry.is_dir(follow_symlinks=False):
+                continue
+            if not _process_alive(int(match.group(1))):
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
+
+
+# General scratch space, and the one for memory-mapped pixel buffers (disk-backed if EMPY_MMAP_DIR is set)
+scratch = ScratchSpace(SCRATCH_DIR)
+pixel_scratch = ScratchSpace(MMAP_DIR) if MMAP_DIR and MMAP_DIR != SCRATCH_DIR else scratch
+
+
+def spaces() -> List[ScratchSpace]:
+    return [scratch] if pixel_scratch is scratch else [scratch, pixel_scratch]
+
+
+metrics.Gauge('empy_scratch_bytes_in_flight', "Bytes of scratch files in use by the server process",
+              lambda: sum(space.stats()["bytes_in_flight"] for space in spaces()))
+
+_janitor_task: Optional[asyncio.Task] = None
+
+
+def sweep_all() -> int:
+    return sum(space.sweep() for space in spaces())
+
+
+async def _janitor_loop() -> None:
+    while True:
+        try:
+            removed = await asyncio.to_thread(sweep_all)
+            if removed:
+                logger.info("Removed %s stale scratch entries", removed)
+        except Exception as e:
+            logger.error("Scratch sweep failed: %s", e)
+        await asyncio.sleep(SCRATCH_SWEEP_INTERVAL)
+
+
+def start_janitor() -> None:
+    """Sweep the scratch spaces now and every EMPY_SCRATCH_SWEEP_INTERVAL seconds (call from the running loop)"""
+    global _janitor_task
+    if pixel_scratch is scratch and scratch.in_memory:
+        logger.warning("Scratch space %s is on tmpfs: memory-mapped pixel buffers will use memory, "
+                       "set EMPY_MMAP_DIR to a disk-backed directory", scratch.root)
+    _janitor_task = asyncio.create_task(_janitor_loop())
+
+
+async def stop_janitor() -> None:
+    global _janitor_task
+    if _janitor_task is not None:
+        _janitor_task.cancel()
+        await asyncio.gather(_janitor_task, return_exceptions=True)
+        _janitor_task = None
@@ -0,0 +1,166 @@
+"""
+Sharded payloads for EmPy
+Spreads a payload too large for any one carrier over several. The payload is
+compressed once and the stored bytes are split in proportion to each carrier's
+capacity, so every carrier's embed job does a similar amount of work; each chunk
+travels with its shard manifest entry (see payload_format) in a container
+flagged as a shard. Capacities come from the image headers, so a payload that
+does not fit is rejected before any pixels are decoded.
+
+The functions here do one carrier each, so callers can run the shards of one
+payload in parallel; embed_shards and assemble are the serial versions.
+"""
+
+import logging
+import secrets
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from . import compression as payload_compression, file_types, payload_format
+from .embed_service import ImageSource, carrier_capacity, embed_file_in_image, extract_file_from_image
+from ..config import COMPRESSION, MAX_DECOMPRESSED_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class Shard(NamedTuple):
+    info: payload_format.ShardInfo
+    chunk: bytes
+    filename: str
+    mime_type: str
+
+
+def split_sizes(total: int, capacities: List[int]) -> List[int]:
+    """Share `total` bytes between carriers in proportion to their capacities"""
+    room = sum(capacities)
+    sizes = [capacity * total // room if room else 0 for capacity in capacities]
+    remaining = total - sum(sizes)
+    for index, capacity in enumerate(capacities):
+        extra = min(remaining, capacity - sizes[index])
+        sizes[index] += extra
+        remaining -= extra
+    return sizes
+
+
+def split_payload(carriers: List[ImageSource], payload: bytes, filename: str = '', mime_type: str = '',
+                  bits_per_channel: int = 1, strategy: str = 'prime', output_format: str = 'png',
+                  compression: Optional[str] = None, use_alpha: Optional[bool] = None,
+                  max_pixels: Optional[int] = None) -> Tuple[str, List[bytes]]:
+    """Compress a payload and cut it into one shard per carrier, in carrier order
+
+    Returns the payload's MIME type (sniffed when not given) with the shards,
+    which are embedded with embed_shard, that MIME type and the same options.
+    Raises ValueError when the carriers cannot hold the payload between them.
+    """
+    if not carriers:
+        raise ValueError("No carriers given")
+    if len(carriers) > 2 ** 16 - 1:
+        raise ValueError(f"A payload can be split over at most {2 ** 16 - 1} carriers")
+    if not mime_type or mime_type == file_types.DEFAULT_MIME_TYPE:
+        mime_type = file_types.detect_mime_type(payload)
+    method, stored = payload_compression.compress(payload, compression or COMPRESSION, mime_type)
+
+    capacities = []
+    for index, carrier in enumerate(carriers):
+        capacity = carrier_capacity(carrier, bits_per_channel, strategy, filename, mime_type, output_format,
+                                    use_alpha, max_pixels) - payload_format.SHARD.size
+        if capacity < 0:
+            raise ValueError(f"Carrier {index + 1} is too small to hold a shard")
+        capacities.append(capacity)
+    if len(stored) > sum(capacities):
+        raise ValueError(f"Carrier images too small: payload needs {len(stored)} bytes, "
+                         f"the {len(carriers)} carriers hold {sum(capacities)} bytes with this layout")
+
+    set_id = secrets.token_bytes(16)
+    shards, offset = [], 0
+    for index, size in enumerate(split_sizes(len(stored), capacities)):
+        shards.append(payload_format.pack_shard(stored[offset:offset + size], set_id, index, len(carriers),
+                                                method, offset, len(stored), len(payload)))
+        offset += size
+    logger.debug("Split %s byte payload (%s, %s stored) into %s shards", len(payload), method, len(stored),
+                 len(shards))
+    return mime_type, shards
+
+
+def embed_shard(image: ImageSource, shard: bytes, filename: str = '', mime_type: str = '', **options) -> bytes:
+    """Embed one shard from split_payload; `options` are those of embed_file_in_image"""
+    options['compression'] = 'none'  # the payload was compressed before it was split
+    return embed_file_in_image(image, shard, filename, mime_type, shard=True, **options)
+
+
+def embed_shards(carriers: List[ImageSource], payload: bytes, filename: str = '', mime_type: str = '',
+                 **options) -> List[bytes]:
+    """Split a payload over `carriers` and return the embedded images in carrier order"""
+    split_options = {name: options[name] for name in ('bits_per_channel', 'strategy', 'output_format',
+                                                      'compression', 'use_alpha', 'max_pixels')
+                     if name in options}
+    mime_type, shards = split_payload(carriers, payload, filename, mime_type, **split_options)
+    return [embed_shard(carrier, shard, filename, mime_type, **options) for carrier, shard in zip(carriers, shards)]
+
+
+def extract_shard(image: ImageSource) -> Shard:
+    """Read the shard held by an image, checking it against its checksum"""
+    extracted = extract_file_from_image(image, shard=True)
+    info, chunk = payload_format.unpack_shard(extracted.data)
+    return Shard(info, chunk, extracted.filename, extracted.mime_type)
+
+
+def check_shard(shard: Shard, first: Shard) -> None:
+    """Reject a shard that does not belong to the same payload as `first`"""
+    if shard.info.set_id != first.info.set_id or shard.info.count != first.info.count:
+        raise ValueError(f"Shard {shard.info.index + 1} belongs to a different payload")
+
+
+class Reassembler:
+    """Puts the shards of one payload back together in order, whatever order they arrive in
+
+    add() returns the payload bytes each shard completes, decompressed; finish()
+    checks that every shard arrived and the payload has its recorded size.
+    """
+
+    def __init__(self, first: Shard, max_size: int = MAX_DECOMPRESSED_BYTES):
+        self.first = first
+        self.count = first.info.count
+        if first.info.size > max_size:
+            raise ValueError(f"Embedded payload expands beyond {max_size} bytes")
+        self._decompressor = payload_compression.StreamDecompressor(first.info.compression, max_size)
+        self._waiting = {}
+        self._next = 0
+        self._offset = 0
+
+    def add(self, shard: Shard) -> bytes:
+        check_shard(shard, self.first)
+        index = shard.info.index
+        if index < self._next or index in self._waiting:
+            raise ValueError(f"Shard {index + 1} of {self.count} was given twice")
+        self._waiting[index] = shard
+        output = []
+        while self._next in self._waiting:
+            shard = self._waiting.pop(self._next)
+            if shard.info.offset != self._offset:
+                raise ValueError(f"Shard {self._next + 1} of {self.count} does not follow the previous one")
+            self._offset += len(shard.chunk)
+            output.append(self._decompressor.feed(shard.chunk))
+            self._next += 1
+        return b''.join(output)
+
+    def finish(self) -> None:
+        if self._next < self.count:
+            raise ValueError(f"Shard {self._next + 1} of {self.count} is missing")
+        if self._offset != self.first.info.stored_size:
+            raise ValueError("Sharded payload is truncated")
+        self._decompressor.finish()
+        if self._decompressor.size != self.first.info.size:
+            raise ValueError("Sharded payload does not have its recorded size")
+
+
+def assemble(shards: Iterable[Shard]) -> bytes:
+    """Reassemble a payload from all of its shards, in any order"""
+    shards = list(shards)
+    if not shards:
+        raise ValueError("No shards given")
+    reassembler = Reassembler(shards[0])
+    if len(shards) != reassembler.count:
+        raise ValueError(f"Got {len(shards)} shards, the payload was split into {reassembler.count}")
+    data = b''.join(reassembler.add(shard) for shard in shards)
+    reassembler.finish()
+    return data
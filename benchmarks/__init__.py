@@ -0,0 +1,5 @@
+"""
+Benchmarks package for EmPy
+Run individual benchmarks from the repository root, e.g.
+python -m benchmarks.bench_lsb_engine
+"""
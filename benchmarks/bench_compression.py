@@ -0,0 +1,103 @@
+"""
+Embed/extract time, pixels touched and output size for every payload compression method
+
+Usage:
+    python -m benchmarks.bench_compression [--megapixels 12] [--payload-kb 1024] [--repeat 3]
+
+Three payload kinds are embedded into the same photo-like carrier (see
+bench_output_encoding) with sequential pixel selection and every available
+method (plus 'auto'): generated English-like text, JSON records and random
+bytes. For each run the table shows how many bytes end up in the image, how
+many pixels that takes at 1 bit per channel, the time spent compressing and
+writing those bits into the pixels, and the end-to-end embed and extract
+times, which also include decoding and encoding the carrier. Every output is
+extracted and compared with the original payload.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from app.services import compression, lsb_engine, payload_format
+from app.services.embed_service import embed_file_in_image, extract_file_from_image
+from benchmarks.bench_output_encoding import make_carrier
+
+WORDS = ("the quick brown fox jumps over lazy dog image pixel carrier payload header "
+         "channel bit byte stream embed extract compress lossless format steganography").split()
+
+
+def make_text(size: int, rng: np.random.Generator) -> bytes:
+    words = rng.choice(WORDS, size // 4)
+    return ' '.join(words).encode('ascii')[:size]
+
+
+def make_json(size: int, rng: np.random.Generator) -> bytes:
+    records, length = [], 0
+    while length < size:
+        record = {"id": len(records), "name": str(rng.choice(WORDS)), "score": round(float(rng.random()), 4),
+                  "tags": [str(tag) for tag in rng.choice(WORDS, 3)], "active": bool(rng.random() > 0.5)}
+        records.append(record)
+        length += len(json.dumps(record)) + 2
+    return json.dumps(records).encode('ascii')[:size]
+
+
+def make_random(size: int, rng: np.random.Generator) -> bytes:
+    return os.urandom(size)
+
+
+PAYLOADS = {
+    'text': (make_text, 'text/plain'),
+    'json': (make_json, 'application/json'),
+    'random': (make_random, 'application/octet-stream'),
+}
+
+
+def best_of(repeat: int, func, *args, **kwargs):
+    """Run func `repeat` times and return (best seconds, last result)"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--megapixels', type=float, default=12, help="carrier size")
+    parser.add_argument('--payload-kb', type=int, default=1024, help="payload size in KiB")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    carrier = make_carrier(args.megapixels)
+    rng = np.random.default_rng(0)
+    methods = ('auto',) + compression.available()
+
+    print(f"carrier: {carrier.width}x{carrier.height}, payload: {args.payload_kb} KiB, methods: {', '.join(methods)}")
+    print(f"{'payload':>9} {'method':>9} {'stored KiB':>11} {'pixels':>10} {'compress':>9} {'bit write':>10} "
+          f"{'embed':>8} {'extract':>8} {'output MiB':>11} {'round trip':>11}")
+    layout = lsb_engine.Layout(1, 'sequential', 0)
+
+    for kind, (generate, mime_type) in PAYLOADS.items():
+        payload = generate(args.payload_kb * 1024, rng)
+        for method in methods:
+            compress_time, (used, stored) = best_of(args.repeat, compression.compress, payload, method, mime_type)
+            pixels = lsb_engine.pixels_for_bytes(len(stored))
+            header, body = payload_format.pack(stored, 'payload', mime_type, 0, *layout)
+            write_time, _ = best_of(args.repeat, lsb_engine.hide_container, carrier, header, body, layout)
+            embed_time, output = best_of(args.repeat, embed_file_in_image, carrier, payload, 'payload',
+                                         mime_type, strategy='sequential', compression=method)
+            extract_time, extracted = best_of(args.repeat, extract_file_from_image, output)
+            label = f"{method}>{used}" if method == 'auto' else method
+            print(f"{kind:>9} {label:>9} {len(stored) / 1024:>11.1f} {pixels:>10} {compress_time:>8.3f}s "
+                  f"{write_time:>9.3f}s {embed_time:>7.3f}s {extract_time:>7.3f}s {len(output) / 1024 / 1024:>11.2f} "
+                  f"{'ok' if extracted.data == payload else 'FAILED':>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Peak memory and time of embed/extract on a very large carrier, in memory vs. memory-mapped
+
+Usage:
+    python -m benchmarks.bench_large_carrier [--megapixels 50] [--payload-mb 8]
+
+Each mode runs in a fresh subprocess and reports how far the peak RSS rose
+above the RSS measured just before the call, and how long embed and extract
+took:
+
+    in-memory  EMPY_MMAP_MIN_PIXELS above the carrier size: decode, convert and
+               edit copies of the image on the heap
+    mapped     EMPY_MMAP_MIN_PIXELS=0: decode straight into a memory-mapped
+               buffer, edit it in place and encode from it
+
+The SHA-256 of both outputs is compared, since the two paths must produce
+byte-identical images.
+"""
+
+import argparse
+import hashlib
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+MODES = {'in-memory': str(10 ** 12), 'mapped': '0'}
+
+
+def current_rss_kb() -> int:
+    """Resident set size of this process in KiB"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def run_worker(carrier_path: str, payload_path: str) -> None:
+    """Embed and extract once and print: peak RSS increase (MiB), embed s, extract s, output hash"""
+    import logging
+    from app.services.embed_service import embed_file_in_image, extract_file_from_image
+    logging.disable(logging.INFO)
+
+    with open(payload_path, 'rb') as f:
+        payload = f.read()
+    baseline = current_rss_kb()
+
+    start = time.perf_counter()
+    output = embed_file_in_image(carrier_path, payload, 'payload.bin', strategy='sequential',
+                                 compress_level=1)
+    embed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extracted = extract_file_from_image(output)
+    extract_time = time.perf_counter() - start
+    if extracted.data != payload:
+        raise SystemExit("round trip mismatch")
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{(peak - baseline) / 1024:.1f} {embed_time:.2f} {extract_time:.2f} "
+          f"{hashlib.sha256(output).hexdigest()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--megapixels', type=float, default=50, help="carrier size")
+    parser.add_argument('--payload-mb', type=float, default=8, help="payload size in MiB")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--carrier', help=argparse.SUPPRESS)
+    parser.add_argument('--payload', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.carrier, args.payload)
+        return
+
+    width = int((args.megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        carrier_path = os.path.join(workdir, 'carrier.png')
+        payload_path = os.path.join(workdir, 'payload.bin')
+        Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(
+            carrier_path, compress_level=1
+        )
+        with open(payload_path, 'wb') as f:
+            f.write(os.urandom(int(args.payload_mb * 1024 * 1024)))
+
+        print(f"carrier: {width}x{height} ({width * height * 3 / 1024 / 1024:.0f} MiB raw RGB), "
+              f"payload: {args.payload_mb} MiB")
+        print(f"{'mode':>10} {'peak RSS increase':>18} {'embed':>8} {'extract':>8}")
+        digests = set()
+        for mode, min_pixels in MODES.items():
+            result = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_large_carrier', '--worker',
+                 '--carrier', carrier_path, '--payload', payload_path],
+                env=dict(os.environ, EMPY_MMAP_MIN_PIXELS=min_pixels, EMPY_MMAP_DIR=workdir),
+                capture_output=True, text=True, check=True
+            )
+            rss, embed_time, extract_time, digest = result.stdout.strip().splitlines()[-1].split()
+            digests.add(digest)
+            print(f"{mode:>10} {rss:>14} MiB {embed_time:>7}s {extract_time:>7}s")
+        print(f"outputs identical: {len(digests) == 1}")
+
+
+if __name__ == '__main__':
+    main()
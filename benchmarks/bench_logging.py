@@ -0,0 +1,106 @@
+"""
+Requests per second of the embed and extract endpoints at different log settings
+
+Usage:
+    python -m benchmarks.bench_logging [--requests 300] [--megapixels 0.1]
+
+Each setting runs in a fresh subprocess (the logging setup is read at import)
+with EMPY_EXECUTOR=inline, so every log call of the request, including those in
+the service functions, happens in the measured process. Small embed and extract
+requests are sent through the in-process FastAPI test client, one at a time,
+with stdout and the log file going to temporary files:
+
+    info        EMPY_LOG_LEVEL=INFO
+    warning     EMPY_LOG_LEVEL=WARNING
+    json        EMPY_LOG_LEVEL=INFO, EMPY_LOG_FORMAT=json
+    sampled     EMPY_LOG_LEVEL=INFO, EMPY_LOG_DEBUG_SAMPLE_RATE=0.1
+    debug       EMPY_LOG_LEVEL=DEBUG
+"""
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+SETTINGS = {
+    'info': {'EMPY_LOG_LEVEL': 'INFO'},
+    'warning': {'EMPY_LOG_LEVEL': 'WARNING'},
+    'json': {'EMPY_LOG_LEVEL': 'INFO', 'EMPY_LOG_FORMAT': 'json'},
+    'sampled': {'EMPY_LOG_LEVEL': 'INFO', 'EMPY_LOG_DEBUG_SAMPLE_RATE': '0.1'},
+    'debug': {'EMPY_LOG_LEVEL': 'DEBUG'},
+}
+
+
+def run_worker(requests: int, megapixels: float) -> None:
+    """Time `requests` embed and extract requests; print req/s of each on the last line"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(buffer, 'PNG')
+    carrier, payload = buffer.getvalue(), os.urandom(1024)
+
+    with TestClient(app) as client:
+        def embed():
+            return client.post('/api/embed/embed', files={
+                'carrier_image': ('carrier.png', carrier, 'image/png'),
+                'file_to_embed': ('payload.bin', payload, 'application/octet-stream'),
+            }, data={'compression': 'none'})
+
+        embedded = embed().content
+        start = time.perf_counter()
+        for _ in range(requests):
+            embed().raise_for_status()
+        embed_rate = requests / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            client.post('/api/embed/extract', files={
+                'image': ('embedded.png', embedded, 'image/png')
+            }).raise_for_status()
+        extract_rate = requests / (time.perf_counter() - start)
+    print(f"{embed_rate:.1f} {extract_rate:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=300, help="requests per endpoint")
+    parser.add_argument('--megapixels', type=float, default=0.1, help="carrier size")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.requests, args.megapixels)
+        return
+
+    print(f"{args.requests} requests per endpoint, {args.megapixels} MP carrier, 1 KiB payload")
+    print(f"{'setting':>8} {'embed req/s':>12} {'extract req/s':>14} {'log lines':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, env in SETTINGS.items():
+            log_file = os.path.join(workdir, f'{name}.log')
+            with open(os.path.join(workdir, f'{name}.out'), 'w+') as stdout:
+                subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_logging', '--worker',
+                     '--requests', str(args.requests), '--megapixels', str(args.megapixels)],
+                    env=dict(os.environ, EMPY_EXECUTOR='inline', EMPY_LOG_FILE=log_file,
+                             EMPY_RESULT_CACHE_BYTES='0', **env),
+                    stdout=stdout, check=True
+                )
+                stdout.seek(0)
+                embed_rate, extract_rate = stdout.read().strip().splitlines()[-1].split()
+            with open(log_file) as f:
+                lines = sum(1 for _ in f)
+            print(f"{name:>8} {embed_rate:>12} {extract_rate:>14} {lines:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare the vectorized LSB engine against stegano's per-pixel loop
+
+Usage:
+    python -m benchmarks.bench_lsb_engine [--sizes 0.25 1 4 12] [--payload-kb 4] [--repeat 3]
+
+For every carrier size (in megapixels) a random RGB carrier is generated and the
+same base64 payload is hidden and revealed with both implementations. Every
+engine output is also read back with stegano.lsb.reveal to check compatibility,
+and a non-ASCII (Latin-1) message is exchanged both ways before timing starts.
+The "cold" column includes building the prime index sequence for the carrier
+size; the other engine columns hit the index cache.
+"""
+
+import argparse
+import base64
+import os
+import time
+
+import numpy as np
+from PIL import Image
+from stegano import lsb
+from stegano.lsb import generators
+
+from app.services import lsb_engine, pixel_index
+
+
+def make_carrier(megapixels: float) -> Image.Image:
+    """Generate a random 4:3 RGB carrier of roughly the given size"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), 'RGB')
+
+
+def best_of(repeat: int, func, *args):
+    """Run func `repeat` times and return (best seconds, last result)"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# Characters above U+007F that stegano stores as single 8-bit code points
+LATIN1_MESSAGE = "h\u00e9llo w\u00f6rld \u00a9 \u00ff"
+
+
+def check_compatibility() -> None:
+    """Exchange a non-ASCII message with stegano in both directions"""
+    carrier = make_carrier(0.05)
+    ours = lsb_engine.hide(carrier, LATIN1_MESSAGE)
+    if lsb.reveal(ours, generators.eratosthenes()) != LATIN1_MESSAGE:
+        raise SystemExit("stegano cannot read a non-ASCII message hidden by the engine")
+    theirs = lsb.hide(carrier.copy(), LATIN1_MESSAGE, generators.eratosthenes())
+    if lsb_engine.reveal(theirs) != LATIN1_MESSAGE:
+        raise SystemExit("the engine cannot read a non-ASCII message hidden by stegano")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.25, 1, 4, 12],
+                        help="carrier sizes in megapixels")
+    parser.add_argument('--payload-kb', type=int, default=4, help="payload size in KiB")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement")
+    args = parser.parse_args()
+
+    check_compatibility()
+    message = base64.b64encode(os.urandom(args.payload_kb * 1024)).decode('ascii')
+
+    print(f"payload: {args.payload_kb} KiB raw, {len(message)} chars base64")
+    print(f"{'carrier':>10} {'stegano hide':>13} {'cold':>8} {'engine hide':>12} {'speedup':>8} "
+          f"{'stegano reveal':>15} {'engine reveal':>14} {'speedup':>8}")
+
+    for megapixels in args.sizes:
+        carrier = make_carrier(megapixels)
+
+        stegano_hide, _ = best_of(
+            args.repeat, lambda: lsb.hide(carrier.copy(), message, generators.eratosthenes())
+        )
+        pixel_index.clear_cache()
+        engine_cold, _ = best_of(1, lsb_engine.hide, carrier, message)
+        engine_hide, secret = best_of(args.repeat, lsb_engine.hide, carrier, message)
+
+        stegano_reveal, stegano_message = best_of(
+            args.repeat, lambda: lsb.reveal(secret.copy(), generators.eratosthenes())
+        )
+        engine_reveal, engine_message = best_of(args.repeat, lsb_engine.reveal, secret)
+
+        if stegano_message != message or engine_message != message:
+            raise SystemExit(f"round trip mismatch at {megapixels} MP")
+
+        print(f"{megapixels:>8.2f}MP {stegano_hide:>12.3f}s {engine_cold:>7.3f}s {engine_hide:>11.3f}s "
+              f"{stegano_hide / engine_hide:>7.1f}x {stegano_reveal:>14.3f}s "
+              f"{engine_reveal:>13.3f}s {stegano_reveal / engine_reveal:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
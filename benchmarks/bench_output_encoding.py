@@ -0,0 +1,81 @@
+"""
+Encode time vs. output size for every lossless output mode
+
+Usage:
+    python -m benchmarks.bench_output_encoding [--megapixels 4] [--payload-kb 64] [--repeat 3]
+
+A photo-like carrier (smooth gradients plus mild noise, so it compresses like
+a real picture rather than like random data) gets a payload embedded once.
+The resulting image is then encoded with every output mode, timed, and read
+back with extract_file_from_image to check that the payload survives.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.services import lsb_engine, payload_format
+from app.services.embed_service import encode_image, extract_file_from_image
+
+MODES = (
+    [('png', level, False) for level in (0, 1, 3, 6, 9)]
+    + [('png', 9, True)]
+    + [('webp', level, False) for level in (0, 6, 9)]
+    + [('tiff', 0, False), ('tiff', 6, False)]
+)
+
+
+def make_carrier(megapixels: float) -> Image.Image:
+    """Generate a 4:3 RGB carrier with smooth gradients and a little sensor-like noise"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rng = np.random.default_rng(0)
+    channels = [
+        128 + 100 * np.sin(x / width * np.pi * (1 + band)) * np.cos(y / height * np.pi * (2 - band / 2))
+        for band in range(3)
+    ]
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 3, (height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+
+
+def best_of(repeat: int, func, *args):
+    """Run func `repeat` times and return (best seconds, last result)"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--megapixels', type=float, default=4, help="carrier size")
+    parser.add_argument('--payload-kb', type=int, default=64, help="payload size in KiB")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.payload_kb * 1024)
+    layout = lsb_engine.Layout(1, 'sequential', 0)
+    header, body = payload_format.pack(payload, 'payload.bin', 'application/octet-stream', 0, *layout)
+    secret = lsb_engine.hide_container(make_carrier(args.megapixels), header, body, layout)
+    raw_size = secret.width * secret.height * len(secret.getbands())
+
+    print(f"carrier: {secret.width}x{secret.height} ({raw_size / 1024 / 1024:.1f} MiB raw), "
+          f"payload: {args.payload_kb} KiB")
+    print(f"{'format':>7} {'level':>6} {'optimize':>9} {'encode':>9} {'size MiB':>9} {'ratio':>6} {'round trip':>11}")
+
+    for output_format, level, optimize in MODES:
+        seconds, output = best_of(args.repeat, encode_image, secret, output_format, level, optimize)
+        round_trip = extract_file_from_image(output).data == payload
+        print(f"{output_format:>7} {level:>6} {str(optimize):>9} {seconds:>8.3f}s "
+              f"{len(output) / 1024 / 1024:>9.2f} {len(output) / raw_size:>6.2f} "
+              f"{'ok' if round_trip else 'FAILED':>11}")
+
+
+if __name__ == '__main__':
+    main()
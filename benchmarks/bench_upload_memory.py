@@ -0,0 +1,121 @@
+"""
+Peak memory per embed request: whole-file upload reads vs. streamed uploads
+
+Usage:
+    python -m benchmarks.bench_upload_memory [--megapixels 12] [--payload-mb 12]
+
+Each mode runs in a fresh subprocess and reports how far the peak RSS rose
+above the RSS measured just before the request was handled:
+
+    buffered   the previous router flow: await upload.read() kept alive for the
+               whole request, copied into a NamedTemporaryFile and re-read
+               from disk by the service
+    streaming  the current flow: read_upload() streams chunks into one
+               in-memory buffer that is handed to the service directly
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+MODES = ('buffered', 'streaming')
+
+
+def current_rss_kb() -> int:
+    """Resident set size of this process in KiB"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+async def handle(mode: str, carrier_path: str, payload_path: str) -> None:
+    from starlette.datastructures import UploadFile
+    from app.routers.embed import read_upload
+    from app.services.embed_service import embed_file_in_image
+
+    with open(carrier_path, 'rb') as carrier_file, open(payload_path, 'rb') as payload_file:
+        carrier = UploadFile(carrier_file, filename='carrier.png')
+        payload = UploadFile(payload_file, filename='payload.bin')
+
+        if mode == 'buffered':
+            temp_image = tempfile.NamedTemporaryFile(delete=False)
+            temp_file = tempfile.NamedTemporaryFile(delete=False)
+            carrier_content = await carrier.read()
+            temp_image.write(carrier_content)
+            embed_content = await payload.read()
+            temp_file.write(embed_content)
+            temp_image.close()
+            temp_file.close()
+            embed_file_in_image(temp_image.name, temp_file.name,
+                                bits_per_channel=4, strategy='sequential')
+            os.remove(temp_image.name)
+            os.remove(temp_file.name)
+            del carrier_content, embed_content
+        else:
+            carrier_buffer = await read_upload(carrier)
+            payload_buffer = await read_upload(payload)
+            embed_file_in_image(carrier_buffer, payload_buffer.getbuffer(),
+                                filename='payload.bin',
+                                bits_per_channel=4, strategy='sequential')
+
+
+def run_worker(mode: str, carrier_path: str, payload_path: str) -> None:
+    """Handle one request and print the peak RSS increase in MiB"""
+    import importlib
+    import logging
+    # Load the router and engine up front, so their import cost is not counted against the request
+    importlib.import_module('app.routers.embed')
+    logging.disable(logging.INFO)
+
+    baseline = current_rss_kb()
+    asyncio.run(handle(mode, carrier_path, payload_path))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{(peak - baseline) / 1024:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--megapixels', type=float, default=12, help="carrier size")
+    parser.add_argument('--payload-mb', type=float, default=12, help="payload size in MiB")
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--carrier', help=argparse.SUPPRESS)
+    parser.add_argument('--payload', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.carrier, args.payload)
+        return
+
+    width = int((args.megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        carrier_path = os.path.join(workdir, 'carrier.png')
+        payload_path = os.path.join(workdir, 'payload.bin')
+        Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(
+            carrier_path, compress_level=1
+        )
+        with open(payload_path, 'wb') as f:
+            f.write(os.urandom(int(args.payload_mb * 1024 * 1024)))
+
+        carrier_mb = os.path.getsize(carrier_path) / 1024 / 1024
+        print(f"carrier: {width}x{height} ({carrier_mb:.1f} MiB PNG), payload: {args.payload_mb} MiB")
+        print(f"{'mode':>10} {'peak RSS increase':>18}")
+        for mode in MODES:
+            result = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_upload_memory', '--worker', mode,
+                 '--carrier', carrier_path, '--payload', payload_path],
+                capture_output=True, text=True, check=True
+            )
+            print(f"{mode:>10} {result.stdout.strip().splitlines()[-1]:>14} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Mixed-load latency test for the embed API
+
+Usage:
+    python -m benchmarks.load_test [--executors inline process] [--duration 20]
+
+For every executor mode a uvicorn server is started with EMPY_EXECUTOR set
+accordingly. Concurrent clients then send a mix of requests for `--duration`
+seconds:
+
+    large   POST /api/embed/embed with a large carrier
+    small   POST /api/embed/embed with a small carrier
+    light   GET /api/embed/capacity (no pixel work at all)
+
+Latency percentiles are reported per request class, so the effect of large
+embeds on everything else sharing the worker is visible.
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+from PIL import Image
+
+
+def make_png(megapixels: float) -> bytes:
+    """Random RGB carrier encoded as PNG"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(
+        buffer, 'PNG', compress_level=1
+    )
+    return buffer.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list, pct: float) -> float:
+    return float(np.percentile(values, pct)) * 1000 if values else float('nan')
+
+
+async def client(http: httpx.AsyncClient, kind: str, carrier: bytes, deadline: float,
+                 results: dict) -> None:
+    payload = os.urandom(4096)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if kind == 'light':
+            response = await http.get('/api/embed/capacity', params={'width': 640, 'height': 480})
+        else:
+            response = await http.post('/api/embed/embed', files={
+                'carrier_image': ('carrier.png', carrier, 'image/png'),
+                'file_to_embed': ('payload.bin', payload, 'application/octet-stream'),
+            })
+        elapsed = time.perf_counter() - start
+        results[kind].append(elapsed)
+        if response.status_code != 200:
+            results['errors'][response.status_code] = results['errors'].get(response.status_code, 0) + 1
+
+
+async def run_load(base_url: str, args, large: bytes, small: bytes) -> dict:
+    results = {'large': [], 'small': [], 'light': [], 'errors': {}}
+    deadline = time.perf_counter() + args.duration
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as http:
+        tasks = (
+            [client(http, 'large', large, deadline, results) for _ in range(args.large_clients)]
+            + [client(http, 'small', small, deadline, results) for _ in range(args.small_clients)]
+            + [client(http, 'light', b'', deadline, results) for _ in range(args.light_clients)]
+        )
+        await asyncio.gather(*tasks)
+    return results
+
+
+def start_server(executor: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, EMPY_EXECUTOR=executor, EMPY_WORKERS=str(workers))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'warning'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/openapi.json', timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    server.kill()
+    raise SystemExit(f"server with executor={executor} did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--executors', nargs='+', default=['inline', 'process'],
+                        choices=['inline', 'thread', 'process'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--duration', type=float, default=20, help="seconds per executor")
+    parser.add_argument('--large-mp', type=float, default=8, help="large carrier size (MP)")
+    parser.add_argument('--small-mp', type=float, default=0.3, help="small carrier size (MP)")
+    parser.add_argument('--large-clients', type=int, default=2)
+    parser.add_argument('--small-clients', type=int, default=4)
+    parser.add_argument('--light-clients', type=int, default=4)
+    args = parser.parse_args()
+
+    large, small = make_png(args.large_mp), make_png(args.small_mp)
+    print(f"{'executor':>9} {'class':>6} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+
+    for executor in args.executors:
+        port = free_port()
+        server = start_server(executor, port, args.workers)
+        try:
+            results = asyncio.run(run_load(f'http://127.0.0.1:{port}', args, large, small))
+        finally:
+            server.terminate()
+            server.wait()
+
+        for kind in ('large', 'small', 'light'):
+            latencies = results[kind]
+            print(f"{executor:>9} {kind:>6} {len(latencies):>9} {percentile(latencies, 50):>9.1f} "
+                  f"{percentile(latencies, 95):>9.1f} {percentile(latencies, 99):>9.1f}")
+        if results['errors']:
+            print(f"{executor:>9} errors by status: {results['errors']}")
+
+
+if __name__ == '__main__':
+    main()
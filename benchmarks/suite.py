@@ -0,0 +1,303 @@
+"""
+Reproducible embed/extract/probe benchmark suite with JSON output for comparing runs
+
+Usage:
+    python -m benchmarks.suite [--sizes 0.25 1 4] [--modes RGB RGBA P L]
+                               [--payloads text random compressible] [--payload-kb 64]
+                               [--levels service api] [--repeat 3]
+                               [--output results.json] [--compare baseline.json]
+
+Carriers and payloads are generated from fixed seeds, so every run measures the
+same inputs. For each carrier size (megapixels) and mode, and each payload
+kind, embed, extract and probe are timed:
+
+    service   calling embed_file_in_image / extract_file_from_image / probe_image
+    api       POST /api/embed/embed, /extract and /probe through the FastAPI app
+              with the in-process test client (upload parsing and response
+              building included)
+
+Each measurement is the best of --repeat runs; the median is kept too. Throughput
+is reported as MB/s of payload and MP/s of carrier. Peak memory is the
+tracemalloc peak of one extra, untimed run (numpy and Python allocations;
+Pillow's own C buffers are not traced); the process' peak RSS is in the metadata.
+
+Unless set in the environment, the suite runs jobs inline
+(EMPY_EXECUTOR=inline) with the result cache off and logging at WARNING, so every
+request does the full work in the measured process. The JSON holds the
+environment (versions, git commit, EMPY_* settings) next to the results;
+--compare prints the change of every case against an earlier file. A case whose
+embed fails (a payload the carrier cannot hold) is listed under "skipped" with
+the reason instead of ending the run.
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from importlib import metadata
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Settings that keep the measured work in this process and identical between repeats
+BENCH_ENVIRONMENT = {
+    'EMPY_EXECUTOR': 'inline',
+    'EMPY_RESULT_CACHE_BYTES': '0',
+    'EMPY_RESULT_CACHE_DIR': '',
+    'EMPY_LOG_LEVEL': 'WARNING',
+    'EMPY_LOG_FILE': '',
+}
+
+MODES = ('RGB', 'RGBA', 'P', 'L')
+OPERATIONS = ('embed', 'extract', 'probe')
+PACKAGES = ('Pillow', 'numpy', 'stegano', 'fastapi', 'starlette', 'zstandard')
+
+WORDS = ("the quick brown fox jumps over lazy dog image pixel carrier payload header "
+         "channel bit byte stream embed extract compress lossless format steganography").split()
+
+
+def make_carrier(megapixels: float, mode: str) -> bytes:
+    """A 4:3 photo-like carrier in the given mode, encoded as PNG"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rng = np.random.default_rng(0)
+    channels = [
+        128 + 100 * np.sin(x / width * np.pi * (1 + band)) * np.cos(y / height * np.pi * (2 - band / 2))
+        for band in range(3)
+    ]
+    pixels = np.clip(np.stack(channels, axis=-1) + rng.normal(0, 3, (height, width, 3)), 0, 255)
+    image = Image.fromarray(pixels.astype(np.uint8), 'RGB')
+    if mode == 'RGBA':
+        image.putalpha(Image.fromarray(np.clip(x / width * 255, 0, 255).astype(np.uint8), 'L'))
+    elif mode == 'P':
+        image = image.quantize(256)
+    elif mode != 'RGB':
+        image = image.convert(mode)
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def make_text(size: int, rng: np.random.Generator) -> bytes:
+    return ' '.join(rng.choice(WORDS, size // 4)).encode('ascii')[:size]
+
+
+def make_random(size: int, rng: np.random.Generator) -> bytes:
+    return rng.bytes(size)
+
+
+def make_compressible(size: int, rng: np.random.Generator) -> bytes:
+    """Log-like lines that differ only in a counter and a few fields"""
+    lines, length = [], 0
+    while length < size:
+        line = f"2024-01-01T00:00:{len(lines) % 60:02d} INFO request id={len(lines)} status=200 " \
+               f"path=/api/embed/{rng.choice(WORDS)}\n"
+        lines.append(line)
+        length += len(line)
+    return ''.join(lines).encode('ascii')[:size]
+
+
+PAYLOADS = {
+    'text': (make_text, 'text/plain'),
+    'random': (make_random, 'application/octet-stream'),
+    'compressible': (make_compressible, 'text/plain'),
+}
+
+
+def measure(repeat: int, func: Callable) -> Tuple[float, float, float, object]:
+    """Run func `repeat` times, then once more under tracemalloc
+
+    Returns (best seconds, median seconds, peak traced MiB, last result).
+    """
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), statistics.median(times), peak / 1024 / 1024, result
+
+
+def service_operations(carrier: bytes, payload: bytes, mime_type: str, compression: str) -> Dict[str, Callable]:
+    from app.services.embed_service import embed_file_in_image, extract_file_from_image, probe_image
+
+    embedded = embed_file_in_image(carrier, payload, 'payload', mime_type, compression=compression)
+    return {
+        'embed': lambda: embed_file_in_image(carrier, payload, 'payload', mime_type, compression=compression),
+        'extract': lambda: extract_file_from_image(embedded).data,
+        'probe': lambda: probe_image(embedded),
+    }
+
+
+def api_operations(client, carrier: bytes, payload: bytes, mime_type: str, compression: str) -> Dict[str, Callable]:
+    def post(path: str, **kwargs):
+        response = client.post(path, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.text[:200]}")
+        return response
+
+    def embed():
+        return post('/api/embed/embed', files={
+            'carrier_image': ('carrier.png', carrier, 'image/png'),
+            'file_to_embed': ('payload', payload, mime_type),
+        }, data={'compression': compression}).content
+
+    embedded = embed()
+    return {
+        'embed': embed,
+        'extract': lambda: post('/api/embed/extract', files={
+            'image': ('embedded.png', embedded, 'image/png')
+        }).content,
+        'probe': lambda: post('/api/embed/probe', files={
+            'image': ('embedded.png', embedded, 'image/png')
+        }).json(),
+    }
+
+
+def case_key(result: dict) -> Tuple:
+    return (result['level'], result['operation'], result['mode'], result['megapixels'], result['payload'])
+
+
+def environment(args: argparse.Namespace) -> dict:
+    """What a result depends on besides the code: versions, machine and settings"""
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "packages": versions,
+        "settings": {name: value for name, value in sorted(os.environ.items()) if name.startswith('EMPY_')},
+        "arguments": {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+    }
+
+
+def compare(results: List[dict], baseline_path: str, threshold: float) -> None:
+    """Print the change of every case's best time against a previous run"""
+    with open(baseline_path) as f:
+        baseline = {case_key(result): result for result in json.load(f)['results']}
+    print(f"\ncompared with {baseline_path} (changes beyond {threshold:.0%} are flagged)")
+    print(f"{'level':>7} {'operation':>9} {'mode':>4} {'MP':>5} {'payload':>12} {'before':>9} {'after':>9} "
+          f"{'change':>8}")
+    for result in results:
+        before = baseline.get(case_key(result))
+        if before is None:
+            continue
+        change = result['seconds'] / before['seconds'] - 1
+        flag = 'slower' if change > threshold else 'faster' if change < -threshold else ''
+        print(f"{result['level']:>7} {result['operation']:>9} {result['mode']:>4} {result['megapixels']:>5} "
+              f"{result['payload']:>12} {before['seconds']:>8.4f}s {result['seconds']:>8.4f}s "
+              f"{change:>+7.1%} {flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.25, 1, 4], help="carrier sizes in megapixels")
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES, help="carrier image modes")
+    parser.add_argument('--payloads', nargs='+', default=list(PAYLOADS), choices=list(PAYLOADS),
+                        help="payload kinds")
+    parser.add_argument('--payload-kb', type=int, default=64,
+                        help="payload size in KiB (capped at 90%% of the carrier's capacity)")
+    parser.add_argument('--levels', nargs='+', default=['service', 'api'], choices=['service', 'api'])
+    parser.add_argument('--compression', default='auto', help="payload compression passed to every embed")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per measurement")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change flagged by --compare")
+    args = parser.parse_args()
+
+    for name, value in BENCH_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    # The app reads its settings at import, so import it only now
+    from app.services.embed_service import carrier_capacity
+
+    client = None
+    if 'api' in args.levels:
+        from fastapi.testclient import TestClient
+        from app.main import app
+        client = TestClient(app).__enter__()
+
+    results, skipped = [], []
+    print(f"{'level':>7} {'operation':>9} {'mode':>4} {'MP':>5} {'payload':>12} {'KiB':>6} {'best':>9} "
+          f"{'median':>9} {'MB/s':>8} {'MP/s':>8} {'peak MiB':>9}")
+    try:
+        for megapixels in args.sizes:
+            for mode in args.modes:
+                carrier = make_carrier(megapixels, mode)
+                with Image.open(io.BytesIO(carrier)) as image:
+                    width, height = image.size
+                for kind in args.payloads:
+                    generate, mime_type = PAYLOADS[kind]
+                    # Capacity as the embed sees it, for this carrier's mode and channels
+                    capacity = carrier_capacity(carrier, filename='payload', mime_type=mime_type)
+                    payload = generate(min(args.payload_kb * 1024, int(capacity * 0.9)), np.random.default_rng(0))
+                    for level in args.levels:
+                        try:
+                            if level == 'service':
+                                operations = service_operations(carrier, payload, mime_type, args.compression)
+                            else:
+                                operations = api_operations(client, carrier, payload, mime_type, args.compression)
+                        except (ValueError, RuntimeError) as e:
+                            # Record the case and go on with the others
+                            skipped.append({"level": level, "mode": mode, "megapixels": megapixels,
+                                            "payload": kind, "payload_bytes": len(payload), "reason": str(e)})
+                            print(f"{level:>7} {'skipped':>9} {mode:>4} {megapixels:>5} {kind:>12} "
+                                  f"{len(payload) / 1024:>6.0f} {str(e)[:80]}")
+                            continue
+                        for operation in OPERATIONS:
+                            best, median, peak, _ = measure(args.repeat, operations[operation])
+                            result = {
+                                "level": level, "operation": operation, "mode": mode, "megapixels": megapixels,
+                                "width": width, "height": height, "payload": kind,
+                                "payload_bytes": len(payload), "seconds": best, "median_seconds": median,
+                                "payload_mb_per_s": len(payload) / best / 1e6,
+                                "carrier_mp_per_s": width * height / best / 1e6,
+                                "peak_traced_mib": peak,
+                            }
+                            results.append(result)
+                            print(f"{level:>7} {operation:>9} {mode:>4} {megapixels:>5} {kind:>12} "
+                                  f"{len(payload) / 1024:>6.0f} {best:>8.4f}s {median:>8.4f}s "
+                                  f"{result['payload_mb_per_s']:>8.2f} {result['carrier_mp_per_s']:>8.2f} "
+                                  f"{peak:>9.1f}")
+    finally:
+        if client is not None:
+            client.__exit__(None, None, None)
+
+    report = {"environment": environment(args), "results": results, "skipped": skipped}
+    report["environment"]["peak_rss_mib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import io
+import os
+
+# Settings are read when the app is imported: no log file, jobs run in the test process
+os.environ.setdefault('EMPY_LOG_FILE', '')
+os.environ.setdefault('EMPY_LOG_LEVEL', 'WARNING')
+os.environ.setdefault('EMPY_EXECUTOR', 'inline')
+
+import numpy as np
+import pytest
+from PIL import Image
+
+
+def make_carrier(width: int = 160, height: int = 120, mode: str = 'RGB', seed: int = 0) -> Image.Image:
+    """A noisy carrier image in `mode`"""
+    rng = np.random.default_rng(seed)
+    if mode == 'I;16':
+        return Image.fromarray(rng.integers(0, 2 ** 16, (height, width), dtype=np.uint16), 'I;16')
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    pixels = rng.integers(0, 256, (height, width, bands), dtype=np.uint8)
+    return Image.fromarray(pixels.squeeze(axis=2) if bands == 1 else pixels, mode)
+
+
+def png_bytes(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def carrier_png() -> bytes:
+    return png_bytes(make_carrier())
+
+
+@pytest.fixture(scope='session')
+def client():
+    """Test client of the whole app, with its lifespan (pool, jobs, janitor) running"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def no_result_cache():
+    """Start and end with an empty result cache, so requests are not answered from earlier tests"""
+    from app.services.result_cache import result_cache
+
+    result_cache.clear()
+    yield
+    result_cache.clear()
+
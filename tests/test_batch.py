@@ -0,0 +1,116 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from app.services import batch_service
+from app.services.batch_service import ItemResult, MultipartStream, ZipStream
+from conftest import make_carrier, png_bytes
+
+
+def zip_bytes(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def read_embed_archive(data: bytes, max_items: int = 10, max_member_bytes: int = 1 << 20):
+    return batch_service.read_embed_archive(data, max_items, max_member_bytes, 1 << 22)
+
+
+def multipart_parts(response) -> list:
+    """(headers, body) of every part of a multipart/mixed response"""
+    boundary = response.headers['content-type'].split('boundary=')[1].encode('ascii')
+    parts = []
+    for chunk in response.content.split(b'--' + boundary)[1:-1]:
+        head, _, body = chunk[2:-2].partition(b'\r\n\r\n')
+        headers = dict(line.split(': ', 1) for line in head.decode('latin-1').split('\r\n'))
+        parts.append((headers, body))
+    return parts
+
+
+def test_embed_archive_pairs_by_stem():
+    items = read_embed_archive(zip_bytes({
+        'carriers/b.png': b'B', 'carriers/a.png': b'A',
+        'payloads/a.txt': b'1', 'payloads/b.bin': b'2',
+        '__MACOSX/carriers/._a.png': b'', 'carriers/.DS_Store': b'',
+    }))
+    assert [(item.name, item.image, item.payload, item.payload_name) for item in items] == [
+        ('a.png', b'A', b'1', 'a.txt'), ('b.png', b'B', b'2', 'b.bin')]
+
+
+@pytest.mark.parametrize('files, options, message', [
+    ({'carriers/a.png': b'A'}, {}, "Unpaired files in batch archive: a"),
+    ({'notes.txt': b''}, {}, "no carriers/ and payloads/ files"),
+    ({'carriers/a.png': b'A' * 100, 'payloads/a.txt': b'1'}, {'max_member_bytes': 50}, "byte file limit"),
+    ({f'carriers/{n}.png': b'' for n in range(3)}, {'max_items': 1}, "too many files"),
+])
+def test_embed_archive_errors(files, options, message):
+    with pytest.raises(ValueError, match=message):
+        read_embed_archive(zip_bytes(files), **options)
+
+
+def test_not_a_zip():
+    with pytest.raises(ValueError, match="not a valid zip"):
+        read_embed_archive(b'not a zip')
+
+
+def test_unique_name():
+    used = set()
+    assert [batch_service.unique_name(name, used) for name in ('a.png', 'a.png', 'b.png', 'a.png')] == [
+        'a.png', 'a-2.png', 'b.png', 'a-3.png']
+
+
+def test_zip_stream_keeps_results_name():
+    stream = ZipStream()
+    chunks = [stream.add(ItemResult(0, 'x.png', 'ok', 0.1, b'user data', 'results.json', 'application/json'))[0],
+              stream.add(ItemResult(1, 'y.png', 'error', 0.1, error="No embedded file"))[0],
+              stream.close({"items": []})]
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert archive.namelist() == ['results-2.json', 'results.json']
+        assert archive.read('results-2.json') == b'user data'
+        assert json.loads(archive.read('results.json')) == {"items": []}
+
+
+def test_multipart_stream_keeps_results_name():
+    stream = MultipartStream(lambda name: f'attachment; filename="{name}"')
+    _, entry = stream.add(ItemResult(0, 'x.png', 'ok', 0.1, b'user data', 'results.json', 'application/json'))
+    assert entry == 'results-2.json'
+
+
+def test_batch_embed_and_extract(client, no_result_cache):
+    archive = zip_bytes({
+        'carriers/one.png': png_bytes(make_carrier(seed=1)),
+        'carriers/two.png': png_bytes(make_carrier(seed=2)),
+        'payloads/one.txt': b'first payload',
+        'payloads/two.json': b'{"second": true}',
+    })
+    response = client.post('/api/embed/batch/embed', data={'strategy': 'sequential'},
+                           files={'archive': ('batch.zip', archive, 'application/zip')})
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as embedded:
+        summary = json.loads(embedded.read('results.json'))
+        images = [embedded.read(f'embedded_{stem}.png') for stem in ('one', 'two')]
+    assert [item['status'] for item in summary['items']] == ['ok', 'ok']
+
+    response = client.post('/api/embed/batch/extract', data={'format': 'multipart'}, files=[
+        ('images', ('one.png', images[0], 'image/png')),
+        ('images', ('two.png', images[1], 'image/png')),
+        ('images', ('plain.png', png_bytes(make_carrier()), 'image/png')),
+    ])
+    assert response.status_code == 200
+    parts = multipart_parts(response)
+    outputs = {headers.get('Content-Disposition', '').split('"')[1]: body
+               for headers, body in parts[:-1] if headers['X-Item-Status'] == 'ok'}
+    assert outputs == {'one.txt': b'first payload', 'two.json': b'{"second": true}'}
+    statuses = sorted(json.loads(parts[-1][1])['items'], key=lambda item: item['index'])
+    assert [item['status'] for item in statuses] == ['ok', 'ok', 'error']
+
+
+def test_batch_without_items(client):
+    response = client.post('/api/embed/batch/extract', data={'format': 'zip'})
+    assert response.status_code == 400
+    assert 'no items' in response.json()['detail']
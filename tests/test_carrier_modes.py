@@ -0,0 +1,50 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import embed_service, lsb_engine
+
+PAYLOAD = b'wide samples \x00\xff' * 4
+
+
+def wide_carrier(high: int, output: str = 'TIFF') -> bytes:
+    """A 32-bit grayscale carrier with samples up to `high`"""
+    pixels = np.random.default_rng(0).integers(0, high + 1, (120, 160), dtype=np.int32)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, 'I').save(buffer, output)
+    return buffer.getvalue()
+
+
+def test_16_bit_png_carriers_stay_16_bit():
+    output = embed_service.embed_file_in_image(wide_carrier(0xFFFF, 'PNG'), PAYLOAD, compression='none')
+    image = Image.open(io.BytesIO(output))
+    assert image.mode == 'I'
+    assert np.asarray(image).max() > 255
+    assert embed_service.extract_file_from_image(output).data == PAYLOAD
+
+
+def test_32_bit_carrier_to_tiff():
+    output = embed_service.embed_file_in_image(wide_carrier(1 << 20), PAYLOAD, output_format='tiff')
+    assert np.asarray(Image.open(io.BytesIO(output))).max() > 0xFFFF
+    assert embed_service.extract_file_from_image(output).data == PAYLOAD
+
+
+@pytest.mark.parametrize('mapped', [False, True])
+def test_32_bit_carrier_to_png_is_refused(monkeypatch, mapped):
+    if mapped:
+        monkeypatch.setattr(embed_service.pixel_buffer, 'MMAP_MIN_PIXELS', 1)
+    with pytest.raises(ValueError, match="PNG output holds 0-65535"):
+        embed_service.embed_file_in_image(wide_carrier(1 << 20), PAYLOAD, output_format='png')
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('P', 'RGB'), ('1', 'L'), ('LA', 'RGBA'), ('CMYK', 'RGB'), ('I;16B', 'I'), ('RGBA', 'RGBA'),
+])
+def test_carrier_mode(source, expected):
+    assert lsb_engine.carrier_mode(Image.new(source, (4, 4))) == expected
+
+
+def test_webp_converts_grayscale():
+    assert lsb_engine.carrier_mode(Image.new('L', (4, 4)), embed_service.OUTPUT_FORMATS['webp'].modes) == 'RGB'
@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from app import cli, log_config
+from app.services import embed_service
+from conftest import make_carrier, png_bytes
+
+
+@pytest.fixture(autouse=True)
+def cli_logging(monkeypatch):
+    """main() reconfigures logging and the EMPY_LOG_* settings; restore both afterwards"""
+    monkeypatch.setenv('EMPY_LOG_LEVEL', os.environ.get('EMPY_LOG_LEVEL', 'WARNING'))
+    monkeypatch.setenv('EMPY_LOG_FILE', os.environ.get('EMPY_LOG_FILE', ''))
+    yield
+    log_config.stop_logging()
+    log_config.configure_logging()
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    carriers, payloads = tmp_path / 'carriers', tmp_path / 'payloads'
+    carriers.mkdir()
+    payloads.mkdir()
+    for seed, name in enumerate(('one', 'two', 'three')):
+        (carriers / f'{name}.png').write_bytes(png_bytes(make_carrier(seed=seed)))
+        (payloads / f'{name}.txt').write_bytes(f'payload {name}\n'.encode('ascii'))
+    return carriers, payloads
+
+
+def test_embed_extract_probe(tmp_path, inputs, capsys):
+    carriers, payloads = inputs
+    embedded, extracted, results = tmp_path / 'embedded', tmp_path / 'extracted', tmp_path / 'probe.jsonl'
+    assert cli.main(['embed', str(carriers), str(payloads), '-o', str(embedded), '--workers', '2',
+                     '--bits-per-channel', '2', '--strategy', 'shuffle', '--seed', '7']) == 0
+    assert sorted(os.listdir(embedded)) == ['.empy-journal.jsonl', 'one.png', 'three.png', 'two.png']
+    assert cli.main(['extract', str(embedded), '-o', str(extracted), '--workers', '1']) == 0
+    assert (extracted / 'two_two.txt').read_bytes() == b'payload two\n'
+
+    assert cli.main(['probe', str(embedded), '-o', str(results), '--workers', '1']) == 0
+    infos = [json.loads(line) for line in results.read_text().splitlines()]
+    assert {(info['bits_per_channel'], info['strategy']) for info in infos} == {(2, 'shuffle')}
+    assert '3 done, 0 skipped, 0 failed' in capsys.readouterr().err
+
+
+def test_seeded_embed_matches_service(tmp_path, inputs):
+    carriers, payloads = inputs
+    assert cli.main(['embed', str(carriers), str(payloads), '-o', str(tmp_path / 'out'), '--workers', '1',
+                     '--strategy', 'shuffle', '--seed', '7', '--compression', 'none']) == 0
+    expected = embed_service.embed_file_in_image(str(carriers / 'one.png'), str(payloads / 'one.txt'),
+                                                 strategy='shuffle', seed=7, compression='none')
+    assert (tmp_path / 'out' / 'one.png').read_bytes() == expected
+
+
+def test_journal_resumes(tmp_path, inputs, capsys):
+    carriers, payloads = inputs
+    output = tmp_path / 'embedded'
+    command = ['embed', str(carriers), str(payloads), '-o', str(output), '--workers', '1']
+    assert cli.main(command) == 0
+    (output / 'two.png').unlink()
+    capsys.readouterr()
+
+    assert cli.main(command) == 0
+    assert '1 done, 2 skipped, 0 failed' in capsys.readouterr().err
+    assert (output / 'two.png').exists()
+
+
+def test_failures_are_retried(tmp_path, inputs, capsys):
+    carriers, payloads = inputs
+    (payloads / 'one.txt').write_bytes(os.urandom(64 * 1024))
+    output = tmp_path / 'embedded'
+    command = ['embed', str(carriers), str(payloads), '-o', str(output), '--workers', '1']
+    assert cli.main(command) == 1
+    assert 'too small' in capsys.readouterr().err
+
+    (payloads / 'one.txt').write_bytes(b'small again')
+    assert cli.main(command) == 0
+    assert '1 done, 2 skipped, 0 failed' in capsys.readouterr().err
+
+
+def test_journal_ignores_cut_lines(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    path.write_text(json.dumps({"key": "embed:a", "status": "ok"}) + '\n{"key": "embed:b", "sta')
+    journal = cli.Journal(str(path))
+    journal.close()
+    assert list(journal.done) == ['embed:a']
+
+
+def test_bad_options(tmp_path, inputs):
+    carriers, payloads = inputs
+    with pytest.raises(SystemExit):
+        cli.main(['embed', str(carriers), str(payloads), '-o', str(tmp_path), '--bits', '9'])
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from app.services import compression, embed_service
+
+TEXT = b'{"key": "value", "items": [1, 2, 3]}\n' * 15
+
+requires_zstd = pytest.mark.skipif(compression.zstandard is None, reason="zstandard is not installed")
+
+
+def methods():
+    """Every compressing method, with zstd skipped when zstandard is missing"""
+    return ['zlib', 'lzma', pytest.param('zstd', marks=requires_zstd)]
+
+
+@pytest.mark.parametrize('method', compression.COMPRESSIONS)
+def test_round_trip_compression(method, carrier_png):
+    if method not in compression.available():
+        pytest.skip(f"{method} is not available")
+    output = embed_service.embed_file_in_image(carrier_png, TEXT, 'data.json', compression=method)
+    assert embed_service.extract_file_from_image(output).data == TEXT
+
+
+@pytest.mark.parametrize('data, mime_type, expected', [
+    (b'short', '', 'none'),
+    (os.urandom(4096), '', 'none'),
+    (TEXT * 4, 'application/zip', 'none'),
+    (TEXT * 4, 'application/json', 'zstd' if compression.zstandard else 'zlib'),
+])
+def test_auto_choice(data, mime_type, expected):
+    assert compression.choose(data, mime_type) == expected
+
+
+@pytest.mark.parametrize('method', methods())
+def test_truncated_payload(method):
+    _, data = compression.compress(TEXT * 20, method)
+    with pytest.raises(ValueError, match="truncated"):
+        compression.decompress(data[:-4], method)
+
+
+@pytest.mark.parametrize('method', methods())
+def test_decompression_limit(method):
+    _, data = compression.compress(bytes(1 << 20), method)
+    assert len(data) < 1 << 12
+    with pytest.raises(ValueError, match="expands beyond"):
+        compression.decompress(data, method, max_size=1 << 16)
+
+
+@pytest.mark.parametrize('method', methods())
+def test_stream_decompressor(method):
+    _, data = compression.compress(TEXT * 20, method)
+    stream = compression.StreamDecompressor(method)
+    output = b''.join(stream.feed(data[start:start + 7]) for start in range(0, len(data), 7))
+    stream.finish()
+    assert output == TEXT * 20
+
+    stream = compression.StreamDecompressor(method)
+    stream.feed(data[:-4])
+    with pytest.raises(ValueError, match="truncated"):
+        stream.finish()
+
+    stream = compression.StreamDecompressor(method, max_size=100)
+    with pytest.raises(ValueError, match="expands beyond"):
+        stream.feed(data)
+
+
+@requires_zstd
+def test_zstd_frame_without_content_size():
+    data = compression.zstandard.ZstdCompressor(write_content_size=False).compress(TEXT)
+    with pytest.raises(ValueError, match="expands beyond"):
+        compression.decompress(data, 'zstd')
+    with pytest.raises(ValueError, match="expands beyond"):
+        compression.StreamDecompressor('zstd').feed(data)
+
+
+def test_zstd_unavailable(monkeypatch):
+    monkeypatch.setattr(compression, 'zstandard', None)
+    assert 'zstd' not in compression.available()
+    with pytest.raises(ValueError, match="requires the zstandard package"):
+        compression.validate_compression('zstd')
+    with pytest.raises(ValueError, match="requires the zstandard package"):
+        compression.decompress(b'', 'zstd')
@@ -0,0 +1,64 @@
+import pytest
+
+from app.services import embed_service, file_types
+from conftest import make_carrier, png_bytes
+
+
+class RecordingMagic:
+    """Stands in for the libmagic handle and records what it is asked to sniff"""
+
+    def __init__(self, result='text/plain', error=None):
+        self.result = result
+        self.error = error
+        self.buffers = []
+
+    def from_buffer(self, data):
+        self.buffers.append(data)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+@pytest.mark.parametrize('data, expected', [
+    (b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n1 0 obj\n', 'application/pdf'),
+    (png_bytes(make_carrier(8, 8)), 'image/png'),
+    (b'just some plain words\n' * 4, 'text/plain'),
+])
+def test_detect_mime_type(data, expected):
+    assert file_types.detect_mime_type(data) == expected
+
+
+def test_detect_reads_leading_bytes_with_one_handle(monkeypatch):
+    handle = RecordingMagic()
+    monkeypatch.setattr(file_types, '_magic', handle)
+    monkeypatch.setattr(file_types, 'DETECT_BYTES', 16)
+    file_types.detect_mime_type(memoryview(b'x' * 100))
+    file_types.detect_mime_type(b'y' * 4)
+    assert handle.buffers == [b'x' * 16, b'y' * 4]
+
+
+def test_detect_failure_falls_back(monkeypatch):
+    monkeypatch.setattr(file_types, '_magic', RecordingMagic(error=OSError("magic database missing")))
+    assert file_types.detect_mime_type(b'data') == file_types.DEFAULT_MIME_TYPE
+
+
+@pytest.mark.parametrize('mime_type, extension', [
+    ('image/jpeg', '.jpg'),
+    ('Text/Plain; charset=utf-8', '.txt'),
+    ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', '.docx'),
+    ('application/x-nothing-known', '.bin'),
+])
+def test_extension_for(mime_type, extension):
+    assert file_types.extension_for(mime_type) == extension
+
+
+def test_extension_overrides(monkeypatch):
+    monkeypatch.setitem(file_types.EXTENSIONS, 'application/x-foo', '.foo')
+    assert file_types.extension_for('application/x-foo') == '.foo'
+
+
+def test_unnamed_payload_gets_sniffed_type(carrier_png):
+    pdf = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n1 0 obj\n<< >>\nendobj\n'
+    output = embed_service.embed_file_in_image(carrier_png, pdf, mime_type='application/octet-stream')
+    extracted = embed_service.extract_file_from_image(output)
+    assert (extracted.mime_type, extracted.filename) == ('application/pdf', 'extracted.pdf')
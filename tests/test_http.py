@@ -0,0 +1,91 @@
+import functools
+
+import pytest
+
+from app.routers import embed as embed_router
+from app.services.executor import JobTimeoutError, PoolSaturatedError
+
+
+def embed(client, carrier: bytes, payload: bytes = b'secret payload', **fields):
+    return client.post('/api/embed/embed', data=fields, files={
+        'carrier_image': ('carrier.png', carrier, 'image/png'),
+        'file_to_embed': ('secret.txt', payload, 'text/plain'),
+    })
+
+
+def extract(client, image: bytes):
+    return client.post('/api/embed/extract', files={'image': ('embedded.png', image, 'image/png')})
+
+
+def test_embed_extract(client, carrier_png, no_result_cache):
+    response = embed(client, carrier_png, strategy='sequential', bits_per_channel='2')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'image/png'
+
+    response = extract(client, response.content)
+    assert response.status_code == 200
+    assert response.content == b'secret payload'
+    assert 'secret.txt' in response.headers['content-disposition']
+
+
+def test_repeated_embed_is_cached(client, carrier_png, no_result_cache):
+    first = embed(client, carrier_png)
+    second = embed(client, carrier_png)
+    assert (first.headers['x-cache'], second.headers['x-cache']) == ('MISS', 'HIT')
+    assert second.content == first.content
+
+
+def test_unseeded_shuffle_is_not_cached(client, carrier_png, no_result_cache):
+    first = embed(client, carrier_png, strategy='shuffle')
+    second = embed(client, carrier_png, strategy='shuffle')
+    assert second.headers['x-cache'] == 'MISS'
+    assert second.content != first.content
+
+
+def test_validation_error(client, carrier_png):
+    response = embed(client, carrier_png, bits_per_channel='9')
+    assert response.status_code == 400
+    assert response.json()['debug_info']['error_type'] == 'validation_error'
+
+
+def test_upload_over_limit(client, carrier_png, monkeypatch, no_result_cache):
+    monkeypatch.setattr(embed_router, 'read_upload', functools.partial(embed_router.read_upload, max_bytes=64))
+    response = embed(client, carrier_png)
+    assert response.status_code == 413
+    assert response.json()['debug_info']['error_type'] == 'upload_too_large'
+
+
+def test_request_body_over_limit_with_content_length(client, monkeypatch):
+    monkeypatch.setattr(embed_router, 'FORM_OVERHEAD_BYTES', 0)
+    monkeypatch.setattr(embed_router, 'MAX_UPLOAD_BYTES', 100)
+    response = extract(client, b'x' * 1000)
+    assert response.status_code == 413
+    assert 'Request body exceeds' in response.json()['detail']
+
+
+def test_request_body_over_limit_without_content_length(client, monkeypatch):
+    monkeypatch.setattr(embed_router, 'FORM_OVERHEAD_BYTES', 0)
+    monkeypatch.setattr(embed_router, 'MAX_UPLOAD_BYTES', 100)
+
+    def chunks():
+        for _ in range(10):
+            yield b'x' * 100
+
+    response = client.post('/api/embed/extract', content=chunks(),
+                           headers={'content-type': 'multipart/form-data; boundary=x'})
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize('error, status, error_type', [
+    (PoolSaturatedError("All workers are busy, try again later"), 503, 'pool_saturated'),
+    (JobTimeoutError("Job did not finish within 120s"), 504, 'job_timeout'),
+])
+def test_busy_pool(client, carrier_png, monkeypatch, no_result_cache, error, status, error_type):
+    async def failing_job(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(embed_router, 'run_job', failing_job)
+    for response in (embed(client, carrier_png), extract(client, carrier_png)):
+        assert response.status_code == status
+        assert response.json()['debug_info']['error_type'] == error_type
+        assert (response.headers.get('retry-after') == '1') == (status == 503)
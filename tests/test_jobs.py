@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from app.services import embed_service
+from app.services.job_store import Job, JobStore, MemoryJobStore, SQLiteJobStore, make_job_store
+from conftest import make_carrier, png_bytes
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    return make_job_store(request.param, str(tmp_path / 'jobs.sqlite3'))
+
+
+def new_job(job_id: str = 'a', status: str = 'queued', **fields) -> Job:
+    return Job(job_id, status, 1.0, 1.0, **fields)
+
+
+def test_job_store_is_abstract():
+    with pytest.raises(TypeError):
+        JobStore()
+
+
+def test_store_create_update_delete(store):
+    store.create(new_job())
+    assert store.get('a') == new_job()
+    assert store.active_count() == 1
+
+    job = store.update('a', status='running', stage='embed', done=5, total=10)
+    assert (job.status, job.stage, job.done, job.total) == ('running', 'embed', 5, 10)
+    assert job.updated > 1.0
+    assert store.update('missing', status='done') is None
+
+    store.set_result('a', b'result')
+    assert store.get_result('a') == b'result'
+    assert store.delete('a')
+    assert not store.delete('a')
+    assert store.get('a') is None and store.get_result('a') is None
+    assert store.active_count() == 0
+
+
+def test_store_purges_expired_finished_jobs(store):
+    store.create(new_job('old', 'done', expires=10.0))
+    store.create(new_job('new', 'failed', expires=30.0))
+    store.create(new_job('queued'))
+    assert store.purge_expired(now=20.0) == 1
+    assert store.get('old') is None
+    assert store.get('new') is not None and store.get('queued') is not None
+
+
+def test_retryable_failures():
+    assert new_job(status='failed', error_type='pool_saturated').retryable
+    assert not new_job(status='failed', error_type='validation_error').retryable
+    assert not new_job(status='running').finished
+
+
+def test_sqlite_store_fails_interrupted_jobs(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    store = SQLiteJobStore(path)
+    store.create(new_job('queued'))
+    store.create(new_job('done', 'done'))
+
+    job = SQLiteJobStore(path).get('queued')
+    assert (job.status, job.error_type, job.retryable) == ('failed', 'interrupted', True)
+    assert SQLiteJobStore(path).get('done').status == 'done'
+
+
+def test_sqlite_store_adds_error_type_column(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT, created REAL, updated REAL, stage TEXT, '
+               'done INTEGER, total INTEGER, error TEXT, filename TEXT, mime_type TEXT, '
+               'result_size INTEGER, expires REAL, result BLOB)')
+    db.execute("INSERT INTO jobs VALUES ('a', 'done', 1, 1, '', 0, 0, '', 'a.png', 'image/png', 3, 9, x'00')")
+    db.commit()
+    db.close()
+    assert SQLiteJobStore(path).get('a').error_type == ''
+
+
+def test_unknown_job_store():
+    with pytest.raises(ValueError, match="Unknown job store"):
+        make_job_store('redis')
+    assert isinstance(make_job_store('memory'), MemoryJobStore)
+
+
+def submit_job(client, carrier: bytes, payload: bytes, **fields):
+    return client.post('/api/embed/jobs', data=fields, files={
+        'carrier_image': ('photo.png', carrier, 'image/png'),
+        'file_to_embed': ('secret.txt', payload, 'text/plain'),
+    })
+
+
+def wait_for(client, status_url: str) -> dict:
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        status = client.get(status_url).json()
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"Job did not finish: {status}")
+
+
+def test_job_api(client):
+    response = submit_job(client, png_bytes(make_carrier()), b'background payload', strategy='sequential')
+    assert response.status_code == 202
+    status = wait_for(client, response.json()['status_url'])
+    assert status['status'] == 'done'
+    assert status['progress']['percent'] == 100.0
+    assert status['result']['filename'] == 'embedded_photo.png'
+
+    result = client.get(status['result_url'])
+    assert result.status_code == 200
+    assert embed_service.extract_file_from_image(result.content).data == b'background payload'
+
+    assert client.delete(status['status_url']).json() == {"job_id": status['job_id'], "deleted": True}
+    assert client.get(status['status_url']).status_code == 404
+    assert client.get(status['result_url']).status_code == 404
+
+
+def test_failed_job(client):
+    response = submit_job(client, png_bytes(make_carrier(16, 16)), os.urandom(4096), compression='none')
+    status = wait_for(client, response.json()['status_url'])
+    assert (status['status'], status['error_type'], status['retryable']) == ('failed', 'validation_error', False)
+    assert 'too small' in status['error']
+    assert client.get(f"{status['status_url']}/result").status_code == 409
+
+
+def test_job_validation_error(client):
+    response = submit_job(client, png_bytes(make_carrier()), b'x', strategy='spiral')
+    assert response.status_code == 400
+    assert response.json()['debug_info']['error_type'] == 'validation_error'
@@ -0,0 +1,42 @@
+import pytest
+
+from app.services import embed_service
+from conftest import make_carrier, png_bytes
+
+PAYLOAD = b'EmPy round trip \x00\xff' * 8
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L', 'I;16'])
+@pytest.mark.parametrize('bits_per_channel', [1, 2, 3, 4])
+@pytest.mark.parametrize('strategy', ['prime', 'sequential', 'shuffle'])
+def test_round_trip_layouts(mode, bits_per_channel, strategy):
+    carrier = png_bytes(make_carrier(mode=mode))
+    output = embed_service.embed_file_in_image(carrier, PAYLOAD, 'payload.bin', 'application/octet-stream',
+                                               bits_per_channel=bits_per_channel, strategy=strategy,
+                                               compression='none')
+    extracted = embed_service.extract_file_from_image(output)
+    assert extracted.data == PAYLOAD
+    assert extracted.filename == 'payload.bin'
+
+
+def test_seeded_shuffle_is_deterministic(carrier_png):
+    first = embed_service.embed_file_in_image(carrier_png, PAYLOAD, strategy='shuffle', seed=7)
+    second = embed_service.embed_file_in_image(carrier_png, PAYLOAD, strategy='shuffle', seed=7)
+    assert first == second
+
+
+def test_more_bits_hold_more(carrier_png):
+    payload = bytes(range(256)) * 12
+    with pytest.raises(ValueError, match="too small"):
+        embed_service.embed_file_in_image(carrier_png, payload, bits_per_channel=1, compression='none')
+    output = embed_service.embed_file_in_image(carrier_png, payload, bits_per_channel=4, compression='none')
+    assert embed_service.extract_file_from_image(output).data == payload
+
+
+@pytest.mark.parametrize('options, message', [
+    ({'bits_per_channel': 5}, "bits_per_channel"),
+    ({'strategy': 'spiral'}, "strategy"),
+])
+def test_rejects_bad_layouts(carrier_png, options, message):
+    with pytest.raises(ValueError, match=message):
+        embed_service.embed_file_in_image(carrier_png, PAYLOAD, **options)
@@ -0,0 +1,79 @@
+import json
+import logging
+
+import pytest
+
+from app import log_config
+
+
+@pytest.fixture
+def logging_to(tmp_path):
+    """Configure logging into a file under tmp_path; yields a function that stops it and reads the file"""
+    log_config.stop_logging()
+    path = tmp_path / 'empy.log'
+
+    def written() -> str:
+        log_config.stop_logging()
+        return path.read_text() if path.exists() else ''
+
+    yield path, written
+    log_config.stop_logging()
+    log_config.configure_logging()
+
+
+def test_records_go_through_a_queue(logging_to):
+    path, written = logging_to
+    log_config.configure_logging('INFO', str(path))
+    root = logging.getLogger()
+    assert [type(handler) for handler in root.handlers] == [log_config.DeferredQueueHandler]
+    assert not path.exists()
+
+    logging.getLogger('empy.test').info("embedded %s bytes", 42)
+    logging.getLogger('empy.test').debug("not written")
+    assert written().splitlines()[-1].endswith("empy.test - INFO - embedded 42 bytes")
+
+
+def test_configure_is_idempotent(logging_to):
+    path, written = logging_to
+    log_config.configure_logging('INFO', str(path))
+    handlers = logging.getLogger().handlers
+    log_config.configure_logging('DEBUG', '')
+    assert logging.getLogger().handlers is handlers
+    assert logging.getLogger().level == logging.INFO
+
+
+def test_json_format(logging_to, monkeypatch):
+    path, written = logging_to
+    monkeypatch.setattr(log_config, 'LOG_FORMAT', 'json')
+    log_config.configure_logging('INFO', str(path))
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        logging.getLogger('empy.test').exception("failed")
+    entry = json.loads(written().splitlines()[-1])
+    assert (entry['level'], entry['logger'], entry['message']) == ('ERROR', 'empy.test', 'failed')
+    assert 'RuntimeError: boom' in entry['exc_info']
+
+
+def test_debug_sampling(logging_to, monkeypatch):
+    path, written = logging_to
+    monkeypatch.setattr(log_config, 'LOG_DEBUG_SAMPLE_RATE', 0.5)
+    monkeypatch.setattr(log_config, 'LOG_LEVEL', 'INFO')
+    log_config.configure_logging('INFO', str(path))
+    logger = logging.getLogger('empy.test')
+    logger.debug("unsampled request")
+    log_config.call_sampled(True, logger.debug, "sampled request")
+    logger.info("info record")
+    lines = written()
+    assert 'sampled request' in lines and 'unsampled request' not in lines and 'info record' in lines
+
+
+@pytest.mark.parametrize('setting, value, message', [
+    ('LOG_FORMAT', 'xml', "Unknown log format"),
+    (None, None, "Unknown log level"),
+])
+def test_bad_settings(logging_to, monkeypatch, setting, value, message):
+    if setting:
+        monkeypatch.setattr(log_config, setting, value)
+    with pytest.raises(ValueError, match=message):
+        log_config.configure_logging('LOUD' if setting is None else 'INFO', '')
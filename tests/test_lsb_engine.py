@@ -0,0 +1,50 @@
+import base64
+
+import numpy as np
+import pytest
+from stegano import lsb
+from stegano.lsb import generators
+
+from app.services import embed_service, lsb_engine
+from conftest import make_carrier, png_bytes
+
+
+@pytest.mark.parametrize('message', ["plain ascii: 1, 2, 3!", "héllo wörld © ÿ"])
+def test_stegano_reads_engine_messages(message):
+    assert lsb.reveal(lsb_engine.hide(make_carrier(), message), generators.eratosthenes()) == message
+
+
+@pytest.mark.parametrize('message', ["plain ascii: 1, 2, 3!", "héllo wörld © ÿ"])
+def test_engine_reads_stegano_messages(message):
+    assert lsb_engine.reveal(lsb.hide(make_carrier(), message, generators.eratosthenes())) == message
+
+
+def test_message_outside_latin1():
+    with pytest.raises(ValueError, match="U\\+00FF"):
+        lsb_engine.hide(make_carrier(), "snowman ☃")
+
+
+def test_hide_only_touches_lowest_bits():
+    carrier = make_carrier()
+    hidden = lsb_engine.hide(carrier, "x" * 200)
+    difference = np.asarray(hidden, dtype=np.int16) - np.asarray(carrier, dtype=np.int16)
+    assert np.abs(difference).max() == 1
+
+
+def test_reveal_without_message():
+    with pytest.raises(ValueError, match="Impossible to detect message"):
+        lsb_engine.reveal(make_carrier())
+
+
+@pytest.mark.parametrize('message', ["Hello from stegano: 1, 2, 3!", "héllo wörld © ÿ"])
+def test_extract_stegano_text(message):
+    image = png_bytes(lsb.hide(make_carrier(), message, generators.eratosthenes()))
+    extracted = embed_service.extract_file_from_image(image)
+    assert extracted == embed_service.ExtractedFile(message.encode('utf-8'), 'extracted.txt', 'text/plain')
+    assert embed_service.probe_image(image)['format'] == 'legacy'
+
+
+def test_extract_stegano_base64_binary():
+    data = bytes(range(256))
+    image = lsb.hide(make_carrier(), base64.b64encode(data).decode('ascii'), generators.eratosthenes())
+    assert embed_service.extract_file_from_image(png_bytes(image)).data == data
@@ -0,0 +1,103 @@
+import pytest
+
+from app.routers import metrics as metrics_router
+from app.services import metrics
+from conftest import make_carrier, png_bytes
+
+
+@pytest.fixture
+def registry():
+    """Metrics made by a test are dropped from the registry afterwards"""
+    saved = list(metrics.REGISTRY)
+    yield
+    metrics.REGISTRY[:] = saved
+
+
+def test_metric_is_abstract():
+    with pytest.raises(TypeError):
+        metrics.Metric('empy_test', "Test")
+
+
+def test_counter(registry):
+    counter = metrics.Counter('empy_test_total', "Test counter", ('type',))
+    counter.inc(type='a')
+    counter.inc(2.5, type='b"\n')
+    assert counter.render().splitlines() == [
+        '# HELP empy_test_total Test counter',
+        '# TYPE empy_test_total counter',
+        'empy_test_total{type="a"} 1',
+        'empy_test_total{type="b\\"\\n"} 2.5',
+    ]
+    with pytest.raises(ValueError, match="expects labels"):
+        counter.inc(kind='a')
+
+
+def test_gauge(registry):
+    gauge = metrics.Gauge('empy_test_gauge', "Test gauge")
+    gauge.inc(3)
+    gauge.dec()
+    assert list(gauge.samples()) == ['empy_test_gauge 2']
+    assert list(metrics.Gauge('empy_test_read', "Read", lambda: 7).samples()) == ['empy_test_read 7']
+
+
+def test_histogram(registry):
+    histogram = metrics.Histogram('empy_test_seconds', "Test histogram", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+    assert list(histogram.samples()) == [
+        'empy_test_seconds_bucket{le="0.1"} 2',
+        'empy_test_seconds_bucket{le="1"} 3',
+        'empy_test_seconds_bucket{le="+Inf"} 4',
+        'empy_test_seconds_sum 3.65',
+        'empy_test_seconds_count 4',
+    ]
+
+
+def test_events_are_collected_and_replayed():
+    def work():
+        with metrics.stage('decode'):
+            metrics.add_payload_bytes('embed', 10)
+        return 'done'
+
+    result, events = metrics.call_with_events(work)
+    assert result == 'done'
+    assert [(kind, name) for kind, name, _ in events] == [('bytes', 'embed'), ('stage', 'decode')]
+
+    timings, token = metrics.start_request_timings()
+    try:
+        metrics.replay(events)
+        metrics.replay(events)
+    finally:
+        metrics.reset_request_timings(token)
+    assert [name for name, _ in timings] == ['decode', 'decode']
+
+
+def test_server_timing_adds_up_stages():
+    assert metrics.server_timing([('decode', 0.001), ('embed', 0.0105), ('decode', 0.002)]) == \
+        'decode;dur=3.0, embed;dur=10.5'
+
+
+def embed(client, carrier: bytes):
+    return client.post('/api/embed/embed', files={
+        'carrier_image': ('carrier.png', carrier, 'image/png'),
+        'file_to_embed': ('secret.txt', b'metrics payload', 'text/plain'),
+    })
+
+
+def test_metrics_endpoint(client, carrier_png, no_result_cache):
+    assert embed(client, carrier_png).status_code == 200
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert 'empy_stage_seconds_count{stage="bit_write"}' in response.text
+    assert 'empy_payload_bytes_total{operation="embed"}' in response.text
+    assert '# TYPE empy_requests_in_flight gauge' in response.text
+
+
+def test_server_timing_header(client, carrier_png, monkeypatch, no_result_cache):
+    assert 'server-timing' not in embed(client, carrier_png).headers
+
+    monkeypatch.setattr(metrics_router, 'SERVER_TIMING', True)
+    response = embed(client, png_bytes(make_carrier(seed=1)))
+    stages = [entry.split(';')[0] for entry in response.headers['server-timing'].split(', ')]
+    assert {'upload_read', 'decode', 'bit_write', 'encode'} <= set(stages)
@@ -0,0 +1,33 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.services import embed_service
+
+PAYLOAD = b'output format payload'
+
+
+@pytest.mark.parametrize('output_format, pillow_format', [('png', 'PNG'), ('webp', 'WEBP'), ('tiff', 'TIFF')])
+def test_lossless_outputs(carrier_png, output_format, pillow_format):
+    output = embed_service.embed_file_in_image(carrier_png, PAYLOAD, output_format=output_format)
+    assert Image.open(io.BytesIO(output)).format == pillow_format
+    assert embed_service.extract_file_from_image(output).data == PAYLOAD
+
+
+def test_png_compress_level_changes_size_only():
+    buffer = io.BytesIO()
+    Image.new('RGB', (160, 120), (40, 80, 120)).save(buffer, 'PNG')
+    fast = embed_service.embed_file_in_image(buffer.getvalue(), PAYLOAD, compress_level=0)
+    small = embed_service.embed_file_in_image(buffer.getvalue(), PAYLOAD, compress_level=9, optimize=True)
+    assert len(small) < len(fast)
+    assert Image.open(io.BytesIO(small)).tobytes() == Image.open(io.BytesIO(fast)).tobytes()
+
+
+@pytest.mark.parametrize('output_format, compress_level, message', [
+    ('jpeg', None, "Unknown output format"),
+    ('png', 10, "compress_level"),
+])
+def test_rejects_bad_output_options(output_format, compress_level, message):
+    with pytest.raises(ValueError, match=message):
+        embed_service.validate_output(output_format, compress_level)
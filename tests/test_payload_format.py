@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from app.services import embed_service, lsb_engine, payload_format
+from conftest import make_carrier, png_bytes
+
+
+def v1_image(data: bytes, filename: str = '', mime_type: str = '', flags: int = 0) -> bytes:
+    """A carrier holding a version 1 container: header and body on one prime stream"""
+    body, name_length, mime_length = payload_format.pack_body(data, filename, mime_type)
+    header = payload_format.HEADER_V1.pack(payload_format.MAGIC, 1, flags, len(data), name_length, mime_length)
+    return png_bytes(lsb_engine.hide_bytes(make_carrier(), header + body))
+
+
+def test_parse_v2_header():
+    header, body = payload_format.pack(b'payload', 'a.txt', 'text/plain', payload_format.FLAG_TEXT,
+                                       bits_per_channel=3, strategy='shuffle', seed=42)
+    parsed = payload_format.parse_header(header)
+    assert parsed == payload_format.PayloadHeader(2, payload_format.FLAG_TEXT, 3, 'shuffle', 42, 7, 5, 10)
+    assert parsed.size == payload_format.HEADER.size
+    assert parsed.body_size == len(body)
+    assert payload_format.unpack(parsed, body) == payload_format.Payload(b'payload', 'a.txt', 'text/plain',
+                                                                         payload_format.FLAG_TEXT)
+
+
+def test_parse_v1_header():
+    head = payload_format.HEADER_V1.pack(payload_format.MAGIC, 1, 0, 100, 4, 9)
+    parsed = payload_format.parse_header(head)
+    assert (parsed.version, parsed.bits_per_channel, parsed.strategy, parsed.length) == (1, 1, 'prime', 100)
+    assert parsed.size == payload_format.HEADER_V1.size
+
+
+@pytest.mark.parametrize('head, message', [
+    (b'NOPE' + bytes(16), "No EmPy payload header"),
+    (payload_format.MAGIC + bytes([9]) + bytes(16), "Unsupported payload version"),
+    (payload_format.HEADER.pack(payload_format.MAGIC, 2, 0, 1, 7, 0, 0, 0, 0), "corrupt"),
+    (payload_format.HEADER.pack(payload_format.MAGIC, 2, 0, 5, 0, 0, 0, 0, 0), "bits_per_channel"),
+])
+def test_parse_rejects_bad_headers(head, message):
+    with pytest.raises(ValueError, match=message):
+        payload_format.parse_header(head)
+
+
+def test_unpack_truncated_body():
+    header, body = payload_format.pack(b'payload', 'a.txt')
+    with pytest.raises(ValueError, match="truncated"):
+        payload_format.unpack(payload_format.parse_header(header), body[:-1])
+
+
+def test_filename_truncation_keeps_utf8():
+    body, name_length, _ = payload_format.pack_body(b'', 'é' * 200)
+    assert name_length <= payload_format.MAX_FILENAME_LENGTH
+    body[:name_length].decode('utf-8')
+
+
+def test_extract_v1_container():
+    image = v1_image(b'version one payload', 'old.txt', 'text/plain')
+    extracted = embed_service.extract_file_from_image(image)
+    assert extracted == embed_service.ExtractedFile(b'version one payload', 'old.txt', 'text/plain')
+
+
+def test_extract_v1_container_without_name():
+    extracted = embed_service.extract_file_from_image(v1_image(b'hello', flags=payload_format.FLAG_TEXT))
+    assert extracted.data == b'hello'
+    assert extracted.filename.startswith('extracted')
+
+
+
+def test_round_trip_container(carrier_png):
+    data = bytes(range(256)) * 4
+    output = embed_service.embed_file_in_image(carrier_png, data, 'raw.bin', 'application/octet-stream')
+    extracted = embed_service.extract_file_from_image(output)
+    assert (extracted.data, extracted.filename) == (data, 'raw.bin')
+
+
+def test_carrier_too_small():
+    carrier = png_bytes(make_carrier(16, 16))
+    with pytest.raises(ValueError, match="too small"):
+        embed_service.embed_file_in_image(carrier, os.urandom(4096), compression='none')
+
+
+def test_extract_without_payload(carrier_png):
+    with pytest.raises(ValueError, match="No embedded file"):
+        embed_service.extract_file_from_image(carrier_png)
@@ -0,0 +1,54 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import embed_service, pixel_buffer, scratch
+from conftest import make_carrier, png_bytes
+
+PAYLOAD = b'mapped buffer payload \x00\xff' * 8
+
+
+@pytest.fixture
+def mapped(monkeypatch):
+    """Process every carrier in a memory-mapped buffer"""
+    monkeypatch.setattr(pixel_buffer, 'MMAP_MIN_PIXELS', 1)
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L', 'I;16'])
+def test_mapped_round_trip(mapped, mode):
+    carrier = png_bytes(make_carrier(mode=mode))
+    output = embed_service.embed_file_in_image(carrier, PAYLOAD, bits_per_channel=2, strategy='sequential')
+    assert embed_service.extract_file_from_image(output).data == PAYLOAD
+    assert scratch.pixel_scratch.stats()["bytes_in_flight"] == 0
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+def test_mapped_image_matches_decoded_pixels(mode):
+    carrier = make_carrier(mode=mode)
+    decoded = Image.open(io.BytesIO(png_bytes(carrier)))
+    with pixel_buffer.mapped_image(decoded, mode) as (image, flat):
+        assert np.array_equal(np.asarray(image), np.asarray(carrier))
+        assert flat.shape[0] == 160 * 120
+
+
+def test_mapped_buffer_keeps_reservation_until_encoded(mapped, monkeypatch):
+    in_flight = []
+    encode_image = embed_service.encode_image
+
+    def recording_encode(*args, **kwargs):
+        in_flight.append(scratch.pixel_scratch.stats()["bytes_in_flight"])
+        return encode_image(*args, **kwargs)
+
+    monkeypatch.setattr(embed_service, 'encode_image', recording_encode)
+    carrier = png_bytes(make_carrier(mode='RGBA'))
+    embed_service.embed_file_in_image(carrier, PAYLOAD, bits_per_channel=2, strategy='sequential')
+    assert in_flight == [pixel_buffer.buffer_bytes((160, 120), 'RGBA')]
+    assert scratch.pixel_scratch.stats()["bytes_in_flight"] == 0
+
+
+def test_no_room_decodes_in_memory(monkeypatch):
+    monkeypatch.setattr(pixel_buffer, 'MMAP_MIN_PIXELS', 1)
+    monkeypatch.setattr(scratch.pixel_scratch, 'has_room', lambda size: False)
+    assert not pixel_buffer.use_mapped((160, 120), 'RGB')
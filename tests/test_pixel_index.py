@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from stegano.lsb import generators
+
+from app.services import pixel_index
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    pixel_index.clear_cache()
+    yield
+    pixel_index.clear_cache()
+
+
+def test_sieve_matches_stegano():
+    expected = [prime for _, prime in zip(range(2000), generators.eratosthenes())]
+    assert pixel_index.sieve_primes(expected[-1] + 1).tolist() == expected
+
+
+def test_indices_are_cached_and_read_only():
+    first = pixel_index.get_pixel_indices(100, 50)
+    assert pixel_index.get_pixel_indices(100, 50) is first
+    assert not first.flags.writeable
+    info = pixel_index.cache_info()
+    assert (info['hits'], info['misses'], info['size'], info['bytes']) == (1, 1, 1, first.nbytes)
+
+
+def test_cache_is_bounded_by_bytes(monkeypatch):
+    size = pixel_index.sieve_primes(100 * 100).nbytes
+    monkeypatch.setattr(pixel_index, 'INDEX_CACHE_BYTES', 2 * size)
+    first = pixel_index.get_pixel_indices(100, 100)
+    pixel_index.get_pixel_indices(50, 200)
+    pixel_index.get_pixel_indices(100, 100)
+    pixel_index.get_pixel_indices(200, 50)
+    assert pixel_index.cache_info()['bytes'] == 2 * size
+    # (50, 200) was least recently used
+    assert pixel_index.get_pixel_indices(100, 100) is first
+    pixel_index.get_pixel_indices(50, 200)
+    assert pixel_index.cache_info()['misses'] == 4
+
+
+def test_sequence_larger_than_cache_is_not_kept(monkeypatch):
+    pixel_index.get_pixel_indices(10, 10)
+    monkeypatch.setattr(pixel_index, 'INDEX_CACHE_BYTES', 1024)
+    indices = pixel_index.get_pixel_indices(1000, 1000)
+    assert len(indices) == 78498
+    assert pixel_index.cache_info()['size'] == 1
+
+
+def test_shuffled_indices_are_distinct_and_resumable():
+    order = pixel_index.shuffled_indices(10, 1010, 1000, seed=3)
+    assert sorted(order.tolist()) == list(range(10, 1010))
+    assert np.array_equal(pixel_index.shuffled_indices(10, 1010, 400, seed=3, first=600), order[600:])
+    with pytest.raises(ValueError, match="too small"):
+        pixel_index.shuffled_indices(0, 10, 11, seed=3)
@@ -0,0 +1,70 @@
+import pytest
+
+from app.routers import embed as embed_router
+from app.services import embed_service, lsb_engine, payload_format
+from app.services.executor import JobTimeoutError, PoolSaturatedError
+from conftest import make_carrier, png_bytes
+
+
+def probe(client, image: bytes):
+    return client.post('/api/embed/probe', files={'image': ('image.png', image, 'image/png')})
+
+
+def test_probe_container(carrier_png):
+    payload = b'{"key": "value"}\n' * 10
+    output = embed_service.embed_file_in_image(carrier_png, payload, 'data.json', 'application/json',
+                                               bits_per_channel=2, strategy='sequential', compression='none')
+    info = embed_service.probe_image(output)
+    assert info['embedded'] is True
+    assert (info['format'], info['version'], info['filename'], info['mime_type']) == (
+        'container', 2, 'data.json', 'application/json')
+    assert (info['width'], info['height'], info['mode'], info['channels']) == (160, 120, 'RGB', 3)
+    assert (info['bits_per_channel'], info['strategy']) == (2, 'sequential')
+    assert info['payload_size'] == info['stored_size'] == len(payload)
+    assert info['remaining_bytes'] == info['capacity_bytes'] - info['stored_size']
+
+
+def test_probe_compressed_sizes(carrier_png):
+    payload = b'{"key": "value"}\n' * 40
+    output = embed_service.embed_file_in_image(carrier_png, payload, 'data.json', compression='zlib')
+    info = embed_service.probe_image(output)
+    assert info['compression'] == 'zlib'
+    assert info['payload_size'] is None
+    assert info['stored_size'] < len(payload)
+
+
+def test_probe_v1_container():
+    body, name_length, mime_length = payload_format.pack_body(b'version one', 'old.txt', 'text/plain')
+    header = payload_format.HEADER_V1.pack(payload_format.MAGIC, 1, 0, len(b'version one'), name_length,
+                                           mime_length)
+    info = embed_service.probe_image(png_bytes(lsb_engine.hide_bytes(make_carrier(), header + body)))
+    assert (info['format'], info['version'], info['filename']) == ('container', 1, 'old.txt')
+
+
+def test_probe_without_payload(carrier_png):
+    info = embed_service.probe_image(carrier_png)
+    assert info['embedded'] is False
+    assert info['capacity_bytes'] > 0
+
+
+def test_probe_endpoint(client, carrier_png):
+    output = embed_service.embed_file_in_image(carrier_png, b'secret', 'secret.txt')
+    response = probe(client, output)
+    assert response.status_code == 200
+    assert response.json()['filename'] == 'secret.txt'
+    assert probe(client, b'not an image').status_code == 400
+
+
+@pytest.mark.parametrize('error, status, error_type', [
+    (PoolSaturatedError("All workers are busy, try again later"), 503, 'pool_saturated'),
+    (JobTimeoutError("Job did not finish within 120s"), 504, 'job_timeout'),
+    (RuntimeError("worker crashed"), 500, 'server_error'),
+])
+def test_probe_errors(client, carrier_png, monkeypatch, error, status, error_type):
+    async def failing_job(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(embed_router, 'run_job', failing_job)
+    response = probe(client, carrier_png)
+    assert response.status_code == status
+    assert response.json()['debug_info']['error_type'] == error_type
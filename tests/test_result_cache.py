@@ -0,0 +1,71 @@
+import os
+
+from app.services.result_cache import CachedResult, ResultCache, cache_key
+
+
+def test_cache_key_is_stable_and_sensitive():
+    key = cache_key('embed', b'carrier', b'payload', [('bits', 1)])
+    assert key == cache_key('embed', memoryview(b'carrier'), bytearray(b'payload'), [('bits', 1)])
+    assert key != cache_key('extract', b'carrier', b'payload', [('bits', 1)])
+    assert key != cache_key('embed', b'carrier', b'payload', [('bits', 2)])
+    assert len(key) == 64
+
+
+def test_cache_key_parts_do_not_run_together():
+    assert cache_key('embed', b'ab', b'c') != cache_key('embed', b'a', b'bc')
+    assert cache_key('embed', b'1') != cache_key('embed', '1')
+
+
+def test_memory_lru_eviction():
+    cache = ResultCache(memory_bytes=10)
+    cache.put('a', CachedResult(b'aaaa'))
+    cache.put('b', CachedResult(b'bbbb'))
+    assert cache.get('a').data == b'aaaa'  # now the most recently used
+    cache.put('c', CachedResult(b'cccc'))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    stats = cache.stats()
+    assert stats["memory"]["entries"] == 2 and stats["memory"]["bytes"] == 8
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_oversized_entry_is_not_kept_in_memory():
+    cache = ResultCache(memory_bytes=4)
+    cache.put('big', CachedResult(b'x' * 5))
+    assert cache.get('big') is None
+
+
+def test_disabled_cache():
+    cache = ResultCache(memory_bytes=0)
+    assert not cache.enabled
+    cache.put('a', CachedResult(b'a'))
+    assert cache.get('a') is None
+
+
+def test_spill_to_disk_and_reload(tmp_path):
+    cache = ResultCache(memory_bytes=6, disk_dir=str(tmp_path), disk_bytes=1024)
+    key_a, key_b = cache_key('x', b'a'), cache_key('x', b'b')
+    cache.put(key_a, CachedResult(b'aaaa', 'a.png', 'image/png'))
+    cache.put(key_b, CachedResult(b'bbbb'))
+    assert os.listdir(tmp_path) == [key_a]
+
+    reloaded = ResultCache(memory_bytes=6, disk_dir=str(tmp_path), disk_bytes=1024)
+    assert reloaded.get(key_a) == CachedResult(b'aaaa', 'a.png', 'image/png')
+
+
+def test_disk_eviction(tmp_path):
+    cache = ResultCache(memory_bytes=1, disk_dir=str(tmp_path), disk_bytes=120)
+    keys = [cache_key('x', bytes([index])) for index in range(4)]
+    for key in keys:
+        cache.put(key, CachedResult(b'z' * 40))
+    assert cache.stats()["disk"]["bytes"] <= 120
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[-1]) is not None
+
+
+def test_clear(tmp_path):
+    cache = ResultCache(memory_bytes=1, disk_dir=str(tmp_path), disk_bytes=1024)
+    cache.put(cache_key('x', b'a'), CachedResult(b'aaaa'))
+    cache.clear()
+    assert os.listdir(tmp_path) == []
+    assert cache.stats()["disk"]["entries"] == 0
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.services import scratch
+from app.services.scratch import ScratchQuotaError, ScratchSpace
+
+
+@pytest.fixture
+def space(tmp_path):
+    return ScratchSpace(str(tmp_path), quota_bytes=1000, min_free_bytes=0)
+
+
+def test_temporary_file_is_unlinked_and_counted(space):
+    with space.temporary_file(600) as f:
+        f.write(b'x' * 600)
+        assert os.listdir(space.directory) == []
+        assert space.stats()["bytes_in_flight"] == 600
+        assert space.stats()["files"] == 1
+    assert (space.stats()["bytes_in_flight"], space.stats()["files"]) == (0, 0)
+    assert os.path.basename(space.directory).startswith(f'empy-{os.getpid()}-')
+
+
+def test_quota(space):
+    with space.reserve(600):
+        assert not space.has_room(600)
+        with pytest.raises(ScratchQuotaError):
+            with space.temporary_file(600):
+                pass
+        with space.reserve(400):
+            pass
+    assert space.has_room(1000)
+
+
+def test_minimum_free_space(tmp_path):
+    space = ScratchSpace(str(tmp_path), quota_bytes=0, min_free_bytes=1 << 62)
+    assert not space.has_room(1)
+    assert ScratchSpace(str(tmp_path), quota_bytes=0, min_free_bytes=0).has_room(1 << 20)
+
+
+def test_reservation_released_on_error(space):
+    with pytest.raises(RuntimeError):
+        with space.reserve(500):
+            raise RuntimeError("request failed")
+    assert space.stats()["bytes_in_flight"] == 0
+
+
+def test_sweep_removes_directories_of_dead_processes(space, tmp_path):
+    own = space.directory
+    dead_pid = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    dead = tmp_path / f'empy-{dead_pid}-abc123'
+    (dead / 'leftover').mkdir(parents=True)
+    other = tmp_path / 'not-ours'
+    other.mkdir()
+
+    assert space.sweep() == 1
+    assert not dead.exists()
+    assert os.path.isdir(own) and other.exists()
+
+
+def test_sweep_of_missing_root(tmp_path):
+    assert ScratchSpace(str(tmp_path / 'missing')).sweep() == 0
+
+
+def test_janitor_runs_with_the_app(client):
+    assert scratch._janitor_task is not None and not scratch._janitor_task.done()
@@ -0,0 +1,108 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from app.services import embed_service, payload_format, shards
+from conftest import make_carrier, png_bytes
+
+PAYLOAD = os.urandom(1500) + b'text that compresses ' * 100
+
+
+@pytest.fixture(scope='module')
+def carriers():
+    return [png_bytes(make_carrier(seed=seed)) for seed in range(3)]
+
+
+@pytest.fixture(scope='module')
+def extracted(carriers):
+    images = shards.embed_shards(carriers, PAYLOAD, 'big.bin', bits_per_channel=2, compression='zlib')
+    return [shards.extract_shard(image) for image in images]
+
+
+def test_split_sizes():
+    assert shards.split_sizes(100, [10, 30, 60]) == [10, 30, 60]
+    assert shards.split_sizes(10, [1, 100]) == [1, 9]
+    assert sum(shards.split_sizes(1001, [7, 13, 999])) == 1001
+
+
+def test_assemble_in_any_order(extracted):
+    assert shards.assemble(extracted) == PAYLOAD
+    assert shards.assemble(reversed(extracted)) == PAYLOAD
+    assert [shard.info.index for shard in extracted] == [0, 1, 2]
+    assert all(shard.filename == 'big.bin' for shard in extracted)
+
+
+def test_reassembler_streams_in_order(extracted):
+    reassembler = shards.Reassembler(extracted[2])
+    assert reassembler.add(extracted[2]) == b''
+    assert reassembler.add(extracted[1]) == b''
+    output = reassembler.add(extracted[0])
+    reassembler.finish()
+    assert output == PAYLOAD
+
+
+def test_missing_shard(extracted):
+    reassembler = shards.Reassembler(extracted[0])
+    reassembler.add(extracted[0])
+    reassembler.add(extracted[2])
+    with pytest.raises(ValueError, match="Shard 2 of 3 is missing"):
+        reassembler.finish()
+
+
+def test_duplicate_shard(extracted):
+    reassembler = shards.Reassembler(extracted[0])
+    reassembler.add(extracted[0])
+    with pytest.raises(ValueError, match="given twice"):
+        reassembler.add(extracted[0])
+
+
+def test_foreign_shard(carriers, extracted):
+    other = shards.extract_shard(shards.embed_shards(carriers, b'other payload', compression='none')[1])
+    with pytest.raises(ValueError, match="different payload"):
+        shards.assemble([extracted[0], other, extracted[2]])
+
+
+def test_corrupt_shard(extracted):
+    info, chunk = extracted[1].info, extracted[1].chunk
+    record = payload_format.pack_shard(chunk, info.set_id, info.index, info.count, info.compression,
+                                       info.offset, info.stored_size, info.size)
+    with pytest.raises(ValueError, match="checksum"):
+        payload_format.unpack_shard(record[:-1] + bytes([record[-1] ^ 1]))
+
+
+def test_carriers_too_small():
+    small = [png_bytes(make_carrier(16, 16, seed=seed)) for seed in range(2)]
+    with pytest.raises(ValueError, match="too small"):
+        shards.split_payload(small, os.urandom(4096), compression='none')
+
+
+def test_shard_needs_shard_extraction(carriers):
+    image = shards.embed_shards(carriers, PAYLOAD)[0]
+    with pytest.raises(ValueError, match="one shard of a larger payload"):
+        embed_service.extract_file_from_image(image)
+    info = embed_service.probe_image(image)
+    assert (info['format'], info['payload_size'], info['shard_count']) == ('shard', len(PAYLOAD), 3)
+
+
+def test_shard_endpoints(client, carriers):
+    response = client.post('/api/embed/shards/embed', data={'bits_per_channel': '2'}, files=[
+        *[('carriers', (f'c{index}.png', carrier, 'image/png')) for index, carrier in enumerate(carriers)],
+        ('file_to_embed', ('big.bin', PAYLOAD, 'application/octet-stream')),
+    ])
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        names = sorted(name for name in archive.namelist() if name.startswith('shard_'))
+        images = [archive.read(name) for name in names]
+    assert names == ['shard_1_of_3_c0.png', 'shard_2_of_3_c1.png', 'shard_3_of_3_c2.png']
+
+    response = client.post('/api/embed/shards/extract', files=[
+        ('images', (f'{index}.png', image, 'image/png')) for index, image in enumerate(reversed(images))])
+    assert response.status_code == 200
+    assert response.content == PAYLOAD
+    assert response.headers['x-shards'] == '3'
+
+    response = client.post('/api/embed/shards/extract', files=[('images', ('0.png', images[0], 'image/png'))])
+    assert response.status_code == 400
+    assert 'split into 3 shards' in response.json()['detail']